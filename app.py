@@ -26,7 +26,7 @@ app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 
 # Initialize extensions
-from models import db
+from models import db, upgrade_schema, backfill_url_hashes, backfill_latest_summaries, backfill_api_key_hashes
 db.init_app(app)
 
 login_manager = LoginManager()
@@ -58,4 +58,22 @@ def inject_branding():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        # Columns and indexes added to existing tables since they were created
+        upgrade_schema()
+        backfill_url_hashes()
+        backfill_latest_summaries()
+        backfill_api_key_hashes()
+        # Full-text indexes for databases created before search was indexed
+        from services.search_index import search_index
+        search_index.install()
+        # Resume API jobs left queued by a previous run
+        from services.job_queue import job_queue
+        job_queue.start(app)
+        # Batch items only run on an in-memory pool, so pick up the ones a restart dropped
+        from services.batch_jobs import batch_job_runner
+        batch_job_runner.resume(app)
+    
+    # Start extraction worker processes before the first request (EXTRACTION_EXECUTOR=process)
+    from services.extraction_pool import extraction_pool
+    extraction_pool.warm()
     app.run(debug=True, host='0.0.0.0', port=80)
\ No newline at end of file
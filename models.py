@@ -1,3 +1,4 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
@@ -6,31 +7,81 @@ from cryptography.fernet import Fernet
 import os
 import base64
 import secrets
+import hashlib
+import hmac
+import logging
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
+# Public placeholder SECRET_KEY; nothing secret may be derived from it
+DEFAULT_SECRET_KEY = 'dev-key-change-this'
+
+_fernet = None
+
 # Encryption key for API keys
 def get_encryption_key():
     key = os.environ.get('ENCRYPTION_KEY')
-    if not key:
-        key = Fernet.generate_key()
-        print(f"Generated encryption key: {key.decode()}")
-        print("Add this to your .env file as ENCRYPTION_KEY")
+    if key:
+        return key.encode()
+    
+    secret = os.environ.get('SECRET_KEY') or DEFAULT_SECRET_KEY
+    if secret == DEFAULT_SECRET_KEY:
+        # Anyone can derive a key from the published default, so only a
+        # debug or test app may fall back to it
+        if not (has_app_context() and (current_app.debug or current_app.testing)):
+            raise RuntimeError("ENCRYPTION_KEY is not set and SECRET_KEY is the default; "
+                               f"add ENCRYPTION_KEY={Fernet.generate_key().decode()} to your .env file")
+        logger.warning("ENCRYPTION_KEY and SECRET_KEY are not set; stored API keys are encrypted with "
+                       "a key derived from the public default SECRET_KEY")
     else:
-        key = key.encode()
-    return key
+        logger.warning("ENCRYPTION_KEY is not set; deriving one from SECRET_KEY. Add "
+                       f"ENCRYPTION_KEY={Fernet.generate_key().decode()} to your .env file for a dedicated key")
+    
+    # Derive a stable key instead of a random one per call, which made
+    # stored keys undecryptable the moment they were written
+    return base64.urlsafe_b64encode(hashlib.sha256(secret.encode('utf-8')).digest())
+
+def _get_fernet():
+    # Built once per process: key lookup and Fernet setup are not free
+    global _fernet
+    if _fernet is None:
+        _fernet = Fernet(get_encryption_key())
+    return _fernet
 
 def encrypt_api_key(api_key):
     if not api_key:
         return None
-    f = Fernet(get_encryption_key())
-    return f.encrypt(api_key.encode()).decode()
+    return _get_fernet().encrypt(api_key.encode()).decode()
 
 def decrypt_api_key(encrypted_key):
     if not encrypted_key:
         return None
-    f = Fernet(get_encryption_key())
-    return f.decrypt(encrypted_key.encode()).decode()
+    return _get_fernet().decrypt(encrypted_key.encode()).decode()
+
+# Leading characters of a Nutgraf API key stored in clear to find its row
+API_KEY_PREFIX_LENGTH = 12
+
+def hash_api_key(api_key):
+    """Keyed hash of a Nutgraf API key; only this digest is stored"""
+    secret = os.environ.get('API_KEY_HASH_SECRET') or os.environ.get('SECRET_KEY') or DEFAULT_SECRET_KEY
+    if secret == DEFAULT_SECRET_KEY and not (has_app_context() and (current_app.debug or current_app.testing)):
+        # Digests keyed with the published default can be brute-forced offline
+        raise RuntimeError("API_KEY_HASH_SECRET is not set and SECRET_KEY is the default; "
+                           "set one of them in your .env file")
+    return hmac.new(secret.encode('utf-8'), api_key.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def current_usage_period(now=None):
+    """Key of the monthly API usage period, e.g. '2024-05'"""
+    return (now or datetime.utcnow()).strftime('%Y-%m')
+
+def hash_url(url):
+    """Fixed-length key for a URL, used to index and dedupe saved URLs"""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def _default_url_hash(context):
+    return hash_url(context.get_current_parameters()['url'])
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -45,10 +96,14 @@ class User(UserMixin, db.Model):
     openai_api_key = db.Column(db.Text)
     anthropic_api_key = db.Column(db.Text)
     
-    # Nutgraf API key for external access
+    # Nutgraf API key for external access, stored as a keyed hash found by its prefix
+    api_key_prefix = db.Column(db.String(16), index=True)
+    api_key_hash = db.Column(db.String(64), unique=True)
+    # Legacy plaintext key; moved to the hash columns by backfill_api_key_hashes()
     nutgraf_api_key = db.Column(db.String(64), unique=True, index=True)
     api_calls_made = db.Column(db.Integer, default=0)
     api_calls_limit = db.Column(db.Integer, default=1000)  # Default limit per month
+    api_usage_period = db.Column(db.String(7))  # Month api_calls_made counts, e.g. '2024-05'
     
     # User preferences
     default_length = db.Column(db.String(20), default='standard')
@@ -59,6 +114,7 @@ class User(UserMixin, db.Model):
     # Relationships
     summaries = db.relationship('Summary', backref='user', lazy=True, cascade='all, delete-orphan')
     saved_urls = db.relationship('SavedUrl', backref='user', lazy=True, cascade='all, delete-orphan')
+    batch_jobs = db.relationship('BatchJob', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -79,21 +135,36 @@ class User(UserMixin, db.Model):
         return decrypt_api_key(self.anthropic_api_key)
     
     def generate_api_key(self):
-        """Generate a new API key for external access"""
-        self.nutgraf_api_key = 'ng_' + secrets.token_urlsafe(32)
-        return self.nutgraf_api_key
+        """Generate a new API key for external access; the key itself is only returned, never stored"""
+        api_key = 'ng_' + secrets.token_urlsafe(32)
+        self.api_key_prefix = api_key[:API_KEY_PREFIX_LENGTH]
+        self.api_key_hash = hash_api_key(api_key)
+        self.nutgraf_api_key = None
+        return api_key
+    
+    def revoke_api_key(self):
+        """Remove the user's API key"""
+        self.api_key_prefix = None
+        self.api_key_hash = None
+        self.nutgraf_api_key = None
+    
+    def has_api_key(self):
+        return self.api_key_hash is not None
     
     def reset_api_usage(self):
-        """Reset API usage counter (typically called monthly)"""
+        """Reset API usage counter (usage also rolls over by itself each month)"""
         self.api_calls_made = 0
+        self.api_usage_period = current_usage_period()
     
-    def increment_api_usage(self):
-        """Increment API usage counter"""
-        self.api_calls_made += 1
+    def api_calls_this_period(self):
+        """API calls made this month; a count from an earlier month reads as zero"""
+        if self.api_usage_period != current_usage_period():
+            return 0
+        return self.api_calls_made or 0
     
     def can_make_api_call(self):
         """Check if user can make another API call"""
-        return self.api_calls_made < self.api_calls_limit
+        return self.api_calls_this_period() < self.api_calls_limit
 
 class Summary(db.Model):
     __tablename__ = 'summaries'
@@ -123,9 +194,127 @@ class Summary(db.Model):
     # Relationships
     tags = db.relationship('SummaryTag', backref='summary', lazy=True, cascade='all, delete-orphan')
     
+    # Serves keyset pagination of a user's history newest first
+    __table_args__ = (db.Index('ix_summaries_user_created_id', 'user_id', 'created_at', 'id'),)
+    
     def get_tag_names(self):
         return [st.tag.name for st in self.tags]
 
+class BatchJob(db.Model):
+    __tablename__ = 'batch_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    # Status tracking
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, running, completed, failed
+    total_items = db.Column(db.Integer, default=0)
+    completed_items = db.Column(db.Integer, default=0)
+    failed_items = db.Column(db.Integer, default=0)
+    
+    # Summary settings shared by every item in the job
+    length_setting = db.Column(db.String(20))
+    tone_setting = db.Column(db.String(20))
+    format_setting = db.Column(db.String(20))
+    model_used = db.Column(db.String(50))
+    custom_word_count = db.Column(db.Integer)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    # Relationships
+    items = db.relationship('BatchJobItem', backref='job', lazy=True, cascade='all, delete-orphan',
+                            order_by='BatchJobItem.position')
+    
+    @property
+    def is_finished(self):
+        return (self.completed_items or 0) + (self.failed_items or 0) >= (self.total_items or 0)
+
+class BatchJobItem(db.Model):
+    __tablename__ = 'batch_job_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('batch_jobs.id'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    
+    url = db.Column(db.Text, nullable=False)
+    title = db.Column(db.Text)
+    
+    # Status tracking
+    status = db.Column(db.String(20), default='pending')  # pending, extracting, summarizing, completed, failed
+    error = db.Column(db.Text)
+    is_paywalled = db.Column(db.Boolean, default=False)
+    summary_id = db.Column(db.Integer, db.ForeignKey('summaries.id', ondelete='SET NULL'))
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    summary = db.relationship('Summary', lazy=True)
+
+class ApiJob(db.Model):
+    __tablename__ = 'api_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Public identifier handed to API clients, so job ids can't be enumerated
+    public_id = db.Column(db.String(32), unique=True, nullable=False, index=True,
+                          default=lambda: secrets.token_hex(16))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    
+    # The /v1/summarize request body as JSON; provider keys sent with it are encrypted
+    request_data = db.Column(db.Text, nullable=False)
+    openai_api_key = db.Column(db.Text)
+    anthropic_api_key = db.Column(db.Text)
+    
+    # Queue state
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, completed, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # A running job whose lease has expired was abandoned by its worker and is picked up again
+    locked_until = db.Column(db.DateTime)
+    
+    # Outcome: the same body /v1/summarize would have returned, or an error
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    summary_id = db.Column(db.Integer, db.ForeignKey('summaries.id', ondelete='SET NULL'))
+    
+    # Completion webhook
+    callback_url = db.Column(db.Text)
+    callback_status = db.Column(db.String(20))  # pending, delivered, failed
+    callback_attempts = db.Column(db.Integer, default=0, nullable=False)
+    callback_after = db.Column(db.DateTime)
+    callback_error = db.Column(db.Text)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    # Workers claim due jobs in order of run_after
+    __table_args__ = (
+        db.Index('ix_api_jobs_status_run_after', 'status', 'run_after'),
+        db.Index('ix_api_jobs_callback_status_after', 'callback_status', 'callback_after'),
+    )
+
+class CachedSummary(db.Model):
+    __tablename__ = 'summary_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # sha256 of the content hash and every setting that shapes the prompt
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    model_used = db.Column(db.String(50))
+    summary_text = db.Column(db.Text, nullable=False)
+    word_count = db.Column(db.Integer)
+    hit_count = db.Column(db.Integer, default=0)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 class Tag(db.Model):
     __tablename__ = 'tags'
     
@@ -144,19 +333,162 @@ class SavedUrl(db.Model):
     
     # URL metadata
     url = db.Column(db.Text, nullable=False)
+    url_hash = db.Column(db.String(64), nullable=False, default=_default_url_hash)
     title = db.Column(db.Text)  # Will be populated when URL is fetched
     description = db.Column(db.Text)  # Optional user description
     
     # Status tracking
     is_analyzed = db.Column(db.Boolean, default=False, index=True)
+    # Most recent summary of this URL, kept current by the Summary insert/delete hooks below
+    latest_summary_id = db.Column(db.Integer, db.ForeignKey('summaries.id', ondelete='SET NULL'))
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Relationships
+    latest_summary = db.relationship('Summary', foreign_keys=[latest_summary_id])
+    
+    __table_args__ = (
+        # One row per URL per user; backs the bulk import's ON CONFLICT DO NOTHING
+        db.Index('ix_saved_urls_user_url_hash', 'user_id', 'url_hash', unique=True),
+        # Serves keyset pagination of a user's saved URLs newest first
+        db.Index('ix_saved_urls_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<SavedUrl {self.id}: {self.url[:50]}...>'
 
+def latest_summary_id_query(user_id, url):
+    """Scalar subquery for the id of a user's most recent summary of a URL"""
+    return db.select(Summary.id)\
+        .where(Summary.user_id == user_id, Summary.url == url)\
+        .order_by(Summary.created_at.desc(), Summary.id.desc())\
+        .limit(1)\
+        .scalar_subquery()
+
+@db.event.listens_for(SavedUrl, 'before_insert')
+def _link_saved_url_to_latest_summary(mapper, connection, saved_url):
+    # A URL saved after it was summarized starts out linked to that summary
+    if saved_url.latest_summary_id is None:
+        saved_url.latest_summary_id = connection.scalar(
+            db.select(latest_summary_id_query(saved_url.user_id, saved_url.url))
+        )
+
+@db.event.listens_for(Summary, 'after_insert')
+def _link_latest_summary(mapper, connection, summary):
+    connection.execute(
+        SavedUrl.__table__.update()
+        .where(SavedUrl.user_id == summary.user_id, SavedUrl.url_hash == hash_url(summary.url))
+        .values(latest_summary_id=summary.id)
+    )
+
+@db.event.listens_for(Summary, 'after_delete')
+def _relink_latest_summary(mapper, connection, summary):
+    # Fall back to the next most recent summary of the same URL, if any
+    connection.execute(
+        SavedUrl.__table__.update()
+        .where(SavedUrl.latest_summary_id == summary.id)
+        .values(latest_summary_id=latest_summary_id_query(summary.user_id, summary.url))
+    )
+
+def upgrade_schema():
+    """Add columns and indexes that db.create_all() leaves out of tables that already exist"""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                # Added nullable; the backfills below fill columns declared NOT NULL
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                if column.unique:
+                    connection.execute(db.text(
+                        f'CREATE UNIQUE INDEX IF NOT EXISTS uq_{table.name}_{column.name} ON {table.name} ({column.name})'
+                    ))
+            
+            indexed = {index['name'] for index in db.inspect(connection).get_indexes(table.name)}
+            for index in table.indexes:
+                # Built by backfill_url_hashes() once existing rows are hashed and deduped
+                if index.name == 'ix_saved_urls_user_url_hash':
+                    continue
+                if index.name not in indexed:
+                    index.create(connection)
+
+def backfill_latest_summaries():
+    """Link analyzed saved URLs created before latest_summary_id existed"""
+    db.session.execute(
+        SavedUrl.__table__.update()
+        .where(SavedUrl.is_analyzed == True, SavedUrl.latest_summary_id.is_(None))
+        .values(latest_summary_id=latest_summary_id_query(SavedUrl.user_id, SavedUrl.url))
+    )
+    db.session.commit()
+
+def backfill_url_hashes():
+    """
+    Hash saved URLs stored before url_hash existed, then add the unique index
+    
+    Rows that turn out to share a user and URL are merged into the oldest one,
+    which picks up whatever title, description, analysis state and latest
+    summary it was missing; the others are deleted so the index can be built.
+    """
+    table = SavedUrl.__table__
+    unhashed = db.session.execute(
+        db.select(table.c.id).where(table.c.url_hash.is_(None)).limit(1)
+    ).first()
+    if unhashed is not None:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.user_id, table.c.url, table.c.url_hash, table.c.title,
+                      table.c.description, table.c.is_analyzed, table.c.latest_summary_id)
+            .order_by(table.c.id)
+        ).all()
+        
+        keepers = {}
+        duplicates = []
+        for row in rows:
+            url_hash = row.url_hash or hash_url(row.url)
+            keeper = keepers.get((row.user_id, url_hash))
+            if keeper is None:
+                keepers[(row.user_id, url_hash)] = {
+                    'id': row.id, 'url_hash': url_hash, 'title': row.title, 'description': row.description,
+                    'is_analyzed': row.is_analyzed, 'latest_summary_id': row.latest_summary_id,
+                    'changed': row.url_hash is None
+                }
+                continue
+            duplicates.append(row.id)
+            for field in ('title', 'description', 'latest_summary_id'):
+                if keeper[field] is None and getattr(row, field) is not None:
+                    keeper[field] = getattr(row, field)
+                    keeper['changed'] = True
+            if row.is_analyzed and not keeper['is_analyzed']:
+                keeper['is_analyzed'] = True
+                keeper['changed'] = True
+        
+        for start in range(0, len(duplicates), 500):
+            db.session.execute(table.delete().where(table.c.id.in_(duplicates[start:start + 500])))
+        for keeper in keepers.values():
+            if keeper.pop('changed'):
+                db.session.execute(
+                    table.update().where(table.c.id == keeper.pop('id')).values(**keeper)
+                )
+        db.session.commit()
+    
+    for index in table.indexes:
+        if index.name == 'ix_saved_urls_user_url_hash':
+            index.create(db.engine, checkfirst=True)
+
+def backfill_api_key_hashes():
+    """Hash plaintext API keys issued before keys were stored hashed"""
+    for user in User.query.filter(User.nutgraf_api_key.isnot(None)):
+        user.api_key_prefix = user.nutgraf_api_key[:API_KEY_PREFIX_LENGTH]
+        user.api_key_hash = hash_api_key(user.nutgraf_api_key)
+        user.nutgraf_api_key = None
+    db.session.commit()
+
 class SummaryTag(db.Model):
     __tablename__ = 'summary_tags'
     
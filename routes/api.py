@@ -1,18 +1,36 @@
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_login import login_required, current_user
-from models import db, Summary, Tag, SummaryTag, SavedUrl
+from models import db, Summary, Tag, SummaryTag, SavedUrl, BatchJob, hash_url
 from services.article_extractor import ArticleExtractor
 from services.llm_service import LLMService
 from services.url_processor import URLProcessor
 from services.bookmark_parser import bookmark_parser
+from services.batch_jobs import batch_job_runner, serialize_batch_job
+from services.http_client import http_client
+from services.fetch_cache import fetch_cache
+from services.upload_stream import iter_text, iter_lines
+from services.saved_url_importer import SavedUrlImporter
+from services.search_index import search_index
+from services.pagination import keyset_paginate, InvalidCursor
+from services.sse import format_event, event_stream
 import json
 import csv
 import io
+import zlib
 from datetime import datetime
 from urllib.parse import quote
+import os
 
 api_bp = Blueprint('api', __name__)
 
+# Fan-out and time budget for validating URL lists in a single request
+URL_CHECK_CONCURRENCY = int(os.environ.get('URL_CHECK_CONCURRENCY', '50'))
+URL_CHECK_TIME_BUDGET = float(os.environ.get('URL_CHECK_TIME_BUDGET', '20'))
+
+# Any logged-in user can read /fetch-stats, so per-host pools (which show the
+# sites other users fetched) are only listed when an operator turns this on
+FETCH_STATS_PER_HOST = os.environ.get('FETCH_STATS_PER_HOST', 'false').lower() in ('1', 'true', 'yes')
+
 @api_bp.route('/process-urls', methods=['POST'])
 @login_required
 def process_urls():
@@ -24,16 +42,16 @@ def process_urls():
             return jsonify({'error': 'No URLs provided'}), 400
         
         url_processor = URLProcessor()
-        processed_urls = []
-        
-        for url in urls:
-            result = url_processor.process_url(url.strip())
-            if result:
-                processed_urls.append(result)
+        processed_urls = url_processor.batch_process_urls(
+            [url.strip() for url in urls],
+            max_workers=URL_CHECK_CONCURRENCY,
+            time_budget=URL_CHECK_TIME_BUDGET
+        )
         
         return jsonify({
             'urls': processed_urls,
-            'total': len(processed_urls)
+            'total': len(processed_urls),
+            'pending_count': sum(1 for url in processed_urls if url['status'] == 'pending')
         })
         
     except Exception as e:
@@ -102,71 +120,136 @@ def generate_summary():
         # Initialize LLM service
         llm_service = LLMService(current_user)
         
+        def save_summary(summary_result):
+            """Persist the finished summary and build the response payload"""
+            # Parse publication date
+            pub_date = None
+            if publication_date:
+                try:
+                    pub_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
+                except:
+                    pass
+            
+            # Save summary to database
+            summary = Summary(
+                user_id=current_user.id,
+                url=url,
+                title=title,
+                author=author,
+                publication_date=pub_date,
+                original_text=content[:10000],  # Limit stored original text
+                summary_text=summary_result['text'],
+                length_setting=length,
+                tone_setting=tone,
+                format_setting=format_type,
+                model_used=summary_result.get('model', model),
+                word_count=summary_result['word_count']
+            )
+            
+            db.session.add(summary)
+            db.session.commit()
+            
+            return {
+                'summary': {
+                    'id': summary.id,
+                    'text': summary_result['text'],
+                    'word_count': summary_result['word_count'],
+                    'metadata': {
+                        'title': title,
+                        'author': author,
+                        'publication_date': publication_date,
+                        'url': url,
+                        'analysis_date': summary.created_at.isoformat()
+                    },
+                    'settings': {
+                        'length': length,
+                        'tone': tone,
+                        'format': format_type,
+                        'model': model
+                    }
+                }
+            }
+        
+        settings = dict(content=content, length=length, tone=tone, format_type=format_type,
+                        model=model, custom_word_count=custom_word_count)
+        
+        # Streaming mode: relay text as it is generated, save once it is complete
+        if data.get('stream'):
+            def events():
+                try:
+                    parts = []
+                    for delta in llm_service.stream_summary(**settings):
+                        parts.append(delta)
+                        yield format_event('delta', {'text': delta})
+                    text = ''.join(parts).strip()
+                    yield format_event('done', save_summary({'text': text, 'word_count': len(text.split()),
+                                                             'model': llm_service.stream_model}))
+                except Exception as e:
+                    db.session.rollback()
+                    yield format_event('error', {'error': str(e)})
+            
+            return event_stream(events())
+        
         # Generate summary
-        summary_result = llm_service.generate_summary(
-            content=content,
-            length=length,
-            tone=tone,
-            format_type=format_type,
-            model=model,
-            custom_word_count=custom_word_count
-        )
+        summary_result = llm_service.generate_summary(**settings)
         
         if not summary_result:
             return jsonify({'error': 'Failed to generate summary'}), 500
         
-        # Parse publication date
-        pub_date = None
-        if publication_date:
-            try:
-                pub_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
-            except:
-                pass
+        return jsonify(save_summary(summary_result))
         
-        # Save summary to database
-        summary = Summary(
-            user_id=current_user.id,
-            url=url,
-            title=title,
-            author=author,
-            publication_date=pub_date,
-            original_text=content[:10000],  # Limit stored original text
-            summary_text=summary_result['text'],
-            length_setting=length,
-            tone_setting=tone,
-            format_setting=format_type,
-            model_used=model,
-            word_count=summary_result['word_count']
-        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/batch-summaries', methods=['POST'])
+@login_required
+def create_batch_summaries():
+    """Start a server-side job that extracts and summarizes a list of URLs"""
+    try:
+        data = request.get_json() or {}
+        urls = []
+        for entry in data.get('urls', []):
+            if isinstance(entry, str):
+                entry = {'url': entry}
+            url = (entry.get('url') or '').strip()
+            if url:
+                urls.append({'url': url, 'title': entry.get('title')})
         
-        db.session.add(summary)
-        db.session.commit()
+        if not urls:
+            return jsonify({'error': 'No URLs provided'}), 400
         
-        return jsonify({
-            'summary': {
-                'id': summary.id,
-                'text': summary_result['text'],
-                'word_count': summary_result['word_count'],
-                'metadata': {
-                    'title': title,
-                    'author': author,
-                    'publication_date': publication_date,
-                    'url': url,
-                    'analysis_date': summary.created_at.isoformat()
-                },
-                'settings': {
-                    'length': length,
-                    'tone': tone,
-                    'format': format_type,
-                    'model': model
-                }
-            }
-        })
+        job = batch_job_runner.create_job(
+            current_user,
+            urls,
+            length=data.get('length', current_user.default_length),
+            tone=data.get('tone', current_user.default_tone),
+            format_type=data.get('format', current_user.default_format),
+            model=data.get('model', current_user.default_model),
+            custom_word_count=data.get('custom_word_count')
+        )
+        batch_job_runner.submit(current_app._get_current_object(), job.id)
         
+        return jsonify({'job': serialize_batch_job(job, include_items=False)}), 202
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/batch-summaries/<int:job_id>', methods=['GET'])
+@login_required
+def get_batch_summaries(job_id):
+    """Report progress and finished results of a batch summarization job"""
+    try:
+        job = BatchJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+        if not job:
+            return jsonify({'error': 'Batch job not found'}), 404
+        
+        return jsonify({'job': serialize_batch_job(job)})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/add-tags', methods=['POST'])
 @login_required
 def add_tags():
@@ -326,6 +409,15 @@ def debug_extract():
     except Exception as e:
         return jsonify({'error': str(e), 'debug': True}), 500
 
+@api_bp.route('/fetch-stats', methods=['GET'])
+@login_required
+def fetch_stats():
+    """Connection pool and fetch cache statistics for monitoring"""
+    return jsonify({
+        'http_client': http_client.get_stats(per_host=FETCH_STATS_PER_HOST),
+        'fetch_cache': fetch_cache.get_stats()
+    })
+
 @api_bp.route('/save-url', methods=['POST'])
 @login_required
 def save_url():
@@ -341,7 +433,7 @@ def save_url():
         # Check if URL already exists for this user
         existing_url = SavedUrl.query.filter_by(
             user_id=current_user.id,
-            url=url
+            url_hash=hash_url(url)
         ).first()
         
         if existing_url:
@@ -388,24 +480,31 @@ def save_url():
 def get_saved_urls():
     """Get all saved URLs for the current user"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        cursor = request.args.get('cursor')
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 1000)
+        include_total = request.args.get('include_total', '').lower() in ('1', 'true')
         search = request.args.get('search', '').strip()
         
         query = SavedUrl.query.filter_by(user_id=current_user.id)
         
+        # Best matches first when searching, newest first otherwise
+        ranking = []
         if search:
-            query = query.filter(
-                db.or_(
-                    SavedUrl.url.contains(search),
-                    SavedUrl.title.contains(search),
-                    SavedUrl.description.contains(search)
-                )
+            query, ranking = search_index.search(query, SavedUrl, search)
+        
+        # Latest summaries come from one extra IN query, not one query per row
+        try:
+            saved_urls = keyset_paginate(
+                query.options(db.selectinload(SavedUrl.latest_summary)),
+                [*ranking, SavedUrl.created_at.desc(), SavedUrl.id.desc()],
+                cursor=cursor, per_page=per_page
             )
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
         
-        saved_urls = query.order_by(SavedUrl.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        snippets = {}
+        if search:
+            snippets = search_index.snippets(SavedUrl, [url.id for url in saved_urls.items], search)
         
         # Get summary data for analyzed URLs
         saved_urls_data = []
@@ -419,13 +518,12 @@ def get_saved_urls():
                 'created_at': url.created_at.isoformat(),
                 'updated_at': url.updated_at.isoformat()
             }
+            if url.id in snippets:
+                url_data['snippet'] = str(snippets[url.id])
             
-            # If analyzed, get the most recent summary
+            # If analyzed, include the most recent summary
             if url.is_analyzed:
-                summary = Summary.query.filter_by(
-                    user_id=current_user.id,
-                    url=url.url
-                ).order_by(Summary.created_at.desc()).first()
+                summary = url.latest_summary
                 
                 if summary:
                     url_data['summary'] = {
@@ -445,12 +543,7 @@ def get_saved_urls():
         
         return jsonify({
             'saved_urls': saved_urls_data,
-            'pagination': {
-                'page': saved_urls.page,
-                'pages': saved_urls.pages,
-                'per_page': saved_urls.per_page,
-                'total': saved_urls.total
-            }
+            'pagination': saved_urls.to_dict(include_total=include_total)
         })
         
     except Exception as e:
@@ -543,7 +636,7 @@ def analyze_saved_url():
             length_setting=length,
             tone_setting=tone,
             format_setting=format_type,
-            model_used=model,
+            model_used=summary_result.get('model', model),
             word_count=summary_result['word_count']
         )
         
@@ -594,91 +687,142 @@ def export_saved_urls():
         elif not include_unanalyzed:
             query = query.filter(SavedUrl.is_analyzed == True)
         
-        saved_urls = query.order_by(SavedUrl.created_at.desc()).all()
+        query = query.order_by(SavedUrl.created_at.desc())
         
-        if not saved_urls:
+        if not db.session.query(query.exists()).scalar():
             return jsonify({'error': 'No saved URLs to export'}), 400
         
         if export_format == 'csv':
-            return export_as_csv(saved_urls)
+            return export_as_csv(query)
         elif export_format == 'bookmarks':
-            return export_as_bookmarks(saved_urls)
+            return export_as_bookmarks(query)
         else:
             return jsonify({'error': 'Invalid format. Use "csv" or "bookmarks"'}), 400
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def export_as_csv(saved_urls):
-    """Export saved URLs as CSV format for Nutgraf import"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+# Rows fetched per round trip while streaming an export, and the size of
+# each chunk handed to the client
+EXPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def _iter_export_rows(query, with_summaries=False):
+    """Walk an export query through a server-side cursor, batch by batch"""
+    if with_summaries:
+        # Each batch's summaries are fetched with one IN query
+        query = query.options(db.selectinload(SavedUrl.latest_summary))
+    return query.yield_per(EXPORT_BATCH_SIZE)
+
+def _stream_export(chunks, content_type, filename):
+    """
+    Build a streaming download response from text chunks
     
-    # Write header
-    writer.writerow([
-        'url',
-        'title', 
-        'description',
-        'is_analyzed',
-        'created_at',
-        'updated_at',
-        'summary_id',
-        'summary_text',
-        'summary_word_count',
-        'summary_settings'
-    ])
+    The body is gzip-compressed on the fly when the client accepts it.
+    """
+    def generate():
+        buffer = []
+        size = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield ''.join(buffer).encode('utf-8')
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
     
-    # Write data
-    for saved_url in saved_urls:
-        summary_data = ''
-        summary_id = ''
-        summary_word_count = ''
-        summary_settings = ''
-        
-        # Get summary data if analyzed
-        if saved_url.is_analyzed:
-            summary = Summary.query.filter_by(
-                user_id=current_user.id,
-                url=saved_url.url
-            ).order_by(Summary.created_at.desc()).first()
-            
-            if summary:
-                summary_id = summary.id
-                summary_data = summary.summary_text
-                summary_word_count = summary.word_count or ''
-                summary_settings = json.dumps({
-                    'length': summary.length_setting,
-                    'tone': summary.tone_setting,
-                    'format': summary.format_setting,
-                    'model': summary.model_used
-                })
+    body = generate()
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+    if use_gzip:
+        body = _gzip_stream(body)
+    
+    response = Response(stream_with_context(body), content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_as_csv(query):
+    """Export saved URLs as CSV format for Nutgraf import"""
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
         
+        # Write header
         writer.writerow([
-            saved_url.url,
-            saved_url.title or '',
-            saved_url.description or '',
-            saved_url.is_analyzed,
-            saved_url.created_at.isoformat(),
-            saved_url.updated_at.isoformat(),
-            summary_id,
-            summary_data,
-            summary_word_count,
-            summary_settings
+            'url',
+            'title', 
+            'description',
+            'is_analyzed',
+            'created_at',
+            'updated_at',
+            'summary_id',
+            'summary_text',
+            'summary_word_count',
+            'summary_settings'
         ])
+        
+        # Write data
+        for saved_url in _iter_export_rows(query, with_summaries=True):
+            summary_data = ''
+            summary_id = ''
+            summary_word_count = ''
+            summary_settings = ''
+            
+            # Get summary data if analyzed
+            if saved_url.is_analyzed:
+                summary = saved_url.latest_summary
+                
+                if summary:
+                    summary_id = summary.id
+                    summary_data = summary.summary_text
+                    summary_word_count = summary.word_count or ''
+                    summary_settings = json.dumps({
+                        'length': summary.length_setting,
+                        'tone': summary.tone_setting,
+                        'format': summary.format_setting,
+                        'model': summary.model_used
+                    })
+            
+            writer.writerow([
+                saved_url.url,
+                saved_url.title or '',
+                saved_url.description or '',
+                saved_url.is_analyzed,
+                saved_url.created_at.isoformat(),
+                saved_url.updated_at.isoformat(),
+                summary_id,
+                summary_data,
+                summary_word_count,
+                summary_settings
+            ])
+            
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+        
+        yield output.getvalue()
     
-    # Create response
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=nutgraf_saved_urls_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    
-    return response
+    return _stream_export(
+        generate(),
+        'text/csv',
+        f'nutgraf_saved_urls_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    )
 
-def export_as_bookmarks(saved_urls):
+def export_as_bookmarks(query):
     """Export saved URLs as HTML bookmarks file for browser import"""
-    
-    # Generate bookmark HTML
-    html_content = '''<!DOCTYPE NETSCAPE-Bookmark-file-1>
+    def generate():
+        yield '''<!DOCTYPE NETSCAPE-Bookmark-file-1>
 <!-- This is an automatically generated file.
      It will be read and overwritten.
      DO NOT EDIT! -->
@@ -689,38 +833,37 @@ def export_as_bookmarks(saved_urls):
     <DT><H3 FOLDED ADD_DATE="{timestamp}">Nutgraf Saved URLs</H3>
     <DL><p>
 '''.format(timestamp=int(datetime.now().timestamp()))
-    
-    for saved_url in saved_urls:
-        # Create bookmark entry
-        title = saved_url.title or 'Untitled'
-        url = saved_url.url
-        add_date = int(saved_url.created_at.timestamp())
         
-        # Escape HTML characters in title
-        title = title.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
-        
-        # Add description as part of title if available
-        if saved_url.description:
-            description = saved_url.description.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            title += f' - {description}'
-        
-        # Add analysis status indicator
-        status = " [Analyzed]" if saved_url.is_analyzed else " [Unanalyzed]"
-        title += status
+        for saved_url in _iter_export_rows(query):
+            # Create bookmark entry
+            title = saved_url.title or 'Untitled'
+            url = saved_url.url
+            add_date = int(saved_url.created_at.timestamp())
+            
+            # Escape HTML characters in title
+            title = title.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+            
+            # Add description as part of title if available
+            if saved_url.description:
+                description = saved_url.description.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                title += f' - {description}'
+            
+            # Add analysis status indicator
+            status = " [Analyzed]" if saved_url.is_analyzed else " [Unanalyzed]"
+            title += status
+            
+            yield f'        <DT><A HREF="{url}" ADD_DATE="{add_date}">{title}</A>\n'
         
-        html_content += f'        <DT><A HREF="{url}" ADD_DATE="{add_date}">{title}</A>\n'
-    
-    # Close HTML structure
-    html_content += '''    </DL><p>
+        # Close HTML structure
+        yield '''    </DL><p>
 </DL><p>
 '''
     
-    # Create response
-    response = make_response(html_content)
-    response.headers['Content-Type'] = 'text/html'
-    response.headers['Content-Disposition'] = f'attachment; filename=nutgraf_bookmarks_{datetime.now().strftime("%Y%m%d_%H%M%S")}.html'
-    
-    return response
+    return _stream_export(
+        generate(),
+        'text/html',
+        f'nutgraf_bookmarks_{datetime.now().strftime("%Y%m%d_%H%M%S")}.html'
+    )
 
 @api_bp.route('/import-saved-urls', methods=['POST'])
 @login_required
@@ -737,54 +880,42 @@ def import_saved_urls():
         if not file.filename.lower().endswith('.csv'):
             return jsonify({'error': 'File must be a CSV file'}), 400
         
-        # Read and parse CSV
-        content = file.read().decode('utf-8')
-        csv_reader = csv.DictReader(io.StringIO(content))
+        # Parse the CSV as it streams in rather than reading it whole
+        csv_reader = csv.DictReader(iter_lines(iter_text(file.stream)))
         
-        imported_count = 0
-        skipped_count = 0
+        importer = SavedUrlImporter(current_user.id)
         errors = []
         
         for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 because row 1 is header
             try:
-                url = row.get('url', '').strip()
+                url = (row.get('url') or '').strip()
                 if not url:
                     continue
                 
-                # Check if URL already exists
-                existing_url = SavedUrl.query.filter_by(
-                    user_id=current_user.id,
-                    url=url
-                ).first()
-                
-                if existing_url:
-                    skipped_count += 1
-                    continue
-                
-                # Create new saved URL
-                saved_url = SavedUrl(
-                    user_id=current_user.id,
-                    url=url,
-                    title=row.get('title', '').strip() or None,
-                    description=row.get('description', '').strip() or None,
-                    is_analyzed=row.get('is_analyzed', '').lower() == 'true'
-                )
-                
                 # Parse dates if provided
+                created_at = None
                 try:
                     if row.get('created_at'):
-                        saved_url.created_at = datetime.fromisoformat(row['created_at'].replace('Z', '+00:00'))
+                        created_at = datetime.fromisoformat(row['created_at'].replace('Z', '+00:00'))
                 except:
                     pass  # Use default created_at
                 
-                db.session.add(saved_url)
-                imported_count += 1
+                # Duplicates (existing or earlier in the file) are skipped in memory
+                importer.add(
+                    url,
+                    title=(row.get('title') or '').strip() or None,
+                    description=(row.get('description') or '').strip() or None,
+                    is_analyzed=(row.get('is_analyzed') or '').lower() == 'true',
+                    created_at=created_at
+                )
                 
             except Exception as e:
                 errors.append(f"Row {row_num}: {str(e)}")
                 continue
         
-        db.session.commit()
+        counts = importer.finish()
+        imported_count = counts['imported']
+        skipped_count = counts['skipped']
         
         result = {
             'imported': imported_count,
@@ -820,27 +951,16 @@ def upload_bookmarks():
         if not any(file.filename.lower().endswith(ext) for ext in allowed_extensions):
             return jsonify({'error': 'File must be an HTML bookmark file (.html or .htm)'}), 400
         
-        # Read file content
-        try:
-            content = file.read().decode('utf-8')
-        except UnicodeDecodeError:
-            try:
-                # Try different encodings
-                file.seek(0)
-                content = file.read().decode('latin-1')
-            except UnicodeDecodeError:
-                return jsonify({'error': 'Unable to read file. Please ensure it\'s a valid text file.'}), 400
-        
-        # Validate bookmark file
-        validation = bookmark_parser.validate_bookmark_file(content)
+        # Validate bookmark file (judged by its header, then rewound)
+        validation = bookmark_parser.validate_bookmark_file(file.stream)
         if not validation['is_valid']:
             return jsonify({
                 'error': f'Invalid bookmark file: {validation["message"]}',
                 'suggestion': 'Please export bookmarks from your browser in HTML format'
             }), 400
         
-        # Parse bookmarks
-        result = bookmark_parser.parse_bookmark_file(content)
+        # Parse bookmarks straight from the upload stream
+        result = bookmark_parser.parse_bookmark_file(file.stream)
         
         if result['total_count'] == 0:
             return jsonify({
@@ -851,20 +971,20 @@ def upload_bookmarks():
         # Extract just the URLs for processing
         urls = [bookmark['url'] for bookmark in result['bookmarks']]
         
-        # Process URLs using existing URL processor
+        # Check all URLs concurrently (frontend will handle pagination); whatever
+        # isn't checked within the time budget comes back as pending
         url_processor = URLProcessor()
-        processed_urls = []
-        
-        # Process all URLs, don't limit here (frontend will handle pagination)
-        for url in urls:
-            url_result = url_processor.process_url(url.strip())
-            if url_result:
-                processed_urls.append(url_result)
+        processed_urls = url_processor.batch_process_urls(
+            [url.strip() for url in urls],
+            max_workers=URL_CHECK_CONCURRENCY,
+            time_budget=URL_CHECK_TIME_BUDGET
+        )
         
         return jsonify({
             'urls': processed_urls,
             'total_bookmarks': result['total_count'],
             'processed_count': len(processed_urls),
+            'pending_count': sum(1 for url in processed_urls if url['status'] == 'pending'),
             'folders_found': result.get('folders', []),
             'parsing_info': {
                 'file_type': result.get('file_type'),
@@ -893,88 +1013,56 @@ def import_bookmarks_as_saved():
         if not any(file.filename.lower().endswith(ext) for ext in allowed_extensions):
             return jsonify({'error': 'File must be an HTML bookmark file (.html or .htm)'}), 400
         
-        # Read and parse file
-        try:
-            content = file.read().decode('utf-8')
-        except UnicodeDecodeError:
-            try:
-                file.seek(0)
-                content = file.read().decode('latin-1')
-            except UnicodeDecodeError:
-                return jsonify({'error': 'Unable to read file encoding'}), 400
-        
-        # Validate bookmark file
-        validation = bookmark_parser.validate_bookmark_file(content)
+        # Validate bookmark file (judged by its header, then rewound)
+        validation = bookmark_parser.validate_bookmark_file(file.stream)
         if not validation['is_valid']:
             return jsonify({
                 'error': f'Invalid bookmark file: {validation["message"]}'
             }), 400
         
-        # Parse bookmarks
-        result = bookmark_parser.parse_bookmark_file(content)
-        
-        if result['total_count'] == 0:
-            return jsonify({'error': 'No valid URLs found in bookmark file'}), 400
-        
-        # Import bookmarks as saved URLs
-        imported_count = 0
-        skipped_count = 0
+        # Import bookmarks as saved URLs while the upload is being parsed
+        importer = SavedUrlImporter(current_user.id)
+        total_bookmarks = 0
         errors = []
         
-        for bookmark in result['bookmarks']:
+        stream = bookmark_parser.open_stream()
+        for bookmark in stream.parse(iter_text(file.stream)):
+            total_bookmarks += 1
             try:
-                url = bookmark['url']
-                title = bookmark.get('title', 'Untitled')
                 folder = bookmark.get('folder')
                 
-                # Check if URL already exists
-                existing_url = SavedUrl.query.filter_by(
-                    user_id=current_user.id,
-                    url=url
-                ).first()
-                
-                if existing_url:
-                    skipped_count += 1
-                    continue
-                
                 # Create description from folder if available
                 description = f"From bookmark folder: {folder}" if folder else "Imported from bookmarks"
                 
-                # Create new saved URL
-                saved_url = SavedUrl(
-                    user_id=current_user.id,
-                    url=url,
-                    title=title,
+                # Written in batches; creation date comes from the bookmark if available
+                importer.add(
+                    bookmark['url'],
+                    title=bookmark.get('title', 'Untitled'),
                     description=description,
-                    is_analyzed=False
+                    is_analyzed=False,
+                    created_at=bookmark.get('add_date')
                 )
                 
-                # Set creation date from bookmark if available
-                if bookmark.get('add_date'):
-                    saved_url.created_at = bookmark['add_date']
-                
-                db.session.add(saved_url)
-                imported_count += 1
-                
-                # Commit in batches to avoid memory issues
-                if imported_count % 50 == 0:
-                    db.session.commit()
-                
             except Exception as e:
                 errors.append(f"Error importing {bookmark.get('url', 'unknown')}: {str(e)}")
                 if len(errors) >= 10:  # Limit error reporting
                     break
                 continue
         
-        # Final commit
-        db.session.commit()
+        # Final batch
+        counts = importer.finish()
+        imported_count = counts['imported']
+        skipped_count = counts['skipped']
+        
+        if total_bookmarks == 0:
+            return jsonify({'error': 'No valid URLs found in bookmark file'}), 400
         
         return jsonify({
             'success': True,
             'imported': imported_count,
             'skipped': skipped_count,
-            'total_bookmarks': result['total_count'],
-            'folders_found': result.get('folders', []),
+            'total_bookmarks': total_bookmarks,
+            'folders_found': stream.folders,
             'errors': errors,
             'message': f'Successfully imported {imported_count} bookmarks, skipped {skipped_count} duplicates'
         })
@@ -1,13 +1,25 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from functools import wraps
-from models import db, User, Summary
+from werkzeug.local import LocalProxy
+from models import db, User, Summary, ApiJob, current_usage_period
 from services.article_extractor import ArticleExtractor
 from services.llm_service import LLMService
+from services.pagination import keyset_paginate, InvalidCursor
+from services.api_key_auth import api_key_auth
+from services.usage_meter import usage_meter
+from services.sse import format_event, event_stream
+from services.job_queue import job_queue, serialize_api_job, is_valid_callback_url
 from datetime import datetime
+import concurrent.futures
 import json
+import os
 
 external_api_bp = Blueprint('external_api', __name__, url_prefix='/v1')
 
+# Size limit and summary fan-out for /summarize/batch
+SUMMARIZE_BATCH_MAX_ITEMS = int(os.environ.get('SUMMARIZE_BATCH_MAX_ITEMS', '20'))
+SUMMARIZE_BATCH_CONCURRENCY = int(os.environ.get('SUMMARIZE_BATCH_CONCURRENCY', '4'))
+
 def require_api_key(f):
     """Decorator to require API key authentication"""
     @wraps(f)
@@ -29,38 +41,72 @@ def require_api_key(f):
                 'message': 'Please provide your API key in the Authorization header as "Bearer YOUR_KEY" or in the X-API-Key header'
             }), 401
         
-        # Find user by API key
-        user = User.query.filter_by(nutgraf_api_key=api_key).first()
-        if not user:
+        # Resolve the key from the auth cache; the database is only hit on a miss
+        identity = api_key_auth.authenticate(api_key)
+        if not identity:
             return jsonify({
                 'error': 'Invalid API key',
                 'message': 'The provided API key is not valid'
             }), 401
         
         # Check if user is active
-        if not user.is_active:
+        if not identity['is_active']:
             return jsonify({
                 'error': 'Account disabled',
                 'message': 'Your account has been disabled'
             }), 403
         
-        # Check rate limits
-        if not user.can_make_api_call():
+        # Check rate limits against the cached counter; a new month starts from zero
+        calls_made = identity['calls_made'] if identity['usage_period'] == current_usage_period() else 0
+        if calls_made >= identity['calls_limit']:
             return jsonify({
                 'error': 'Rate limit exceeded',
-                'message': f'You have exceeded your monthly limit of {user.api_calls_limit} API calls',
+                'message': f'You have exceeded your monthly limit of {identity["calls_limit"]} API calls',
                 'usage': {
-                    'calls_made': user.api_calls_made,
-                    'calls_limit': user.api_calls_limit
+                    'calls_made': calls_made,
+                    'calls_limit': identity['calls_limit']
                 }
             }), 429
         
-        # Add user to request context
-        request.current_user = user
+        # The full user row is only loaded if the endpoint touches it
+        user_id = identity['user_id']
+        request.api_identity = identity
+        request.current_user = LocalProxy(lambda: db.session.get(User, user_id))
         return f(*args, **kwargs)
     
     return decorated_function
 
+def parse_publication_date(publication_date):
+    """Publication date from an extraction result as a datetime, or None"""
+    if isinstance(publication_date, datetime):
+        return publication_date
+    if isinstance(publication_date, str):
+        try:
+            return datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    return None
+
+def validate_provided_keys(data):
+    """Error response for malformed provider keys in a request body, or None"""
+    provided_openai_key = data.get('openai_api_key')
+    provided_anthropic_key = data.get('anthropic_api_key')
+    
+    # Basic validation for provided API keys
+    if provided_openai_key and not provided_openai_key.startswith('sk-'):
+        return jsonify({
+            'error': 'Invalid OpenAI API key format',
+            'message': 'OpenAI API keys should start with "sk-"'
+        }), 400
+    
+    if provided_anthropic_key and not provided_anthropic_key.startswith('sk-ant-'):
+        return jsonify({
+            'error': 'Invalid Anthropic API key format', 
+            'message': 'Anthropic API keys should start with "sk-ant-"'
+        }), 400
+    
+    return None
+
 @external_api_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -87,7 +133,8 @@ def summarize():
         "format": "prose",                    // Optional: prose, bullets
         "model": "gpt-3.5-turbo",            // Optional: model to use
         "custom_word_count": 300,            // Optional: if length is "custom"
-        "save_summary": true                  // Optional: whether to save to user's history
+        "save_summary": true,                 // Optional: whether to save to user's history
+        "stream": true                        // Optional: stream the summary as Server-Sent Events
     }
     """
     try:
@@ -146,18 +193,9 @@ def summarize():
         provided_openai_key = data.get('openai_api_key')
         provided_anthropic_key = data.get('anthropic_api_key')
         
-        # Basic validation for provided API keys
-        if provided_openai_key and not provided_openai_key.startswith('sk-'):
-            return jsonify({
-                'error': 'Invalid OpenAI API key format',
-                'message': 'OpenAI API keys should start with "sk-"'
-            }), 400
-            
-        if provided_anthropic_key and not provided_anthropic_key.startswith('sk-ant-'):
-            return jsonify({
-                'error': 'Invalid Anthropic API key format', 
-                'message': 'Anthropic API keys should start with "sk-ant-"'
-            }), 400
+        invalid_keys = validate_provided_keys(data)
+        if invalid_keys:
+            return invalid_keys
         
         # Initialize LLM service with provided keys (if any)
         llm_service = LLMService(user, provided_openai_key, provided_anthropic_key)
@@ -176,84 +214,412 @@ def summarize():
                     'message': 'This model requires an Anthropic API key. Please provide one in your account settings or in the "anthropic_api_key" field of this request.'
                 }), 400
         
+        # Reserve the call with one atomic UPDATE before any provider tokens are spent;
+        # it is given back if the summary can't be produced
+        calls_made = usage_meter.charge(user.id, limit=user.api_calls_limit)
+        if calls_made is None:
+            usage = usage_meter.get_usage(user.id)
+            return jsonify({
+                'error': 'Rate limit exceeded',
+                'message': f'You have exceeded your monthly limit of {usage["calls_limit"]} API calls',
+                'usage': {
+                    'calls_made': usage['calls_made'],
+                    'calls_limit': usage['calls_limit']
+                }
+            }), 429
+        
+        def finish(summary_result):
+            """Save the summary if requested and build the response body"""
+            # Save summary if requested
+            summary_id = None
+            if save_summary:
+                summary = Summary(
+                    user_id=user.id,
+                    url=url or 'API Request',
+                    title=title,
+                    author=author,
+                    publication_date=parse_publication_date(publication_date),
+                    original_text=text[:10000],  # Limit stored original text
+                    summary_text=summary_result['text'],
+                    length_setting=length,
+                    tone_setting=tone,
+                    format_setting=format_type,
+                    model_used=summary_result.get('model', model),
+                    word_count=summary_result['word_count']
+                )
+                
+                db.session.add(summary)
+                db.session.flush()
+                summary_id = summary.id
+            
+            db.session.commit()
+            
+            return {
+                'summary': {
+                    'text': summary_result['text'],
+                    'word_count': summary_result['word_count'],
+                    'id': summary_id
+                },
+                'metadata': {
+                    'title': title,
+                    'author': author,
+                    'url': url,
+                    'length': length,
+                    'tone': tone,
+                    'format': format_type,
+                    'model': summary_result.get('model', model),
+                    'timestamp': datetime.utcnow().isoformat()
+                },
+                'usage': {
+                    'calls_made': calls_made,
+                    'calls_remaining': max(user.api_calls_limit - calls_made, 0)
+                }
+            }
+        
+        settings = dict(content=text, length=length, tone=tone, format_type=format_type,
+                        model=model, custom_word_count=custom_word_count)
+        
+        # Streaming mode: relay text as SSE and finish up once the summary is complete
+        if data.get('stream'):
+            def events():
+                done = False
+                try:
+                    parts = []
+                    for delta in llm_service.stream_summary(**settings):
+                        parts.append(delta)
+                        yield format_event('delta', {'text': delta})
+                    summary_text = ''.join(parts).strip()
+                    body = finish({'text': summary_text, 'word_count': len(summary_text.split()),
+                                   'model': llm_service.stream_model})
+                    done = True
+                    yield format_event('done', body)
+                except Exception as e:
+                    db.session.rollback()
+                    yield format_event('error', {'error': 'Summarization failed', 'message': str(e)})
+                finally:
+                    # Also runs when the client disconnects mid-stream (GeneratorExit)
+                    if not done:
+                        usage_meter.refund(user.id, 1)
+            
+            return event_stream(events())
+        
         # Generate summary
-        summary_result = llm_service.generate_summary(
-            content=text,
-            length=length,
-            tone=tone,
-            format_type=format_type,
-            model=model,
-            custom_word_count=custom_word_count
-        )
+        try:
+            summary_result = llm_service.generate_summary(**settings)
+            
+            if not summary_result:
+                usage_meter.refund(user.id, 1)
+                return jsonify({
+                    'error': 'Summarization failed',
+                    'message': 'Failed to generate summary'
+                }), 500
+            
+            return jsonify(finish(summary_result)), 200
+        except Exception:
+            usage_meter.refund(user.id, 1)
+            raise
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@external_api_bp.route('/summarize/batch', methods=['POST'])
+@require_api_key
+def summarize_batch():
+    """
+    Summarize several URLs or texts with shared settings in one call
+    
+    Expected JSON payload:
+    {
+        "items": [                             // Up to SUMMARIZE_BATCH_MAX_ITEMS
+            {"url": "https://example.com/a"},
+            {"text": "Article content...", "title": "Article Title"}
+        ],
+        "length": "standard",                 // Optional settings shared by every item,
+        "tone": "neutral",                    // as for /summarize
+        "format": "prose",
+        "model": "gpt-3.5-turbo",
+        "custom_word_count": 300,
+        "save_summary": true
+    }
+    
+    Quota for every valid item is reserved up front in one atomic charge;
+    items that fail are refunded.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'error': 'Invalid request',
+                'message': 'Request body must be valid JSON'
+            }), 400
         
-        if not summary_result:
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
             return jsonify({
-                'error': 'Summarization failed',
-                'message': 'Failed to generate summary'
-            }), 500
-        
-        # Increment API usage
-        user.increment_api_usage()
-        
-        # Save summary if requested
-        summary_id = None
-        if save_summary:
-            # Parse publication date
-            pub_date = None
-            if publication_date:
-                try:
-                    if isinstance(publication_date, str):
-                        pub_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
-                    elif isinstance(publication_date, datetime):
-                        pub_date = publication_date
-                except:
-                    pass
+                'error': 'Missing items',
+                'message': '"items" must be a non-empty list of {"url"} or {"text"} objects'
+            }), 400
+        
+        if len(items) > SUMMARIZE_BATCH_MAX_ITEMS:
+            return jsonify({
+                'error': 'Too many items',
+                'message': f'A batch can contain at most {SUMMARIZE_BATCH_MAX_ITEMS} items'
+            }), 400
+        
+        invalid_keys = validate_provided_keys(data)
+        if invalid_keys:
+            return invalid_keys
+        
+        # Get summarization parameters
+        user = request.current_user
+        length = data.get('length', user.default_length)
+        tone = data.get('tone', user.default_tone)
+        format_type = data.get('format', user.default_format)
+        model = data.get('model', user.default_model)
+        custom_word_count = data.get('custom_word_count')
+        save_summary = data.get('save_summary', False)
+        
+        # One LLMService (and provider client lookup) for the whole batch
+        llm_service = LLMService(user, data.get('openai_api_key'), data.get('anthropic_api_key'))
+        
+        if model.startswith('gpt') and not llm_service.openai_client:
+            return jsonify({
+                'error': 'OpenAI API key required',
+                'message': 'This model requires an OpenAI API key. Please provide one in your account settings or in the "openai_api_key" field of this request.'
+            }), 400
+        elif model.startswith('claude') and not llm_service.anthropic_client:
+            return jsonify({
+                'error': 'Anthropic API key required',
+                'message': 'This model requires an Anthropic API key. Please provide one in your account settings or in the "anthropic_api_key" field of this request.'
+            }), 400
+        
+        results = [None] * len(items)
+        articles = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not (item.get('url') or item.get('text')):
+                results[index] = {
+                    'index': index,
+                    'status': 'failed',
+                    'error': 'Missing content',
+                    'message': 'Each item needs a "url" or "text"'
+                }
+            else:
+                articles[index] = {
+                    'url': item.get('url'),
+                    'content': item.get('text'),
+                    'title': item.get('title', ''),
+                    'author': item.get('author', ''),
+                    'publication_date': None
+                }
+        
+        # Reserve quota for the whole batch at once, so it either fits or nothing runs
+        calls_limit = user.api_calls_limit
+        charged = len(articles)
+        if charged and usage_meter.charge(user.id, calls=charged, limit=calls_limit) is None:
+            usage = usage_meter.get_usage(user.id)
+            return jsonify({
+                'error': 'Rate limit exceeded',
+                'message': f'This batch needs {charged} API calls but only {usage["calls_remaining"]} remain this month',
+                'usage': {
+                    'calls_made': usage['calls_made'],
+                    'calls_limit': usage['calls_limit']
+                }
+            }), 429
+        
+        def fail(index, error, message):
+            articles.pop(index)
+            results[index] = {'index': index, 'status': 'failed', 'error': error, 'message': message}
+        
+        summaries = {}
+        # Items whose summary is delivered keep their reserved call
+        used = 0
+        try:
+            # Download every URL concurrently
+            to_extract = [index for index, article in articles.items() if not article['content']]
+            if to_extract:
+                extractor = ArticleExtractor()
+                extracted = extractor.extract_many([articles[index]['url'] for index in to_extract])
+                for index, extraction_result in zip(to_extract, extracted):
+                    if not extraction_result or extraction_result.get('error') or not extraction_result.get('content'):
+                        fail(index, 'Extraction failed',
+                             (extraction_result or {}).get('error') or 'Failed to extract content from the provided URL')
+                        continue
+                    
+                    article = articles[index]
+                    article['content'] = extraction_result['content']
+                    article['title'] = article['title'] or extraction_result.get('title', '')
+                    article['author'] = extraction_result.get('author', '')
+                    article['publication_date'] = extraction_result.get('publication_date')
+            
+            # Summarize with bounded parallelism; each worker needs its own app context
+            app = current_app._get_current_object()
+            
+            def summarize_article(article):
+                with app.app_context():
+                    return llm_service.generate_summary(
+                        content=article['content'],
+                        length=length,
+                        tone=tone,
+                        format_type=format_type,
+                        model=model,
+                        custom_word_count=custom_word_count
+                    )
+            
+            if articles:
+                max_workers = max(1, min(len(articles), SUMMARIZE_BATCH_CONCURRENCY))
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {index: executor.submit(summarize_article, article)
+                               for index, article in articles.items()}
+                    for index, future in futures.items():
+                        try:
+                            summaries[index] = future.result()
+                        except Exception as e:
+                            fail(index, 'Summarization failed', str(e))
             
-            summary = Summary(
-                user_id=user.id,
-                url=url or 'API Request',
-                title=title,
-                author=author,
-                publication_date=pub_date,
-                original_text=text[:10000],  # Limit stored original text
-                summary_text=summary_result['text'],
-                length_setting=length,
-                tone_setting=tone,
-                format_setting=format_type,
-                model_used=model,
-                word_count=summary_result['word_count']
-            )
+            saved = {}
+            if save_summary:
+                for index, summary_result in summaries.items():
+                    article = articles[index]
+                    saved[index] = Summary(
+                        user_id=user.id,
+                        url=article['url'] or 'API Request',
+                        title=article['title'],
+                        author=article['author'],
+                        publication_date=parse_publication_date(article['publication_date']),
+                        original_text=article['content'][:10000],  # Limit stored original text
+                        summary_text=summary_result['text'],
+                        length_setting=length,
+                        tone_setting=tone,
+                        format_setting=format_type,
+                        model_used=summary_result.get('model', model),
+                        word_count=summary_result['word_count']
+                    )
+                    db.session.add(saved[index])
+                db.session.commit()
             
-            db.session.add(summary)
-            summary_id = summary.id
+            used = len(summaries)
+        finally:
+            # Give back the quota reserved for every other item, even if something above raised
+            calls_made = usage_meter.refund(user.id, charged - used)
+        if calls_made is None:
+            calls_made = usage_meter.get_usage(user.id)['calls_made']
         
-        db.session.commit()
+        for index, summary_result in summaries.items():
+            article = articles[index]
+            results[index] = {
+                'index': index,
+                'status': 'completed',
+                'summary': {
+                    'text': summary_result['text'],
+                    'word_count': summary_result['word_count'],
+                    'id': saved[index].id if index in saved else None
+                },
+                'metadata': {
+                    'title': article['title'],
+                    'author': article['author'],
+                    'url': article['url'],
+                    'model': summary_result.get('model', model)
+                }
+            }
         
-        # Prepare response
-        response_data = {
-            'summary': {
-                'text': summary_result['text'],
-                'word_count': summary_result['word_count'],
-                'id': summary_id
-            },
-            'metadata': {
-                'title': title,
-                'author': author,
-                'url': url,
+        return jsonify({
+            'results': results,
+            'settings': {
                 'length': length,
                 'tone': tone,
                 'format': format_type,
-                'model': model,
-                'timestamp': datetime.utcnow().isoformat()
+                'model': model
             },
             'usage': {
-                'calls_made': user.api_calls_made,
-                'calls_remaining': user.api_calls_limit - user.api_calls_made
+                'calls_made': calls_made,
+                'calls_remaining': max(calls_limit - calls_made, 0)
             }
-        }
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@external_api_bp.route('/jobs', methods=['POST'])
+@require_api_key
+def create_job():
+    """
+    Queue a summarization job and return its id right away
+    
+    Accepts the same JSON payload as /summarize (except "stream"), plus:
+    {
+        "callback_url": "https://example.com/hook"  // Optional: POSTed the finished job
+    }
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'error': 'Invalid request',
+                'message': 'Request body must be valid JSON'
+            }), 400
+        
+        if not data.get('url') and not data.get('text'):
+            return jsonify({
+                'error': 'Missing content',
+                'message': 'Either "url" or "text" must be provided'
+            }), 400
+        
+        invalid_keys = validate_provided_keys(data)
+        if invalid_keys:
+            return invalid_keys
+        
+        callback_url = data.get('callback_url')
+        if callback_url and not is_valid_callback_url(callback_url):
+            return jsonify({
+                'error': 'Invalid callback URL',
+                'message': 'callback_url must be an absolute http or https URL on a public host'
+            }), 400
         
-        return jsonify(response_data), 200
+        # Fail fast on a model the job could never run, rather than after it is queued
+        user = request.current_user
+        model = data.get('model', user.default_model)
+        if model.startswith('gpt') and not data.get('openai_api_key') and not user.openai_api_key:
+            return jsonify({
+                'error': 'OpenAI API key required',
+                'message': 'This model requires an OpenAI API key. Please provide one in your account settings or in the "openai_api_key" field of this request.'
+            }), 400
+        elif model.startswith('claude') and not data.get('anthropic_api_key') and not user.anthropic_api_key:
+            return jsonify({
+                'error': 'Anthropic API key required',
+                'message': 'This model requires an Anthropic API key. Please provide one in your account settings or in the "anthropic_api_key" field of this request.'
+            }), 400
         
+        # Reserve the job's call now, so queued jobs can't outrun the monthly limit
+        if usage_meter.charge(user.id, limit=user.api_calls_limit) is None:
+            usage = usage_meter.get_usage(user.id)
+            return jsonify({
+                'error': 'Rate limit exceeded',
+                'message': f'You have exceeded your monthly limit of {usage["calls_limit"]} API calls',
+                'usage': {
+                    'calls_made': usage['calls_made'],
+                    'calls_limit': usage['calls_limit']
+                }
+            }), 429
+        
+        try:
+            job = job_queue.enqueue(user, data, callback_url=callback_url)
+        except Exception:
+            usage_meter.refund(user.id, 1)
+            raise
+        job_queue.start(current_app._get_current_object())
+        
+        response = jsonify({'job': serialize_api_job(job)})
+        response.headers['Location'] = f'{request.path.rstrip("/")}/{job.public_id}'
+        return response, 202
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -261,18 +627,35 @@ def summarize():
             'message': str(e)
         }), 500
 
+@external_api_bp.route('/jobs/<job_id>', methods=['GET'])
+@require_api_key
+def get_job(job_id):
+    """Report a job's status, and its result once it has finished"""
+    job = ApiJob.query.filter_by(public_id=job_id, user_id=request.api_identity['user_id']).first()
+    if not job:
+        return jsonify({
+            'error': 'Job not found',
+            'message': 'No job with this id exists for your account'
+        }), 404
+    
+    # Makes sure this process has workers to pick up jobs queued before a restart
+    job_queue.start(current_app._get_current_object())
+    return jsonify({'job': serialize_api_job(job)})
+
 @external_api_bp.route('/usage', methods=['GET'])
 @require_api_key
 def get_usage():
     """Get current API usage statistics"""
     user = request.current_user
+    usage = usage_meter.get_usage(user.id)
     
     return jsonify({
         'usage': {
-            'calls_made': user.api_calls_made,
-            'calls_limit': user.api_calls_limit,
-            'calls_remaining': user.api_calls_limit - user.api_calls_made,
-            'percentage_used': (user.api_calls_made / user.api_calls_limit * 100) if user.api_calls_limit > 0 else 0
+            'calls_made': usage['calls_made'],
+            'calls_limit': usage['calls_limit'],
+            'calls_remaining': usage['calls_remaining'],
+            'percentage_used': (usage['calls_made'] / usage['calls_limit'] * 100) if usage['calls_limit'] > 0 else 0,
+            'period': usage['period']
         },
         'account': {
             'email': user.email,
@@ -280,6 +663,44 @@ def get_usage():
         }
     })
 
+@external_api_bp.route('/summaries', methods=['GET'])
+@require_api_key
+def list_summaries():
+    """List saved summaries newest first, one cursor page at a time"""
+    user_id = request.api_identity['user_id']
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true')
+    
+    try:
+        page = keyset_paginate(
+            Summary.query.filter_by(user_id=user_id),
+            [Summary.created_at.desc(), Summary.id.desc()],
+            cursor=request.args.get('cursor'),
+            per_page=limit
+        )
+    except InvalidCursor as e:
+        return jsonify({
+            'error': 'Invalid cursor',
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'summaries': [{
+            'id': summary.id,
+            'url': summary.url,
+            'title': summary.title,
+            'author': summary.author,
+            'text': summary.summary_text,
+            'word_count': summary.word_count,
+            'length': summary.length_setting,
+            'tone': summary.tone_setting,
+            'format': summary.format_setting,
+            'model': summary.model_used,
+            'created_at': summary.created_at.isoformat()
+        } for summary in page.items],
+        'pagination': page.to_dict(include_total=include_total)
+    })
+
 @external_api_bp.route('/models', methods=['GET'])
 @require_api_key
 def get_available_models():
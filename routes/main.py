@@ -1,9 +1,13 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, make_response
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField, SelectField, IntegerField, FileField
 from wtforms.validators import DataRequired, Optional, NumberRange
 from models import db, User, Summary, Tag, SummaryTag
+from services.search_index import search_index
+from services.pagination import keyset_paginate, InvalidCursor
+from services.api_key_auth import api_key_auth
+from services.provider_clients import provider_clients
 from datetime import datetime, timedelta
 import json
 
@@ -22,7 +26,7 @@ class SettingsForm(FlaskForm):
                                 choices=[('prose', 'Prose'), ('bullets', 'Bullet Points')],
                                 default='prose')
     default_model = SelectField('Default Model',
-                               choices=[('gpt-3.5-turbo', 'GPT-3.5 Turbo'), ('gpt-4', 'GPT-4'), ('gpt-4o', 'GPT-4o'), ('claude-3-sonnet', 'Claude 3.5 Sonnet'), ('claude-3-haiku', 'Claude 3 Haiku')],
+                               choices=[('gpt-3.5-turbo', 'GPT-3.5 Turbo'), ('gpt-4', 'GPT-4'), ('gpt-4o', 'GPT-4o'), ('claude-3-sonnet', 'Claude 3.5 Sonnet'), ('claude-3-haiku', 'Claude 3 Haiku'), ('auto-fast', 'Auto (fast)'), ('auto-balanced', 'Auto (balanced)')],
                                default='gpt-3.5-turbo')
 
 @main_bp.route('/')
@@ -58,7 +62,7 @@ def analyze():
 @main_bp.route('/history')
 @login_required
 def history():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     tag_filter = request.args.get('tag')
     search_query = request.args.get('search')
     date_from = request.args.get('date_from')
@@ -67,12 +71,10 @@ def history():
     # Build query
     query = Summary.query.filter_by(user_id=current_user.id)
     
+    # Best matches first when searching, newest first otherwise
+    ranking = []
     if search_query:
-        query = query.filter(
-            (Summary.title.contains(search_query)) |
-            (Summary.summary_text.contains(search_query)) |
-            (Summary.url.contains(search_query))
-        )
+        query, ranking = search_index.search(query, Summary, search_query)
     
     if tag_filter:
         query = query.join(SummaryTag).join(Tag).filter(Tag.name == tag_filter)
@@ -91,8 +93,17 @@ def history():
         except ValueError:
             pass
     
-    summaries = query.order_by(Summary.created_at.desc())\
-                    .paginate(page=page, per_page=10, error_out=False)
+    order_by = [*ranking, Summary.created_at.desc(), Summary.id.desc()]
+    try:
+        summaries = keyset_paginate(query, order_by, cursor=cursor, per_page=10)
+    except InvalidCursor:
+        # Stale or mangled link: start again from the first page
+        summaries = keyset_paginate(query, order_by, per_page=10)
+    
+    # Highlighted excerpts for just the rows on this page
+    snippets = {}
+    if search_query:
+        snippets = search_index.snippets(Summary, [summary.id for summary in summaries.items], search_query)
     
     # Get all tags for filter dropdown
     all_tags = Tag.query.join(SummaryTag)\
@@ -102,6 +113,7 @@ def history():
     
     return render_template('main/history.html', 
                          summaries=summaries,
+                         snippets=snippets,
                          all_tags=all_tags,
                          current_filters={
                              'tag': tag_filter,
@@ -122,12 +134,7 @@ def settings():
     form = SettingsForm()
     
     if request.method == 'GET':
-        # Populate form with current settings
-        form.default_length.data = current_user.default_length
-        form.default_tone.data = current_user.default_tone
-        form.default_format.data = current_user.default_format
-        form.default_model.data = current_user.default_model
-        # Don't populate API keys for security
+        _populate_settings_form(form)
     
     if form.validate_on_submit():
         # Update user preferences
@@ -145,6 +152,8 @@ def settings():
         
         try:
             db.session.commit()
+            # Clients built with the old keys must not be reused
+            provider_clients.invalidate_user(current_user.id)
             flash('Settings updated successfully!', 'success')
             return redirect(url_for('main.settings'))
         except Exception as e:
@@ -153,27 +162,44 @@ def settings():
     
     return render_template('main/settings.html', form=form)
 
+def _populate_settings_form(form):
+    # Populate form with current settings
+    form.default_length.data = current_user.default_length
+    form.default_tone.data = current_user.default_tone
+    form.default_format.data = current_user.default_format
+    form.default_model.data = current_user.default_model
+    # Don't populate API keys for security
+
 @main_bp.route('/generate-api-key', methods=['POST'])
 @login_required
 def generate_api_key():
     """Generate a new Nutgraf API key for the current user"""
     try:
-        current_user.generate_api_key()
+        api_key = current_user.generate_api_key()
         db.session.commit()
-        flash('New API key generated successfully!', 'success')
+        api_key_auth.invalidate_user(current_user.id)
     except Exception as e:
         db.session.rollback()
         flash('Failed to generate API key. Please try again.', 'error')
+        return redirect(url_for('main.settings'))
     
-    return redirect(url_for('main.settings'))
+    # Only the hash is stored, so this page is the one chance to show the key. It is
+    # rendered straight into the response rather than parked in the (unencrypted) session cookie
+    flash('New API key generated successfully!', 'success')
+    form = SettingsForm(formdata=None)
+    _populate_settings_form(form)
+    response = make_response(render_template('main/settings.html', form=form, new_api_key=api_key))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @main_bp.route('/revoke-api-key', methods=['POST'])
 @login_required
 def revoke_api_key():
     """Revoke the current user's API key"""
     try:
-        current_user.nutgraf_api_key = None
+        current_user.revoke_api_key()
         db.session.commit()
+        api_key_auth.invalidate_user(current_user.id)
         flash('API key revoked successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,113 @@
+"""
+API Key Auth Service
+
+Authentication for the external API. Keys are found by their clear-text
+prefix and checked against the stored keyed hash in constant time. The
+outcome - user id, active flag and a quota snapshot - is kept in a short-TTL
+in-process cache, so repeat calls with the same key never touch the
+database.
+"""
+
+import os
+import hmac
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from models import db, User, API_KEY_PREFIX_LENGTH, hash_api_key
+
+class APIKeyAuth:
+    """Resolves API keys to users through a TTL cache"""
+    
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl_seconds if ttl_seconds is not None else float(os.environ.get('API_KEY_CACHE_TTL', '60'))
+        self.max_entries = max_entries or int(os.environ.get('API_KEY_CACHE_SIZE', '10000'))
+        
+        # key hash -> identity dict, oldest first
+        self._entries = OrderedDict()
+        # user id -> key hash, so a user's entry can be dropped without the key
+        self._by_user: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    
+    def authenticate(self, api_key: str) -> Optional[Dict]:
+        """
+        Resolve an API key
+        
+        Returns:
+            {'user_id', 'is_active', 'calls_made', 'calls_limit', 'usage_period'}
+            for a valid key, or None if no user holds it
+        """
+        key_hash = hash_api_key(api_key)
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is not None and entry['expires'] > now:
+                self._stats['hits'] += 1
+                return entry
+            self._stats['misses'] += 1
+        
+        identity = self._load(api_key, key_hash)
+        if identity is None:
+            # Unknown keys are not cached, so a new key works immediately
+            return None
+        
+        identity['expires'] = now + self.ttl
+        with self._lock:
+            self._entries[key_hash] = identity
+            self._entries.move_to_end(key_hash)
+            self._by_user[identity['user_id']] = key_hash
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._by_user.pop(evicted['user_id'], None)
+        return identity
+    
+    def update_usage(self, user_id: int, calls_made: int, usage_period: str) -> None:
+        """Refresh the cached quota snapshot after a call has been counted"""
+        with self._lock:
+            key_hash = self._by_user.get(user_id)
+            if key_hash in self._entries:
+                self._entries[key_hash]['calls_made'] = calls_made
+                self._entries[key_hash]['usage_period'] = usage_period
+    
+    def invalidate_user(self, user_id: int) -> None:
+        """Forget a user's cached key, e.g. after it was regenerated or revoked"""
+        with self._lock:
+            key_hash = self._by_user.pop(user_id, None)
+            if key_hash is not None:
+                self._entries.pop(key_hash, None)
+                self._stats['invalidations'] += 1
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+    
+    def _load(self, api_key: str, key_hash: str) -> Optional[Dict]:
+        # Only the columns the checks need, not the whole user row
+        candidates = db.session.query(
+            User.id, User.api_key_hash, User.is_active, User.api_calls_made, User.api_calls_limit,
+            User.api_usage_period
+        ).filter(User.api_key_prefix == api_key[:API_KEY_PREFIX_LENGTH]).all()
+        
+        for user_id, stored_hash, is_active, calls_made, calls_limit, usage_period in candidates:
+            if stored_hash and hmac.compare_digest(stored_hash, key_hash):
+                return {
+                    'user_id': user_id,
+                    'is_active': bool(is_active),
+                    'calls_made': calls_made or 0,
+                    'calls_limit': calls_limit or 0,
+                    'usage_period': usage_period
+                }
+        return None
+
+# Create a global instance
+api_key_auth = APIKeyAuth()
@@ -1,65 +1,165 @@
 import requests
-from bs4 import BeautifulSoup
+import lxml.html
 from readability import Document
+from readability.htmls import build_doc
+from readability.cleaners import html_cleaner
 from urllib.parse import urlparse, urljoin
 import re
 from datetime import datetime
+from .extraction_pool import extraction_pool
+from .fetch_cache import fetch_cache
+from .http_client import http_client
+from .async_fetcher import async_fetcher
+
+# Block-level tags that start a new text block, mapped to the block type they
+# produce. Container tags (None) only separate their children.
+BLOCK_TYPES = {
+    'p': 'paragraph',
+    'h1': 'heading', 'h2': 'heading', 'h3': 'heading',
+    'h4': 'heading', 'h5': 'heading', 'h6': 'heading',
+    'li': 'list_item',
+    'blockquote': 'quote',
+    'pre': 'preformatted',
+    'figcaption': 'caption',
+    'dt': 'paragraph', 'dd': 'paragraph',
+    'td': 'paragraph', 'th': 'paragraph',
+    'div': None, 'section': None, 'article': None, 'main': None, 'body': None,
+    'ul': None, 'ol': None, 'dl': None, 'figure': None,
+    'table': None, 'tbody': None, 'thead': None, 'tr': None,
+}
+
+SKIPPED_TAGS = {'script', 'style', 'nav', 'header', 'footer', 'aside', 'advertisement', 'noscript'}
+
+def _has_class(name):
+    return f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]"
+
+# Metadata lookups, tried in order against the parsed page
+AUTHOR_XPATHS = [
+    '//meta[@name="author"]',
+    '//meta[@property="article:author"]',
+    '//meta[@name="article:author"]',
+    _has_class('author'),
+    _has_class('byline'),
+    '//*[@rel="author"]'
+]
+
+DATE_XPATHS = [
+    '//meta[@property="article:published_time"]',
+    '//meta[@name="article:published_time"]',
+    '//meta[@name="date"]',
+    '//meta[@name="pubdate"]',
+    '//time[@datetime]',
+    _has_class('date'),
+    _has_class('published')
+]
+
+# More specific paywall indicators to reduce false positives
+PAYWALL_INDICATORS = [
+    'subscription required',
+    'premium content',
+    'sign up to continue reading',
+    'this article is for subscribers only',
+    'become a member to continue',
+    'login to continue reading',
+    'paywall-message',
+    'subscribe to read this article',
+    'this content is exclusive to subscribers',
+    'upgrade to premium'
+]
+
+STRONG_PAYWALL_INDICATORS = {
+    'subscription required',
+    'this article is for subscribers only',
+    'paywall-message'
+}
+
+_PAYWALL_PATTERN = re.compile('|'.join(re.escape(indicator) for indicator in PAYWALL_INDICATORS), re.IGNORECASE)
+
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+def estimate_tokens(text):
+    """
+    Estimate the number of LLM tokens in text
+    
+    BPE tokenizers emit about one token per short word or punctuation mark
+    and split longer words into pieces of roughly four characters.
+    """
+    if not text:
+        return 0
+    return sum(1 if len(piece) <= 6 else (len(piece) + 3) // 4 for piece in _TOKEN_PATTERN.findall(text))
+
+class ParsedDocument(Document):
+    """
+    readability Document that works from an already-parsed lxml tree
+    
+    readability normally re-parses the raw HTML every time it needs the DOM;
+    this reuses the page's tree instead. html_cleaner works on a copy, so the
+    shared tree is never mutated.
+    """
+    
+    def __init__(self, tree, **kwargs):
+        super().__init__('', **kwargs)
+        self.tree = tree
+    
+    def _parse(self, input):
+        doc = html_cleaner.clean_html(self.tree)
+        doc.resolve_base_href(handle_failures=self.handle_failures)
+        return doc
 
 class ArticleExtractor:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        # Process-wide pooled client, so connections are reused across instances
+        self.session = http_client
     
     def extract(self, url):
         try:
-            # Fetch the page
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            # Check for common paywall indicators (but continue processing anyway)
-            is_potentially_paywalled = self._is_paywalled(response.text)
-            
-            # Use readability to extract main content
-            doc = Document(response.text)
-            clean_html = doc.summary()
-            
-            # Parse with BeautifulSoup for further processing
-            soup = BeautifulSoup(clean_html, 'html.parser')
-            
-            # Extract text content
-            content = self._extract_text_content(soup)
-            
-            # Extract metadata
-            metadata = self._extract_metadata(response.text, url)
-            
-            # Calculate word count
-            word_count = len(content.split()) if content else 0
-            
-            # If content is too short and paywall was detected, it might be paywalled
-            if word_count < 100 and is_potentially_paywalled:
-                return {
-                    'url': url,
-                    'title': metadata.get('title', doc.title()),
-                    'author': metadata.get('author'),
-                    'publication_date': metadata.get('publication_date'),
-                    'content': None,
-                    'word_count': 0,
-                    'is_paywalled': True,
-                    'error': f'Article appears to be behind a paywall (extracted only {word_count} words). You can manually paste the content instead.'
-                }
-            
+            # Fetch the page (served from disk or revalidated when cached)
+            response = fetch_cache.fetch(self.session, url, timeout=30)
+        except requests.exceptions.RequestException as e:
             return {
                 'url': url,
-                'title': metadata.get('title', doc.title()),
-                'author': metadata.get('author'),
-                'publication_date': metadata.get('publication_date'),
-                'content': content,
-                'word_count': word_count,
-                'is_paywalled': is_potentially_paywalled,
-                'paywall_warning': 'This article might be behind a paywall' if is_potentially_paywalled and word_count >= 100 else None
+                'error': f'Failed to fetch article: {str(e)}',
+                'is_paywalled': False
+            }
+        except Exception as e:
+            return {
+                'url': url,
+                'error': f'Failed to extract article: {str(e)}',
+                'is_paywalled': False
             }
+        
+        return self._extract_response(response, url)
+    
+    def extract_many(self, urls):
+        """
+        Extract several articles, downloading every page concurrently
+        
+        Pages are fetched on the async engine; parsing then runs inline or
+        on the extraction pool exactly as in extract(). Results are returned
+        in input order.
+        """
+        results = []
+        for url, response in zip(urls, async_fetcher.fetch_many(urls, timeout=30)):
+            if isinstance(response, Exception):
+                results.append({
+                    'url': url,
+                    'error': f'Failed to fetch article: {str(response)}',
+                    'is_paywalled': False
+                })
+            else:
+                results.append(self._extract_response(response, url))
+        return results
+    
+    def _extract_response(self, response, url):
+        try:
+            response.raise_for_status()
+            
+            # Hand the CPU-bound parsing to worker processes when configured
+            if extraction_pool.enabled:
+                return extraction_pool.extract(response.content, response.encoding, url)
+            
+            return self.extract_from_html(response.text, url)
             
         except requests.exceptions.RequestException as e:
             return {
@@ -74,57 +174,140 @@ class ArticleExtractor:
                 'is_paywalled': False
             }
     
-    def _extract_text_content(self, soup):
-        # Remove unwanted elements
-        for element in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'advertisement']):
-            element.decompose()
+    def extract_from_html(self, html, url):
+        """
+        Extract article content and metadata from a fetched page
+        
+        The page is parsed once; the same lxml tree is shared by paywall
+        detection, metadata lookup and readability's content extraction.
+        """
+        tree, _ = build_doc(html)
+        
+        # Check for common paywall indicators (but continue processing anyway)
+        is_potentially_paywalled = self._is_paywalled(tree)
+        
+        # Extract metadata
+        metadata = self._extract_metadata(tree, url)
+        
+        # Use readability to extract main content
+        doc = ParsedDocument(tree)
+        clean_html = doc.summary()
+        
+        # Extract text content, keeping paragraph and heading boundaries
+        blocks = self._extract_blocks(lxml.html.fromstring(clean_html))
+        content = self._blocks_to_text(blocks)
+        
+        # Calculate word count
+        word_count = len(content.split()) if content else 0
+        
+        # If content is too short and paywall was detected, it might be paywalled
+        if word_count < 100 and is_potentially_paywalled:
+            return {
+                'url': url,
+                'title': metadata.get('title'),
+                'author': metadata.get('author'),
+                'publication_date': metadata.get('publication_date'),
+                'content': None,
+                'word_count': 0,
+                'is_paywalled': True,
+                'error': f'Article appears to be behind a paywall (extracted only {word_count} words). You can manually paste the content instead.'
+            }
+        
+        return {
+            'url': url,
+            'title': metadata.get('title'),
+            'author': metadata.get('author'),
+            'publication_date': metadata.get('publication_date'),
+            'content': content,
+            'blocks': [{k: v for k, v in block.items() if k != 'text'} for block in blocks],
+            'word_count': word_count,
+            'is_paywalled': is_potentially_paywalled,
+            'paywall_warning': 'This article might be behind a paywall' if is_potentially_paywalled and word_count >= 100 else None
+        }
+    
+    def _extract_blocks(self, root):
+        """
+        Walk the cleaned article and return its text as a list of blocks
+        
+        Each block is {'type', 'text', 'start', 'end'} (plus 'level' for
+        headings), where start/end are offsets into the text produced by
+        _blocks_to_text, i.e. blocks joined by blank lines.
+        """
+        blocks = []
+        parts = []
+        
+        def flush(block_type, level=None):
+            text = ' '.join(''.join(parts).split())
+            parts.clear()
+            if text:
+                block = {'type': block_type, 'text': text}
+                if level:
+                    block['level'] = level
+                blocks.append(block)
+        
+        def walk(element, block_type, level):
+            if element.text:
+                parts.append(element.text)
+            for child in element:
+                # Comments and processing instructions have non-string tags
+                tag = child.tag if isinstance(child.tag, str) else None
+                if tag is None or tag in SKIPPED_TAGS:
+                    pass
+                elif tag == 'br':
+                    parts.append(' ')
+                elif tag in BLOCK_TYPES:
+                    flush(block_type, level)
+                    child_type = BLOCK_TYPES[tag] or block_type
+                    child_level = int(tag[1]) if child_type == 'heading' and tag[0] == 'h' else level
+                    walk(child, child_type, child_level)
+                    flush(child_type, child_level)
+                else:
+                    walk(child, block_type, level)
+                if child.tail:
+                    parts.append(child.tail)
         
-        # Get text content
-        text = soup.get_text()
+        walk(root, 'paragraph', None)
+        flush('paragraph')
         
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
+        # Record offsets into the joined text
+        offset = 0
+        for block in blocks:
+            block['start'] = offset
+            block['end'] = offset + len(block['text'])
+            offset = block['end'] + 2  # blank line separator
         
-        return text
+        return blocks
+    
+    def _blocks_to_text(self, blocks):
+        return '\n\n'.join(block['text'] for block in blocks)
     
-    def _extract_metadata(self, html, url):
-        soup = BeautifulSoup(html, 'html.parser')
+    def _extract_metadata(self, tree, url):
         metadata = {}
         
         # Extract title
         title = None
         # Try Open Graph title
-        og_title = soup.find('meta', property='og:title')
+        og_title = tree.xpath('//meta[@property="og:title"]')
         if og_title:
-            title = og_title.get('content')
+            title = og_title[0].get('content')
         # Try regular title tag
         if not title:
-            title_tag = soup.find('title')
-            if title_tag:
-                title = title_tag.get_text().strip()
+            title_tag = tree.find('.//title')
+            if title_tag is not None:
+                title = title_tag.text_content().strip()
         metadata['title'] = title
         
         # Extract author
         author = None
         # Try various author meta tags
-        author_selectors = [
-            'meta[name="author"]',
-            'meta[property="article:author"]',
-            'meta[name="article:author"]',
-            '.author',
-            '.byline',
-            '[rel="author"]'
-        ]
-        
-        for selector in author_selectors:
-            element = soup.select_one(selector)
-            if element:
-                if element.name == 'meta':
+        for xpath in AUTHOR_XPATHS:
+            elements = tree.xpath(xpath)
+            if elements:
+                element = elements[0]
+                if element.tag == 'meta':
                     author = element.get('content')
                 else:
-                    author = element.get_text().strip()
+                    author = element.text_content().strip()
                 if author:
                     break
         
@@ -132,25 +315,16 @@ class ArticleExtractor:
         
         # Extract publication date
         pub_date = None
-        date_selectors = [
-            'meta[property="article:published_time"]',
-            'meta[name="article:published_time"]',
-            'meta[name="date"]',
-            'meta[name="pubdate"]',
-            'time[datetime]',
-            '.date',
-            '.published'
-        ]
-        
-        for selector in date_selectors:
-            element = soup.select_one(selector)
-            if element:
-                if element.name == 'meta':
+        for xpath in DATE_XPATHS:
+            elements = tree.xpath(xpath)
+            if elements:
+                element = elements[0]
+                if element.tag == 'meta':
                     date_str = element.get('content')
-                elif element.name == 'time':
-                    date_str = element.get('datetime') or element.get_text().strip()
+                elif element.tag == 'time':
+                    date_str = element.get('datetime') or element.text_content().strip()
                 else:
-                    date_str = element.get_text().strip()
+                    date_str = element.text_content().strip()
                 
                 if date_str:
                     pub_date = self._parse_date(date_str)
@@ -161,10 +335,9 @@ class ArticleExtractor:
         
         return metadata
     
-    def _extract_title(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
-        title_tag = soup.find('title')
-        return title_tag.get_text().strip() if title_tag else 'Untitled'
+    def _extract_title(self, tree):
+        title_tag = tree.find('.//title')
+        return title_tag.text_content().strip() if title_tag is not None else 'Untitled'
     
     def _parse_date(self, date_str):
         # Common date formats
@@ -187,72 +360,109 @@ class ArticleExtractor:
         
         return None
     
-    def _is_paywalled(self, html):
-        # More specific paywall indicators to reduce false positives
-        paywall_indicators = [
-            'subscription required',
-            'premium content',
-            'sign up to continue reading',
-            'this article is for subscribers only',
-            'become a member to continue',
-            'login to continue reading',
-            'paywall-message',
-            'subscribe to read this article',
-            'this content is exclusive to subscribers',
-            'upgrade to premium'
-        ]
-        
-        html_lower = html.lower()
-        
-        # Count how many indicators are found
-        indicator_count = sum(1 for indicator in paywall_indicators if indicator in html_lower)
+    def _is_paywalled(self, tree):
+        # Scan text and class/id attributes in one pass instead of lowercasing the whole page
+        haystack = ' '.join(tree.xpath('//text() | //@class | //@id'))
+        found = {match.group(0).lower() for match in _PAYWALL_PATTERN.finditer(haystack)}
         
         # Only consider it paywalled if multiple strong indicators are present
         # or if very specific paywall messages are found
-        strong_indicators = [
-            'subscription required',
-            'this article is for subscribers only',
-            'paywall-message'
-        ]
-        
-        has_strong_indicator = any(indicator in html_lower for indicator in strong_indicators)
+        has_strong_indicator = bool(found & STRONG_PAYWALL_INDICATORS)
         
         # Return True only if we have strong evidence of a paywall
-        return has_strong_indicator or indicator_count >= 2
+        return has_strong_indicator or len(found) >= 2
     
-    def chunk_content(self, content, max_tokens=3000):
+    def chunk_content(self, content, max_tokens=3000, blocks=None):
         """
         Split content into chunks that fit within LLM context windows
+        
+        Paragraph boundaries (blank lines, or the extractor's blocks when given)
+        are preferred split points; headings stay with the text that follows
+        them. Paragraphs that are too long on their own are split by sentence,
+        and sentences that are still too long by words.
         """
         if not content:
             return []
         
-        # Rough estimation: 1 token ≈ 4 characters
-        max_chars = max_tokens * 4
-        
-        if len(content) <= max_chars:
+        if estimate_tokens(content) <= max_tokens:
             return [content]
         
         # Split by paragraphs first
-        paragraphs = content.split('\n\n')
+        if blocks:
+            segments = [(block['type'], content[block['start']:block['end']]) for block in blocks]
+        else:
+            segments = [('paragraph', paragraph.strip()) for paragraph in re.split(r'\n\s*\n', content)]
+        
+        pieces = []
+        for segment_type, text in segments:
+            if not text:
+                continue
+            tokens = estimate_tokens(text)
+            if tokens > max_tokens:
+                pieces.extend(('paragraph', piece, estimate_tokens(piece))
+                              for piece in self._split_oversized(text, max_tokens))
+            else:
+                pieces.append((segment_type, text, tokens))
+        
         chunks = []
         current_chunk = []
-        current_length = 0
+        current_tokens = 0
         
-        for paragraph in paragraphs:
-            para_length = len(paragraph)
+        for piece_type, text, tokens in pieces:
+            if current_chunk and current_tokens + tokens + 1 > max_tokens:
+                # Don't leave a heading dangling at the end of a chunk
+                carry = []
+                if len(current_chunk) > 1 and current_chunk[-1][0] == 'heading':
+                    carry = [current_chunk.pop()]
+                chunks.append('\n\n'.join(item[1] for item in current_chunk))
+                current_chunk = carry
+                current_tokens = sum(item[2] + 1 for item in carry)
             
-            if current_length + para_length > max_chars and current_chunk:
-                # Start new chunk
-                chunks.append('\n\n'.join(current_chunk))
-                current_chunk = [paragraph]
-                current_length = para_length
-            else:
-                current_chunk.append(paragraph)
-                current_length += para_length + 2  # +2 for \n\n
+            current_chunk.append((piece_type, text, tokens))
+            current_tokens += tokens + 1  # +1 for the blank line separator
         
         # Add the last chunk
         if current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
+            chunks.append('\n\n'.join(item[1] for item in current_chunk))
+        
+        return chunks
+    
+    def _split_oversized(self, text, max_tokens):
+        """
+        Split a paragraph that exceeds max_tokens into sentence-packed pieces
+        """
+        pieces = []
+        current = []
+        current_tokens = 0
+        
+        for sentence in _SENTENCE_BOUNDARY.split(text):
+            sentence_tokens = estimate_tokens(sentence)
+            
+            if sentence_tokens > max_tokens:
+                # Fall back to word windows for run-on "sentences"
+                if current:
+                    pieces.append(' '.join(current))
+                    current, current_tokens = [], 0
+                words = []
+                words_tokens = 0
+                for word in sentence.split():
+                    word_tokens = estimate_tokens(word)
+                    if words and words_tokens + word_tokens > max_tokens:
+                        pieces.append(' '.join(words))
+                        words, words_tokens = [], 0
+                    words.append(word)
+                    words_tokens += word_tokens
+                if words:
+                    pieces.append(' '.join(words))
+                continue
+            
+            if current and current_tokens + sentence_tokens > max_tokens:
+                pieces.append(' '.join(current))
+                current, current_tokens = [], 0
+            current.append(sentence)
+            current_tokens += sentence_tokens
+        
+        if current:
+            pieces.append(' '.join(current))
         
-        return chunks
\ No newline at end of file
+        return pieces
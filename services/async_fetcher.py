@@ -0,0 +1,183 @@
+"""
+Async Fetch Engine
+
+asyncio/httpx engine for bulk URL work. Thousands of bookmark links can be
+checked concurrently under a global in-flight cap and a per-host limit, and
+each check stops reading as soon as the page's </title> has arrived. Full
+page downloads for article extraction run on the same engine.
+"""
+
+import os
+import re
+import asyncio
+import concurrent.futures
+from urllib.parse import urlsplit
+from typing import Dict, List, Optional, Union
+
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .fetch_cache import fetch_cache
+from .http_client import DEFAULT_USER_AGENT
+
+TITLE_END = re.compile(rb'</title\s*>', re.IGNORECASE)
+
+def _run(coro):
+    """Run a coroutine to completion from synchronous code"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    
+    # Already inside an event loop: give the coroutine a loop of its own
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+class AsyncFetcher:
+    """Concurrent URL prober and downloader built on httpx.AsyncClient"""
+    
+    def __init__(self, max_in_flight: Optional[int] = None, per_host: Optional[int] = None,
+                 timeout: Optional[float] = None, probe_bytes: Optional[int] = None,
+                 max_body_bytes: Optional[int] = None):
+        self.max_in_flight = max_in_flight or int(os.environ.get('ASYNC_FETCH_MAX_IN_FLIGHT', '100'))
+        self.per_host = per_host or int(os.environ.get('ASYNC_FETCH_PER_HOST', '6'))
+        self.timeout = timeout or float(os.environ.get('ASYNC_FETCH_TIMEOUT', '15'))
+        # How much of a page a probe reads while looking for </title>
+        self.probe_bytes = probe_bytes or int(os.environ.get('ASYNC_FETCH_PROBE_BYTES', '16384'))
+        self.max_body_bytes = max_body_bytes or 10 * 1024 * 1024
+    
+    def probe_many(self, urls: List[str], max_in_flight: Optional[int] = None,
+                   time_budget: Optional[float] = None) -> List[Dict]:
+        """
+        Check many URLs concurrently, reading each page only up to its title
+        
+        Args:
+            urls: URLs to probe
+            max_in_flight: Optional lower cap on concurrent requests for this call
+            time_budget: Seconds to wait overall; probes still running then are
+                cancelled and reported as pending
+        
+        Returns:
+            One {'url', 'status_code', 'head', 'error', 'pending'} dict per URL,
+            in input order; 'head' is the decoded start of the page
+        """
+        return _run(self._gather(urls, self._probe, max_in_flight, self.timeout, time_budget))
+    
+    def fetch_many(self, urls: List[str], timeout: float = 30,
+                   max_in_flight: Optional[int] = None) -> List[Union[requests.Response, Exception]]:
+        """
+        Download many pages concurrently for extraction
+        
+        Fresh pages are served from the fetch cache and new downloads are
+        stored in it.
+        
+        Returns:
+            One item per URL, in input order: a requests.Response, or the
+            requests.RequestException describing why the download failed
+        """
+        results = [None] * len(urls)
+        missing = []
+        for index, url in enumerate(urls):
+            cached = fetch_cache.lookup(url, max_age=fetch_cache.fresh_seconds)
+            if cached is not None:
+                results[index] = cached
+            else:
+                missing.append(index)
+        
+        if missing:
+            downloaded = _run(self._gather([urls[i] for i in missing], self._download, max_in_flight, timeout))
+            for index, response in zip(missing, downloaded):
+                if isinstance(response, requests.Response):
+                    fetch_cache.store(urls[index], response)
+                results[index] = response
+        
+        return results
+    
+    async def _gather(self, urls: List[str], worker, max_in_flight: Optional[int], timeout: float,
+                      time_budget: Optional[float] = None) -> List:
+        in_flight = min(max_in_flight or self.max_in_flight, self.max_in_flight)
+        global_slots = asyncio.Semaphore(in_flight)
+        host_slots = {}
+        
+        limits = httpx.Limits(max_connections=in_flight, max_keepalive_connections=in_flight)
+        async with httpx.AsyncClient(
+            headers={'User-Agent': DEFAULT_USER_AGENT},
+            follow_redirects=True,
+            timeout=httpx.Timeout(timeout),
+            limits=limits
+        ) as client:
+            async def run(url):
+                host = (urlsplit(url).hostname or '').lower()
+                host_slot = host_slots.setdefault(host, asyncio.Semaphore(self.per_host))
+                # Wait for the host first so one slow site can't hold global slots
+                async with host_slot:
+                    async with global_slots:
+                        # Cap the whole exchange, not just each read
+                        return await asyncio.wait_for(worker(client, url), timeout)
+            
+            tasks = [asyncio.ensure_future(run(url)) for url in urls]
+            if tasks and time_budget is not None:
+                _, unfinished = await asyncio.wait(tasks, timeout=time_budget)
+                for task in unfinished:
+                    task.cancel()
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        results = []
+        for url, outcome in zip(urls, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                results.append({'url': url, 'status_code': None, 'head': None, 'error': None, 'pending': True})
+            elif isinstance(outcome, BaseException):
+                results.append(self._wrap_error(worker, url, outcome))
+            else:
+                results.append(outcome)
+        return results
+    
+    def _wrap_error(self, worker, url: str, error: BaseException):
+        message = str(error) or error.__class__.__name__
+        if isinstance(error, asyncio.TimeoutError):
+            message = 'Request timed out'
+        if worker == self._probe:
+            return {'url': url, 'status_code': None, 'head': None, 'error': message, 'pending': False}
+        return requests.exceptions.RequestException(message)
+    
+    async def _probe(self, client: httpx.AsyncClient, url: str) -> Dict:
+        async with client.stream('GET', url) as response:
+            buffer = b''
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+                # Stop as soon as the title is complete; leaving the block drops the connection
+                if TITLE_END.search(buffer) or len(buffer) >= self.probe_bytes:
+                    break
+            
+            return {
+                'url': url,
+                'status_code': response.status_code,
+                'head': buffer[:self.probe_bytes].decode(response.charset_encoding or 'utf-8', errors='ignore'),
+                'error': None,
+                'pending': False
+            }
+    
+    async def _download(self, client: httpx.AsyncClient, url: str) -> requests.Response:
+        async with client.stream('GET', url) as response:
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_body_bytes:
+                    raise requests.exceptions.RequestException(
+                        f'Response exceeds {self.max_body_bytes} bytes'
+                    )
+            
+            # Hand back a requests.Response so callers share the synchronous code path
+            result = requests.Response()
+            result.status_code = response.status_code
+            result.reason = response.reason_phrase
+            result.url = str(response.url)
+            result.headers = CaseInsensitiveDict(response.headers)
+            result.encoding = get_encoding_from_headers(result.headers)
+            result._content = bytes(body)
+            return result
+
+# Create a global instance
+async_fetcher = AsyncFetcher()
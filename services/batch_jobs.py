@@ -0,0 +1,282 @@
+"""
+Batch Job Service
+
+Runs batch summarization jobs server-side. Every item of a job is fanned out
+to a bounded worker pool which extracts the article, generates the summary
+and records progress on the job's rows, so the browser only has to poll.
+"""
+
+import os
+import logging
+import concurrent.futures
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from models import db, User, Summary, BatchJob, BatchJobItem
+from .article_extractor import ArticleExtractor
+from .llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+
+class BatchJobRunner:
+    """Bounded worker pool that processes batch summarization jobs"""
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.environ.get('BATCH_MAX_WORKERS', '4'))
+        self._executor = None
+    
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        # Created lazily so importing the module doesn't spawn threads
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='batch-job'
+            )
+        return self._executor
+    
+    def create_job(self, user, urls: List[Dict], length: str, tone: str, format_type: str,
+                   model: str, custom_word_count: Optional[int] = None) -> BatchJob:
+        """
+        Create a job and its items in the database
+        
+        Args:
+            user: Owner of the job
+            urls: List of {'url': ..., 'title': ...} dictionaries
+        
+        Returns:
+            The committed BatchJob
+        """
+        job = BatchJob(
+            user_id=user.id,
+            status='pending',
+            total_items=len(urls),
+            length_setting=length,
+            tone_setting=tone,
+            format_setting=format_type,
+            model_used=model,
+            custom_word_count=custom_word_count
+        )
+        db.session.add(job)
+        db.session.flush()
+        
+        for position, entry in enumerate(urls):
+            db.session.add(BatchJobItem(
+                job_id=job.id,
+                position=position,
+                url=entry['url'],
+                title=entry.get('title')
+            ))
+        
+        db.session.commit()
+        return job
+    
+    def submit(self, app, job_id: int) -> None:
+        """Queue every pending item of a job on the worker pool"""
+        item_ids = [item_id for (item_id,) in db.session.query(BatchJobItem.id)
+                    .filter_by(job_id=job_id, status='pending')
+                    .order_by(BatchJobItem.position)]
+        
+        for item_id in item_ids:
+            self.executor.submit(self._run_item, app, job_id, item_id)
+    
+    def resume(self, app) -> None:
+        """Re-queue the items of jobs left unfinished by a previous run"""
+        # The pool only lives in memory, so at startup no worker holds these items any more
+        BatchJobItem.query.filter(BatchJobItem.status.in_(('extracting', 'summarizing'))).update(
+            {'status': 'pending', 'updated_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        
+        job_ids = [job_id for (job_id,) in db.session.query(BatchJob.id)
+                   .filter(BatchJob.status.in_(('pending', 'running')))]
+        for job_id in job_ids:
+            logger.info(f"Resuming batch job {job_id}")
+            self.submit(app, job_id)
+            # Every item may have finished before the job itself was marked done
+            self._settle_job(job_id)
+    
+    def _run_item(self, app, job_id: int, item_id: int) -> None:
+        with app.app_context():
+            try:
+                self._process_item(job_id, item_id)
+            except Exception as e:
+                logger.error(f"Batch item {item_id} of job {job_id} failed: {str(e)}")
+                db.session.rollback()
+                self._finish_item(job_id, item_id, error=str(e))
+            finally:
+                db.session.remove()
+    
+    def _process_item(self, job_id: int, item_id: int) -> None:
+        job = db.session.get(BatchJob, job_id)
+        item = db.session.get(BatchJobItem, item_id)
+        if not job or not item:
+            return
+        
+        # Claimed with a conditional update so an item queued twice runs once
+        claimed = BatchJobItem.query.filter_by(id=item_id, status='pending').update(
+            {'status': 'extracting', 'updated_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not claimed:
+            return
+        
+        self._mark_job_running(job_id)
+        
+        # Extract article content
+        
+        extractor = ArticleExtractor()
+        result = extractor.extract(item.url)
+        
+        if not result or result.get('error') or not result.get('content'):
+            error = (result or {}).get('error') or 'Failed to extract content'
+            self._finish_item(job_id, item_id, error=error,
+                              is_paywalled=bool((result or {}).get('is_paywalled')),
+                              title=(result or {}).get('title'))
+            return
+        
+        # Generate summary
+        item.status = 'summarizing'
+        db.session.commit()
+        
+        user = db.session.get(User, job.user_id)
+        llm_service = LLMService(user)
+        summary_result = llm_service.generate_summary(
+            content=result['content'],
+            length=job.length_setting,
+            tone=job.tone_setting,
+            format_type=job.format_setting,
+            model=job.model_used,
+            custom_word_count=job.custom_word_count
+        )
+        
+        summary = Summary(
+            user_id=job.user_id,
+            url=item.url,
+            title=result.get('title') or item.title,
+            author=result.get('author'),
+            publication_date=_parse_publication_date(result.get('publication_date')),
+            original_text=result['content'][:10000],  # Limit stored original text
+            summary_text=summary_result['text'],
+            length_setting=job.length_setting,
+            tone_setting=job.tone_setting,
+            format_setting=job.format_setting,
+            model_used=summary_result.get('model', job.model_used),
+            word_count=summary_result['word_count']
+        )
+        db.session.add(summary)
+        db.session.flush()
+        
+        self._finish_item(job_id, item_id, summary_id=summary.id, title=summary.title,
+                          is_paywalled=bool(result.get('is_paywalled')))
+    
+    def _mark_job_running(self, job_id: int) -> None:
+        BatchJob.query.filter_by(id=job_id, status='pending').update(
+            {'status': 'running', 'started_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+    
+    def _finish_item(self, job_id: int, item_id: int, summary_id: Optional[int] = None,
+                     error: Optional[str] = None, is_paywalled: bool = False,
+                     title: Optional[str] = None) -> None:
+        values = {
+            'status': 'failed' if error else 'completed',
+            'error': error,
+            'summary_id': summary_id,
+            'is_paywalled': is_paywalled,
+            'updated_at': datetime.utcnow()
+        }
+        if title:
+            values['title'] = title
+        BatchJobItem.query.filter_by(id=item_id).update(values, synchronize_session=False)
+        
+        # Counters are incremented in SQL so concurrent workers never lose updates
+        counter = BatchJob.failed_items if error else BatchJob.completed_items
+        BatchJob.query.filter_by(id=job_id).update(
+            {counter: counter + 1},
+            synchronize_session=False
+        )
+        db.session.commit()
+        self._settle_job(job_id)
+    
+    def _settle_job(self, job_id: int) -> None:
+        job = db.session.get(BatchJob, job_id)
+        db.session.refresh(job)
+        if job.is_finished and job.status in ('pending', 'running'):
+            job.status = 'failed' if job.completed_items == 0 and job.total_items > 0 else 'completed'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+def _parse_publication_date(publication_date):
+    if not publication_date:
+        return None
+    try:
+        if isinstance(publication_date, datetime):
+            return publication_date
+        return datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+
+def serialize_batch_job(job: BatchJob, include_items: bool = True) -> Dict:
+    """Build the JSON payload used by the progress-polling endpoint"""
+    data = {
+        'id': job.id,
+        'status': job.status,
+        'total': job.total_items,
+        'completed': job.completed_items,
+        'failed': job.failed_items,
+        'settings': {
+            'length': job.length_setting,
+            'tone': job.tone_setting,
+            'format': job.format_setting,
+            'model': job.model_used
+        },
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+    
+    if include_items:
+        items = []
+        for item in job.items:
+            item_data = {
+                'id': item.id,
+                'url': item.url,
+                'title': item.title,
+                'status': item.status
+            }
+            
+            if item.status == 'failed':
+                item_data['error'] = item.error
+                item_data['is_paywalled'] = item.is_paywalled
+                item_data['allow_manual_input'] = item.is_paywalled
+            elif item.status == 'completed' and item.summary:
+                summary = item.summary
+                item_data['summary'] = {
+                    'id': summary.id,
+                    'text': summary.summary_text,
+                    'word_count': summary.word_count,
+                    'metadata': {
+                        'title': summary.title,
+                        'author': summary.author,
+                        'publication_date': summary.publication_date.isoformat() if summary.publication_date else None,
+                        'url': summary.url,
+                        'analysis_date': summary.created_at.isoformat()
+                    },
+                    'settings': {
+                        'length': summary.length_setting,
+                        'tone': summary.tone_setting,
+                        'format': summary.format_setting,
+                        'model': summary.model_used
+                    }
+                }
+            
+            items.append(item_data)
+        data['items'] = items
+    
+    return data
+
+# Create a global instance
+batch_job_runner = BatchJobRunner()
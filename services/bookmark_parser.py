@@ -7,68 +7,181 @@ Supports exports from Chrome, Firefox, Safari, Edge, and other browsers.
 
 import re
 import html
-from urllib.parse import urlparse
 from datetime import datetime
-from typing import List, Dict, Optional, Union
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Union
 import logging
 
+from .upload_stream import iter_text, UPLOAD_CHUNK_SIZE
+
 logger = logging.getLogger(__name__)
 
-class BookmarkParser:
-    """Parser for browser bookmark files"""
+# The only tags that matter in a Netscape export: folders open a <DL> after
+# their <H3> name, and every bookmark is an <A>
+TAG_PATTERN = re.compile(r'<(/?)(dl|h3|a)\b([^>]*)>', re.IGNORECASE)
+HREF_PATTERN = re.compile(r'\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+ADD_DATE_PATTERN = re.compile(r'\badd_date\s*=\s*["\']?(\d+)', re.IGNORECASE)
+INNER_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# http(s) scheme followed by a non-empty host
+VALID_URL_PATTERN = re.compile(r'https?://[^/?#\s]', re.IGNORECASE)
+
+# Longest title or folder name kept; guards against unclosed tags
+MAX_TEXT_LENGTH = 2048
+
+def _clean_text(text: str) -> str:
+    if '<' in text:
+        text = INNER_TAG_PATTERN.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return ' '.join(text.split())
+
+class BookmarkStream:
+    """
+    Incremental, single-pass tokenizer for Netscape bookmark exports
     
-    def __init__(self):
-        # Regex patterns for different bookmark formats
-        self.bookmark_patterns = [
-            # Standard Netscape bookmark format (Chrome, Firefox, etc.)
-            r'<DT><A[^>]*HREF="([^"]+)"[^>]*>([^<]+)</A>',
-            # Alternative format with different attribute order
-            r'<A[^>]*HREF="([^"]+)"[^>]*><[^>]*>([^<]+)</A>',
-            # Simple format
-            r'<A[^>]*HREF=["\']([^"\']+)["\'][^>]*>([^<]+)</A>',
-        ]
+    Text is fed in chunks of any size. Every <DL>/<H3>/<A> tag is visited
+    once, the enclosing folders are tracked on a stack and duplicate URLs are
+    dropped through a set, so parsing is linear in the file size and only a
+    small unparsed tail is kept between chunks.
+    """
+    
+    def __init__(self, is_valid_url: Callable[[str], bool]):
+        self.is_valid_url = is_valid_url
+        self.folders = []
+        self._folder_names = set()
+        self._seen_urls = set()
+        self._folder_stack = []
+        self._pending_folder = None
+        self._capture = None
+        self._buffer = ''
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """Consume a chunk of the file and return the bookmarks it completed"""
+        buffer = self._buffer + chunk
+        bookmarks = []
+        text_start = 0
+        
+        for match in TAG_PATTERN.finditer(buffer):
+            if self._capture is not None:
+                self._capture_text(buffer[text_start:match.start()])
+            text_start = match.end()
+            
+            closing, tag = match.group(1), match.group(2).lower()
+            if tag == 'dl':
+                if closing:
+                    if self._folder_stack:
+                        self._folder_stack.pop()
+                else:
+                    self._folder_stack.append(self._pending_folder)
+                    self._pending_folder = None
+            elif closing:
+                if self._capture is not None and self._capture['tag'] == tag:
+                    self._finish_capture(bookmarks)
+            else:
+                # An unclosed <A> or <H3> ends where the next one starts
+                if self._capture is not None:
+                    self._finish_capture(bookmarks)
+                self._capture = {'tag': tag, 'attrs': match.group(3), 'text': []}
         
-        # Folder detection pattern
-        self.folder_pattern = r'<DT><H3[^>]*>([^<]+)</H3>'
+        # Keep only what may still be an incomplete tag
+        cut = buffer.rfind('<', text_start)
+        if cut == -1:
+            cut = len(buffer)
+        if self._capture is not None:
+            self._capture_text(buffer[text_start:cut])
+        self._buffer = buffer[cut:]
         
-        # Add date pattern for bookmark timestamps
-        self.add_date_pattern = r'ADD_DATE="(\d+)"'
+        return bookmarks
     
-    def parse_bookmark_file(self, file_content: str) -> Dict[str, Union[List[Dict], str]]:
+    def parse(self, chunks: Iterable[str]) -> Iterator[Dict]:
+        """Feed every chunk and yield bookmarks as soon as they are complete"""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.close()
+    
+    def close(self) -> List[Dict]:
+        """Flush the stream at end of file"""
+        bookmarks = self.feed('')
+        if self._capture is not None:
+            self._capture_text(self._buffer)
+            self._finish_capture(bookmarks)
+        self._buffer = ''
+        return bookmarks
+    
+    def _capture_text(self, text: str) -> None:
+        parts = self._capture['text']
+        if text and sum(len(part) for part in parts) < MAX_TEXT_LENGTH:
+            parts.append(text)
+    
+    def _finish_capture(self, bookmarks: List[Dict]) -> None:
+        capture, self._capture = self._capture, None
+        text = _clean_text(''.join(capture['text']))[:MAX_TEXT_LENGTH]
+        
+        if capture['tag'] == 'h3':
+            self._pending_folder = text or None
+            if text and text not in self._folder_names:
+                self._folder_names.add(text)
+                self.folders.append(text)
+            return
+        
+        href = HREF_PATTERN.search(capture['attrs'])
+        if not href:
+            return
+        url = href.group(1) if href.group(1) is not None else href.group(2) if href.group(2) is not None else href.group(3)
+        url = html.unescape(url).strip() if '&' in url else url.strip()
+        if not url or url in self._seen_urls or not self.is_valid_url(url):
+            return
+        self._seen_urls.add(url)
+        
+        add_date = ADD_DATE_PATTERN.search(capture['attrs'])
+        
+        folder_path = [name for name in self._folder_stack if name]
+        bookmarks.append({
+            'url': url,
+            'title': text or 'Untitled',
+            'add_date': self._parse_add_date(add_date.group(1) if add_date else None),
+            'folder': ' / '.join(folder_path) or None,
+            'folder_path': folder_path,
+            'source': 'browser_bookmarks'
+        })
+    
+    @staticmethod
+    def _parse_add_date(value: Optional[str]) -> Optional[datetime]:
+        """Convert an ADD_DATE timestamp to a datetime"""
+        try:
+            if value:
+                return datetime.fromtimestamp(int(value))
+        except (ValueError, OSError, OverflowError):
+            pass
+        return None
+
+class BookmarkParser:
+    """Parser for browser bookmark files"""
+    
+    def parse_bookmark_file(self, file_content: Union[str, BinaryIO]) -> Dict[str, Union[List[Dict], str]]:
         """
         Parse a bookmark file and extract URLs with metadata
         
         Args:
-            file_content: String content of the bookmark file
+            file_content: String content of the bookmark file, or a binary
+                stream that is read and decoded chunk by chunk
             
         Returns:
             Dictionary containing parsed bookmarks and metadata
         """
         try:
-            result = {
-                'bookmarks': [],
-                'folders': [],
-                'total_count': 0,
+            stream = self.open_stream()
+            bookmarks = list(stream.parse(self._as_chunks(file_content)))
+            
+            logger.info(f"Successfully parsed {len(bookmarks)} bookmarks from file")
+            return {
+                'bookmarks': bookmarks,
+                'folders': stream.folders,
+                'total_count': len(bookmarks),
                 'parsing_errors': [],
                 'file_type': 'html_bookmarks'
             }
             
-            # Clean up the content
-            content = self._clean_html_content(file_content)
-            
-            # Extract bookmarks using multiple patterns
-            bookmarks = self._extract_bookmarks(content)
-            
-            # Extract folder structure (optional)
-            folders = self._extract_folders(content)
-            
-            result['bookmarks'] = bookmarks
-            result['folders'] = folders
-            result['total_count'] = len(bookmarks)
-            
-            logger.info(f"Successfully parsed {len(bookmarks)} bookmarks from file")
-            return result
-            
         except Exception as e:
             logger.error(f"Error parsing bookmark file: {str(e)}")
             return {
@@ -79,103 +192,30 @@ class BookmarkParser:
                 'file_type': 'unknown'
             }
     
-    def _clean_html_content(self, content: str) -> str:
-        """Clean and normalize HTML content"""
-        # Remove extra whitespace and normalize line endings
-        content = re.sub(r'\s+', ' ', content)
-        content = content.replace('\r\n', '\n').replace('\r', '\n')
-        
-        # Decode HTML entities
-        content = html.unescape(content)
-        
-        return content
+    def open_stream(self) -> BookmarkStream:
+        """Start an incremental parse; read .folders once it is consumed"""
+        return BookmarkStream(self._is_valid_url)
     
-    def _extract_bookmarks(self, content: str) -> List[Dict]:
-        """Extract bookmarks from HTML content"""
-        bookmarks = []
-        
-        for pattern in self.bookmark_patterns:
-            matches = re.finditer(pattern, content, re.IGNORECASE | re.DOTALL)
-            
-            for match in matches:
-                try:
-                    url = match.group(1).strip()
-                    title = match.group(2).strip()
-                    
-                    # Skip if URL is empty or invalid
-                    if not url or not self._is_valid_url(url):
-                        continue
-                    
-                    # Remove HTML tags from title
-                    title = re.sub(r'<[^>]+>', '', title).strip()
-                    
-                    # Extract additional metadata from the full match
-                    full_match = match.group(0)
-                    add_date = self._extract_add_date(full_match)
-                    
-                    bookmark = {
-                        'url': url,
-                        'title': title or 'Untitled',
-                        'add_date': add_date,
-                        'folder': self._extract_folder_context(content, match.start()),
-                        'source': 'browser_bookmarks'
-                    }
-                    
-                    # Avoid duplicates
-                    if not any(b['url'] == url for b in bookmarks):
-                        bookmarks.append(bookmark)
-                        
-                except (IndexError, AttributeError) as e:
-                    logger.warning(f"Error parsing bookmark: {str(e)}")
-                    continue
-        
-        return bookmarks
-    
-    def _extract_folders(self, content: str) -> List[str]:
-        """Extract folder names from bookmark file"""
-        folders = []
-        
-        folder_matches = re.finditer(self.folder_pattern, content, re.IGNORECASE)
-        for match in folder_matches:
-            folder_name = match.group(1).strip()
-            # Remove HTML tags
-            folder_name = re.sub(r'<[^>]+>', '', folder_name).strip()
-            if folder_name and folder_name not in folders:
-                folders.append(folder_name)
+    def iter_bookmarks(self, source: Union[str, BinaryIO, Iterable[str]]) -> Iterator[Dict]:
+        """
+        Yield bookmarks one at a time without holding the file in memory
         
-        return folders
-    
-    def _extract_add_date(self, bookmark_html: str) -> Optional[datetime]:
-        """Extract ADD_DATE timestamp from bookmark HTML"""
-        try:
-            match = re.search(self.add_date_pattern, bookmark_html)
-            if match:
-                timestamp = int(match.group(1))
-                return datetime.fromtimestamp(timestamp)
-        except (ValueError, OSError):
-            pass
-        return None
+        Args:
+            source: File text, a binary stream, or successive text chunks
+        """
+        return self.open_stream().parse(self._as_chunks(source))
     
-    def _extract_folder_context(self, content: str, bookmark_position: int) -> Optional[str]:
-        """Determine which folder a bookmark belongs to based on its position"""
-        # Look backwards from bookmark position to find the most recent folder
-        content_before = content[:bookmark_position]
-        folder_matches = list(re.finditer(self.folder_pattern, content_before, re.IGNORECASE))
-        
-        if folder_matches:
-            last_folder = folder_matches[-1]
-            folder_name = last_folder.group(1).strip()
-            return re.sub(r'<[^>]+>', '', folder_name).strip()
-        
-        return None
+    def _as_chunks(self, source: Union[str, BinaryIO, Iterable[str]]) -> Iterable[str]:
+        if isinstance(source, str):
+            return [source]
+        if hasattr(source, 'read'):
+            return iter_text(source)
+        return source
     
     def _is_valid_url(self, url: str) -> bool:
-        """Validate if a string is a valid URL"""
-        try:
-            result = urlparse(url)
-            return all([result.scheme, result.netloc]) and result.scheme in ['http', 'https']
-        except Exception:
-            return False
+        """Validate if a string is an http(s) URL with a host"""
+        # Cheaper than urlparse, which dominated the cost of large imports
+        return VALID_URL_PATTERN.match(url) is not None
     
     def extract_urls_only(self, file_content: str) -> List[str]:
         """
@@ -201,14 +241,22 @@ class BookmarkParser:
             'Opera bookmarks export'
         ]
     
-    def validate_bookmark_file(self, file_content: str) -> Dict[str, Union[bool, str]]:
+    def validate_bookmark_file(self, file_content: Union[str, BinaryIO]) -> Dict[str, Union[bool, str]]:
         """
         Validate if a file appears to be a valid bookmark file
         
+        A binary stream is judged by its first chunk, which holds the export
+        header, and is rewound afterwards.
+        
         Returns:
             Dictionary with validation result and details
         """
         try:
+            if hasattr(file_content, 'read'):
+                head = file_content.read(UPLOAD_CHUNK_SIZE)
+                file_content.seek(0)
+                file_content = head.decode('utf-8', errors='replace')
+            
             # Check for common bookmark file indicators
             indicators = [
                 '<!DOCTYPE NETSCAPE-Bookmark-file-1>',
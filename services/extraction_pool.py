@@ -0,0 +1,116 @@
+"""
+Extraction Pool Service
+
+Runs the CPU-bound part of article extraction (lxml parsing, readability
+scoring, regex scans) in a pool of warm worker processes so it scales across
+cores instead of serializing on the GIL. Fetching stays on the caller's
+thread; only the raw HTML bytes are shipped to the workers.
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-process extractor, created by the worker initializer
+_worker_extractor = None
+
+def _init_worker():
+    """Preload the parsers once per worker process"""
+    global _worker_extractor
+    from .article_extractor import ArticleExtractor
+    _worker_extractor = ArticleExtractor()
+
+def _warm_up():
+    return os.getpid()
+
+def _extract_in_worker(html: bytes, encoding: Optional[str], url: str) -> Dict:
+    try:
+        if encoding:
+            html = html.decode(encoding, errors='replace')
+        # Undeclared encodings are sniffed from the bytes by readability's build_doc
+        return _worker_extractor.extract_from_html(html, url)
+    except Exception as e:
+        return {
+            'url': url,
+            'error': f'Failed to extract article: {str(e)}',
+            'is_paywalled': False
+        }
+
+class ExtractionPool:
+    """Dispatches HTML extraction inline or to a process pool"""
+    
+    def __init__(self, mode: Optional[str] = None, max_workers: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.mode = (mode or os.environ.get('EXTRACTION_EXECUTOR', 'inline')).lower()
+        self.max_workers = max_workers or int(os.environ.get('EXTRACTION_PROCESSES', str(os.cpu_count() or 2)))
+        self.timeout = timeout or float(os.environ.get('EXTRACTION_TIMEOUT', '60'))
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.mode == 'process'
+    
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: forking a threaded web server can deadlock the children
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+            return self._executor
+    
+    def warm(self) -> None:
+        """Start every worker process ahead of the first extraction"""
+        if not self.enabled:
+            return
+        executor = self._get_executor()
+        futures = [executor.submit(_warm_up) for _ in range(self.max_workers)]
+        concurrent.futures.wait(futures, timeout=self.timeout)
+    
+    def extract(self, html: bytes, encoding: Optional[str], url: str) -> Dict:
+        """
+        Extract an article from raw HTML bytes in a worker process
+        
+        Args:
+            html: Raw response body
+            encoding: Charset declared by the server, if any
+            url: URL the page was fetched from
+        
+        Returns:
+            The ArticleExtractor result dictionary
+        """
+        try:
+            future = self._get_executor().submit(_extract_in_worker, html, encoding, url)
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            logger.error("Extraction worker pool broke; restarting it")
+            self.shutdown(wait=False)
+            return {
+                'url': url,
+                'error': 'Failed to extract article: extraction worker crashed',
+                'is_paywalled': False
+            }
+        except concurrent.futures.TimeoutError:
+            return {
+                'url': url,
+                'error': f'Failed to extract article: extraction took longer than {self.timeout:.0f} seconds',
+                'is_paywalled': False
+            }
+    
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+# Create a global instance
+extraction_pool = ExtractionPool()
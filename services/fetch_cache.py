@@ -0,0 +1,285 @@
+"""
+Fetch Cache Service
+
+Persistent on-disk HTTP cache for article pages, keyed by canonical URL.
+Bodies are stored as files next to a small SQLite index holding headers,
+ETag and Last-Modified. Recently fetched pages are served without touching
+the network; older ones are revalidated with If-None-Match /
+If-Modified-Since so an unchanged page only costs a 304.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import contextlib
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from typing import Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings share a cache entry"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    # Fragments are never sent to the server
+    return urlunsplit((scheme, host, path, query, ''))
+
+class FetchCache:
+    """Disk-backed HTTP response cache with conditional revalidation"""
+    
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None,
+                 fresh_seconds: Optional[int] = None, enabled: Optional[bool] = None):
+        self.cache_dir = cache_dir or os.environ.get('FETCH_CACHE_DIR', os.path.join('instance', 'fetch_cache'))
+        self.max_bytes = max_bytes or int(os.environ.get('FETCH_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+        if fresh_seconds is None:
+            fresh_seconds = int(os.environ.get('FETCH_CACHE_FRESH_SECONDS', '300'))
+        self.fresh_seconds = fresh_seconds
+        if enabled is None:
+            enabled = os.environ.get('FETCH_CACHE_ENABLED', 'true').lower() == 'true'
+        self.enabled = enabled
+        
+        # Single entries larger than this are never cached
+        self.max_entry_bytes = min(self.max_bytes // 2, 10 * 1024 * 1024)
+        
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._stats = {'fresh_hits': 0, 'revalidated': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+    
+    def fetch(self, session: requests.Session, url: str, timeout: float = 30, **kwargs) -> requests.Response:
+        """
+        GET a URL through the cache
+        
+        Args:
+            session: Session used for network requests
+            url: URL to fetch
+            timeout: Request timeout in seconds
+        
+        Returns:
+            A requests.Response; cached responses have from_cache set to True
+        """
+        if not self.enabled:
+            return session.get(url, timeout=timeout, **kwargs)
+        
+        key = self._key(url)
+        entry = self._get_entry(key)
+        
+        if entry and time.time() - entry['stored_at'] < self.fresh_seconds:
+            response = self._build_response(url, entry)
+            if response is not None:
+                self._bump('fresh_hits')
+                return response
+        
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        response = session.get(url, timeout=timeout, headers=headers, **kwargs)
+        
+        if response.status_code == 304 and entry:
+            self._touch(key, response.headers)
+            cached = self._build_response(url, entry)
+            if cached is not None:
+                self._bump('revalidated')
+                return cached
+            # Body went missing on disk; fetch it again unconditionally
+            response = session.get(url, timeout=timeout, **kwargs)
+        
+        self._bump('misses')
+        self.store(url, response)
+        
+        return response
+    
+    def store(self, url: str, response: requests.Response) -> None:
+        """Cache a response that was fetched outside of fetch()"""
+        if self.enabled and response.status_code == 200 and self._is_storable(response):
+            self._store(self._key(url), url, response)
+    
+    def lookup(self, url: str, max_age: Optional[int] = None) -> Optional[requests.Response]:
+        """Return a cached response for a URL without any network access"""
+        if not self.enabled:
+            return None
+        
+        entry = self._get_entry(self._key(url))
+        if not entry:
+            return None
+        if max_age is not None and time.time() - entry['stored_at'] > max_age:
+            return None
+        return self._build_response(url, entry)
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            with self._connect() as conn:
+                count, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            stats.update({'entries': count, 'bytes': size})
+        except sqlite3.Error:
+            pass
+        return stats
+    
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(canonicalize_url(url).encode('utf-8')).hexdigest()
+    
+    def _body_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+    
+    def _bump(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[counter] += amount
+    
+    def _ensure_schema(self) -> None:
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.db'), timeout=10)
+            try:
+                with conn:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS entries (
+                            key TEXT PRIMARY KEY,
+                            url TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            headers TEXT,
+                            etag TEXT,
+                            last_modified TEXT,
+                            stored_at REAL NOT NULL,
+                            accessed_at REAL NOT NULL
+                        )
+                    ''')
+                    conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at)')
+            finally:
+                conn.close()
+            self._initialized = True
+    
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open the index, commit on success and always close the connection"""
+        self._ensure_schema()
+        conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.db'), timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _get_entry(self, key: str) -> Optional[Dict]:
+        try:
+            with self._connect() as conn:
+                conn.row_factory = sqlite3.Row
+                row = conn.execute('SELECT * FROM entries WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+                return dict(row)
+        except sqlite3.Error as e:
+            logger.warning(f"Fetch cache lookup failed: {str(e)}")
+            return None
+    
+    def _touch(self, key: str, headers) -> None:
+        """Mark an entry fresh after a 304, picking up any new validators"""
+        try:
+            with self._connect() as conn:
+                now = time.time()
+                conn.execute(
+                    'UPDATE entries SET stored_at = ?, accessed_at = ?, '
+                    'etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE key = ?',
+                    (now, now, headers.get('ETag'), headers.get('Last-Modified'), key)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Fetch cache update failed: {str(e)}")
+    
+    def _is_storable(self, response: requests.Response) -> bool:
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return False
+        return len(response.content) <= self.max_entry_bytes
+    
+    def _store(self, key: str, url: str, response: requests.Response) -> None:
+        body = response.content
+        path = self._body_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial body
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            
+            headers = {name: value for name, value in response.headers.items()
+                       if name.lower() in ('content-type', 'etag', 'last-modified', 'cache-control')}
+            now = time.time()
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries (key, url, size, headers, etag, last_modified, stored_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, canonicalize_url(url), len(body), json.dumps(headers),
+                     response.headers.get('ETag'), response.headers.get('Last-Modified'), now, now)
+                )
+            self._bump('stores')
+            self._evict()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Failed to store {url} in fetch cache: {str(e)}")
+    
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self._connect() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            
+            # Evict down to 90% so we don't run this on every store
+            target = int(self.max_bytes * 0.9)
+            evicted = []
+            for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed_at ASC'):
+                if total <= target:
+                    break
+                evicted.append(key)
+                total -= size
+            
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in evicted])
+        
+        for key in evicted:
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+        self._bump('evictions', len(evicted))
+    
+    def _build_response(self, url: str, entry: Dict) -> Optional[requests.Response]:
+        try:
+            with open(self._body_path(entry['key']), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response.headers = CaseInsensitiveDict(json.loads(entry['headers'] or '{}'))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response.from_cache = True
+        return response
+
+# Create a global instance
+fetch_cache = FetchCache()
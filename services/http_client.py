@@ -0,0 +1,156 @@
+"""
+HTTP Client Service
+
+Process-wide HTTP client used for every outbound page fetch. A single
+requests.Session with a tuned per-host connection pool keeps TCP/TLS
+connections alive across requests, a global semaphore bounds how many
+fetches run at once, and transient failures are retried with backoff.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+class CappedRetry(Retry):
+    """Retry that never sleeps longer than retry_after_cap for a Retry-After header"""
+    
+    def __init__(self, *args, retry_after_cap: float = 10.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after_cap = retry_after_cap
+    
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.retry_after_cap = self.retry_after_cap
+        return retry
+    
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.retry_after_cap)
+
+class HTTPClient:
+    """Shared, pooled HTTP client with a global concurrency limit"""
+    
+    def __init__(self, pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, retries: Optional[int] = None,
+                 backoff_factor: Optional[float] = None, retry_after_max: Optional[float] = None):
+        # Number of distinct hosts whose pools are kept open
+        self.pool_connections = pool_connections or int(os.environ.get('HTTP_POOL_HOSTS', '32'))
+        # Keep-alive connections kept per host
+        self.pool_maxsize = pool_maxsize or int(os.environ.get('HTTP_POOL_MAXSIZE', '10'))
+        self.max_concurrency = max_concurrency or int(os.environ.get('HTTP_MAX_CONCURRENCY', '20'))
+        self.retries = retries if retries is not None else int(os.environ.get('HTTP_RETRIES', '2'))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.environ.get('HTTP_BACKOFF_FACTOR', '0.5'))
+        # Longest a retry waits on a Retry-After header while holding a concurrency slot
+        self.retry_after_max = retry_after_max if retry_after_max is not None else float(os.environ.get('HTTP_RETRY_AFTER_MAX', '10'))
+        
+        self.session = self._build_session()
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'errors': 0, 'in_flight': 0, 'wait_seconds': 0.0}
+    
+    def _build_session(self) -> requests.Session:
+        retry = CappedRetry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            retry_after_cap=self.retry_after_max,
+            # Hand the final 5xx back to the caller instead of raising
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry
+        )
+        
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'User-Agent': DEFAULT_USER_AGENT})
+        # The session is shared by every user's fetches, so no site's cookies may be kept
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+    
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared session, waiting for a free slot"""
+        started = time.monotonic()
+        with self._semaphore:
+            waited = time.monotonic() - started
+            with self._lock:
+                self._stats['requests'] += 1
+                self._stats['in_flight'] += 1
+                self._stats['wait_seconds'] += waited
+            try:
+                return self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                with self._lock:
+                    self._stats['errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._stats['in_flight'] -= 1
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+    
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+    
+    def get_stats(self, per_host: bool = True) -> Dict:
+        """
+        Return request counters, pool totals and the state of every per-host pool
+        
+        Args:
+            per_host: List the per-host pools; leave it off for stats shown to
+                users, since host names reveal which sites others fetched
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_concurrency'] = self.max_concurrency
+        
+        pools = []
+        for adapter in set(self.session.adapters.values()):
+            pool_manager = adapter.poolmanager
+            for key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle_connections': pool.pool.qsize() if pool.pool is not None else 0
+                })
+        stats['pool_totals'] = {
+            'pools': len(pools),
+            'connections_opened': sum(pool['connections_opened'] for pool in pools),
+            'requests': sum(pool['requests'] for pool in pools),
+            'idle_connections': sum(pool['idle_connections'] for pool in pools)
+        }
+        if per_host:
+            stats['pools'] = pools
+        return stats
+    
+    def close(self) -> None:
+        self.session.close()
+
+# Create a global instance
+http_client = HTTPClient()
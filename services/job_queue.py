@@ -0,0 +1,426 @@
+"""
+Job Queue Service
+
+Durable queue behind the asynchronous external API. A job is a row in
+api_jobs, so queued work survives restarts and can be shared by several
+app processes. Worker threads claim due jobs with a single conditional
+UPDATE and hold them under a lease; a failed attempt is retried with
+exponential backoff, and a job whose worker died is picked up again once its
+lease expires. Completion webhooks are delivered from the same queue with
+their own retries.
+"""
+
+import os
+import re
+import json
+import socket
+import logging
+import ipaddress
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import and_, or_
+
+from models import db, User, Summary, ApiJob, encrypt_api_key, decrypt_api_key
+from .article_extractor import ArticleExtractor
+from .llm_service import LLMService
+from .usage_meter import usage_meter
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+class JobFailed(Exception):
+    """A job error that retrying cannot fix, e.g. a URL with no extractable content"""
+
+def is_valid_callback_url(url: str) -> bool:
+    """Whether a webhook may go to url: absolute http(s) on a host that only resolves to public addresses"""
+    try:
+        parsed = urlparse(url)
+        port = parsed.port
+    except ValueError:
+        return False
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    
+    # Checked against what the host resolves to, so a name can't point the
+    # server at itself, the internal network or a cloud metadata endpoint
+    try:
+        addresses = socket.getaddrinfo(parsed.hostname, port or (443 if parsed.scheme == 'https' else 80),
+                                       proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError):
+        return False
+    return bool(addresses) and all(_is_public_address(info[4][0]) for info in addresses)
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return not (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+                or ip.is_multicast or ip.is_unspecified)
+
+class JobQueue:
+    """Database-backed job queue with leased claims, retries and webhooks"""
+    
+    def __init__(self, max_workers: Optional[int] = None, poll_interval: Optional[float] = None,
+                 lease_seconds: Optional[int] = None, max_attempts: Optional[int] = None,
+                 retry_backoff: Optional[float] = None, webhook_attempts: Optional[int] = None):
+        # 0 workers means jobs only run when work_once() is called
+        self.max_workers = max_workers if max_workers is not None else int(os.environ.get('JOB_QUEUE_WORKERS', '2'))
+        self.poll_interval = poll_interval or float(os.environ.get('JOB_QUEUE_POLL_INTERVAL', '2'))
+        self.lease_seconds = lease_seconds or int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+        self.max_attempts = max_attempts or int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.environ.get('JOB_RETRY_BACKOFF', '10'))
+        self.webhook_attempts = webhook_attempts or int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+        self.webhook_timeout = float(os.environ.get('WEBHOOK_TIMEOUT', '10'))
+        
+        self._threads = []
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+    
+    def enqueue(self, user, request_data: Dict, callback_url: Optional[str] = None) -> ApiJob:
+        """
+        Store a /v1/summarize request as a queued job
+        
+        The caller reserves the job's API call beforehand; it is refunded if
+        the job ends up failing.
+        
+        Args:
+            user: Owner of the job
+            request_data: The summarize request body
+            callback_url: URL that is POSTed the finished job
+        
+        Returns:
+            The committed ApiJob
+        """
+        request_data = dict(request_data)
+        # Provider keys sent with the request are kept encrypted, and only until the job ends
+        openai_key = request_data.pop('openai_api_key', None)
+        anthropic_key = request_data.pop('anthropic_api_key', None)
+        request_data.pop('callback_url', None)
+        request_data.pop('stream', None)
+        
+        job = ApiJob(
+            user_id=user.id,
+            request_data=json.dumps(request_data),
+            openai_api_key=encrypt_api_key(openai_key),
+            anthropic_api_key=encrypt_api_key(anthropic_key),
+            max_attempts=self.max_attempts,
+            callback_url=callback_url
+        )
+        db.session.add(job)
+        db.session.commit()
+        
+        self._wake.set()
+        return job
+    
+    def start(self, app) -> None:
+        """Start the worker threads once per process"""
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for i in range(len(self._threads), self.max_workers):
+                thread = threading.Thread(target=self._worker_loop, args=(app,),
+                                          name=f'api-job-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def work_once(self) -> bool:
+        """Run one due job or deliver one due webhook; False if there was nothing to do"""
+        job_id = self._claim_job()
+        if job_id is not None:
+            self._run_job(job_id)
+            return True
+        
+        job_id = self._claim_callback()
+        if job_id is not None:
+            self._deliver_callback(job_id)
+            return True
+        return False
+    
+    def _worker_loop(self, app) -> None:
+        while True:
+            did_work = False
+            with app.app_context():
+                try:
+                    did_work = self.work_once()
+                except Exception as e:
+                    logger.error(f"Job queue worker error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            
+            if not did_work:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+    
+    def _claim_job(self) -> Optional[int]:
+        now = datetime.utcnow()
+        due = or_(
+            and_(ApiJob.status == 'queued', ApiJob.run_after <= now),
+            # Abandoned by a worker that died mid-job
+            and_(ApiJob.status == 'running', ApiJob.locked_until < now)
+        )
+        
+        # Several workers may pick the same candidate; the conditional UPDATE lets exactly one win
+        for (job_id,) in db.session.query(ApiJob.id).filter(due).order_by(ApiJob.run_after).limit(5).all():
+            claimed = ApiJob.query.filter(ApiJob.id == job_id, due).update({
+                'status': 'running',
+                'attempts': ApiJob.attempts + 1,
+                'locked_until': now + timedelta(seconds=self.lease_seconds),
+                'started_at': db.func.coalesce(ApiJob.started_at, now)
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+    
+    def _claim_callback(self) -> Optional[int]:
+        now = datetime.utcnow()
+        due = and_(ApiJob.callback_status == 'pending', ApiJob.callback_after <= now)
+        
+        for (job_id,) in db.session.query(ApiJob.id).filter(due).order_by(ApiJob.callback_after).limit(5).all():
+            # Pushing callback_after out acts as the lease for this delivery attempt
+            claimed = ApiJob.query.filter(ApiJob.id == job_id, due).update({
+                'callback_attempts': ApiJob.callback_attempts + 1,
+                'callback_after': now + timedelta(seconds=self.lease_seconds)
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+    
+    def _run_job(self, job_id: int) -> None:
+        job = db.session.get(ApiJob, job_id)
+        # Identifies this claim; once its lease runs out and another worker claims the
+        # job, this worker's writes no longer match and are dropped
+        attempt = job.attempts
+        if attempt > job.max_attempts:
+            self._finish(job, attempt, error='Job was abandoned too many times')
+            return
+        
+        try:
+            result, summary_id = self._process(job)
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(ApiJob, job_id)
+            if isinstance(e, JobFailed) or attempt >= job.max_attempts:
+                logger.error(f"API job {job_id} failed: {str(e)}")
+                self._finish(job, attempt, error=str(e))
+            else:
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                logger.warning(f"API job {job_id} attempt {attempt} failed, retrying in {delay}s: {str(e)}")
+                self._claimed(job_id, attempt).update({
+                    'status': 'queued',
+                    'error': str(e),
+                    'locked_until': None,
+                    'run_after': datetime.utcnow() + timedelta(seconds=delay)
+                }, synchronize_session=False)
+                db.session.commit()
+            return
+        
+        self._finish(job, attempt, result=result, summary_id=summary_id)
+    
+    def _process(self, job: ApiJob):
+        """Do what /v1/summarize does for the stored request and return (result, summary id)"""
+        data = json.loads(job.request_data)
+        user = db.session.get(User, job.user_id)
+        
+        url = data.get('url')
+        text = data.get('text')
+        
+        # Extract content if URL is provided
+        if url and not text:
+            extraction_result = ArticleExtractor().extract(url)
+            if not extraction_result:
+                raise JobFailed('Failed to extract content from the provided URL')
+            extraction_error = extraction_result.get('error')
+            if extraction_error and self._fetch_may_recover(extraction_error):
+                # Timeouts, refused connections and 5xx pages may work on a later attempt
+                raise Exception(extraction_error)
+            
+            text = extraction_result.get('content')
+            if not text:
+                # Paywalls and pages without readable content won't change on a retry
+                raise JobFailed(extraction_error or 'No content could be extracted from the provided URL')
+            title = data.get('title') or extraction_result.get('title', '')
+            author = extraction_result.get('author', '')
+            publication_date = extraction_result.get('publication_date')
+        else:
+            title = data.get('title', '')
+            author = data.get('author', '')
+            publication_date = None
+        
+        if not text:
+            raise JobFailed('No content could be extracted or provided')
+        
+        length = data.get('length', user.default_length)
+        tone = data.get('tone', user.default_tone)
+        format_type = data.get('format', user.default_format)
+        model = data.get('model', user.default_model)
+        
+        llm_service = LLMService(user, decrypt_api_key(job.openai_api_key),
+                                 decrypt_api_key(job.anthropic_api_key))
+        summary_result = llm_service.generate_summary(
+            content=text,
+            length=length,
+            tone=tone,
+            format_type=format_type,
+            model=model,
+            custom_word_count=data.get('custom_word_count')
+        )
+        
+        summary_id = None
+        if data.get('save_summary', False):
+            pub_date = None
+            if isinstance(publication_date, datetime):
+                pub_date = publication_date
+            elif isinstance(publication_date, str):
+                try:
+                    pub_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
+                except ValueError:
+                    pass
+            
+            summary = Summary(
+                user_id=user.id,
+                url=url or 'API Request',
+                title=title,
+                author=author,
+                publication_date=pub_date,
+                original_text=text[:10000],  # Limit stored original text
+                summary_text=summary_result['text'],
+                length_setting=length,
+                tone_setting=tone,
+                format_setting=format_type,
+                model_used=summary_result.get('model', model),
+                word_count=summary_result['word_count']
+            )
+            db.session.add(summary)
+            db.session.flush()
+            summary_id = summary.id
+        
+        result = {
+            'summary': {
+                'text': summary_result['text'],
+                'word_count': summary_result['word_count'],
+                'id': summary_id
+            },
+            'metadata': {
+                'title': title,
+                'author': author,
+                'url': url,
+                'length': length,
+                'tone': tone,
+                'format': format_type,
+                'model': summary_result.get('model', model),
+                'timestamp': datetime.utcnow().isoformat()
+            },
+            'usage': self._usage(user.id)
+        }
+        return result, summary_id
+    
+    def _usage(self, user_id: int) -> Dict:
+        # The call was reserved when the job was queued, so this only reports it
+        usage = usage_meter.get_usage(user_id)
+        return {
+            'calls_made': usage['calls_made'],
+            'calls_remaining': usage['calls_remaining']
+        }
+    
+    @staticmethod
+    def _fetch_may_recover(error: str) -> bool:
+        if not error.startswith('Failed to fetch article'):
+            return False
+        # A 404 or 403 is the page's answer, not a hiccup; 408 and 429 are worth another go
+        client_error = re.match(r'Failed to fetch article: (4\d\d) Client Error', error)
+        return not client_error or client_error.group(1) in ('408', '429')
+    
+    def _claimed(self, job_id: int, attempt: int):
+        return ApiJob.query.filter(ApiJob.id == job_id, ApiJob.status == 'running', ApiJob.attempts == attempt)
+    
+    def _finish(self, job: ApiJob, attempt: int, result: Optional[Dict] = None, summary_id: Optional[int] = None,
+                error: Optional[str] = None) -> None:
+        now = datetime.utcnow()
+        values = {
+            'status': 'failed' if error else 'completed',
+            'result': json.dumps(result) if result is not None else None,
+            'error': error,
+            'summary_id': summary_id,
+            'locked_until': None,
+            'finished_at': now,
+            # The keys were only needed to run the job
+            'openai_api_key': None,
+            'anthropic_api_key': None
+        }
+        if job.callback_url:
+            values.update({'callback_status': 'pending', 'callback_after': now})
+        
+        # Written only if this worker still holds the job; a worker whose lease
+        # ran out must not overwrite the outcome or settle the quota twice
+        if not self._claimed(job.id, attempt).update(values, synchronize_session=False):
+            logger.warning(f"API job {job.id} attempt {attempt} finished after losing its lease; result dropped")
+            db.session.rollback()
+            return
+        db.session.commit()
+        
+        if error:
+            # Hand back the call reserved when the job was queued
+            usage_meter.refund(job.user_id, 1)
+        
+        if job.callback_url:
+            self._wake.set()
+    
+    def _deliver_callback(self, job_id: int) -> None:
+        job = db.session.get(ApiJob, job_id)
+        error = None
+        try:
+            # Checked again on delivery: the host may resolve elsewhere by now
+            if not is_valid_callback_url(job.callback_url):
+                raise Exception('Callback URL does not resolve to a public address')
+            response = http_client.request('POST', job.callback_url, json={'job': serialize_api_job(job)},
+                                           timeout=self.webhook_timeout, allow_redirects=False)
+            if not 200 <= response.status_code < 300:
+                error = f'Callback returned HTTP {response.status_code}'
+        except Exception as e:
+            error = str(e)
+        
+        if error is None:
+            job.callback_status = 'delivered'
+            job.callback_error = None
+        elif job.callback_attempts >= self.webhook_attempts:
+            logger.error(f"Giving up on callback for API job {job_id}: {error}")
+            job.callback_status = 'failed'
+            job.callback_error = error
+        else:
+            job.callback_error = error
+            job.callback_after = datetime.utcnow() + timedelta(
+                seconds=self.retry_backoff * (2 ** (job.callback_attempts - 1)))
+        db.session.commit()
+
+def serialize_api_job(job: ApiJob) -> Dict:
+    """Build the JSON payload for GET /v1/jobs/<id> and completion webhooks"""
+    data = {
+        'id': job.public_id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+    
+    if job.status == 'completed':
+        data['result'] = json.loads(job.result)
+    elif job.error:
+        # Also shown while queued for a retry, as the last attempt's error
+        data['error'] = job.error
+    
+    if job.callback_url:
+        data['callback'] = {
+            'url': job.callback_url,
+            'status': job.callback_status,
+            'attempts': job.callback_attempts
+        }
+    return data
+
+# Create a global instance
+job_queue = JobQueue()
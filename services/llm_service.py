@@ -1,38 +1,54 @@
 import openai
 import anthropic
-from .article_extractor import ArticleExtractor
+from .article_extractor import ArticleExtractor, estimate_tokens
+from .summary_cache import summary_cache
+from .provider_clients import provider_clients
+from .rate_limiter import rate_limiter
+from .provider_router import provider_router, provider_for_model, ProviderUnavailable, TIER_NAMES
+from flask import current_app, has_app_context
+import concurrent.futures
+import contextlib
+import itertools
+import threading
 import time
+import os
+
+# Maximum number of concurrent chunk summaries per provider, shared by every
+# LLMService in the process so parallel long documents can't flood a provider
+MAP_CONCURRENCY = {
+    'openai': int(os.environ.get('LLM_MAP_CONCURRENCY_OPENAI', '4')),
+    'anthropic': int(os.environ.get('LLM_MAP_CONCURRENCY_ANTHROPIC', '4'))
+}
+_provider_semaphores = {
+    provider: threading.BoundedSemaphore(limit) for provider, limit in MAP_CONCURRENCY.items()
+}
+
+# Output token cap for every summary request
+MAX_OUTPUT_TOKENS = 1000
+
+OPENAI_SYSTEM_PROMPT = "You are a professional article summarizer who creates accurate, paraphrased summaries without using direct quotes."
+
+# Map model names to Anthropic format
+ANTHROPIC_MODELS = {
+    'claude-3-sonnet': 'claude-3-5-sonnet-20241022',
+    'claude-3-haiku': 'claude-3-haiku-20240307',
+    'claude-3-opus': 'claude-3-opus-20240229'
+}
 
 class LLMService:
+    # Token budget for a single chunk or reduce step in long-content summaries
+    context_budget_tokens = int(os.environ.get('LLM_CONTEXT_BUDGET_TOKENS', '3000'))
+    
     def __init__(self, user, provided_openai_key=None, provided_anthropic_key=None):
         self.user = user
-        self.openai_client = None
-        self.anthropic_client = None
-        
-        # Determine which API keys to use (provided keys take precedence)
-        openai_key = provided_openai_key or user.get_openai_key()
-        anthropic_key = provided_anthropic_key or user.get_anthropic_key()
-        
-        # Initialize clients based on available API keys
-        if openai_key:
-            try:
-                self.openai_client = openai.OpenAI(
-                    api_key=openai_key,
-                    timeout=60.0,
-                    max_retries=2
-                )
-            except Exception as e:
-                print(f"Failed to initialize OpenAI client: {e}")
-        
-        if anthropic_key:
-            try:
-                self.anthropic_client = anthropic.Anthropic(
-                    api_key=anthropic_key,
-                    timeout=60.0,
-                    max_retries=2
-                )
-            except Exception as e:
-                print(f"Failed to initialize Anthropic client: {e}")
+        
+        # Reuse cached clients (provided keys take precedence); keys are only
+        # decrypted and clients only built the first time a key is seen
+        self.openai_client = provider_clients.get_client('openai', user, provided_openai_key)
+        self.anthropic_client = provider_clients.get_client('anthropic', user, provided_anthropic_key)
+        
+        # Provider model the last stream_summary call used, for callers to record
+        self.stream_model = None
     
     def generate_summary(self, content, length='standard', tone='neutral', 
                         format_type='prose', model='gpt-3.5-turbo', custom_word_count=None):
@@ -43,41 +59,146 @@ class LLMService:
             # Build the prompt
             prompt = self._build_prompt(content, length, tone, format_type, custom_word_count)
             
-            # Generate summary based on model
-            if model.startswith('gpt'):
-                if not self.openai_client:
-                    raise Exception("OpenAI API key not configured")
-                summary_text = self._generate_openai_summary(prompt, model)
-            elif model.startswith('claude'):
-                if not self.anthropic_client:
-                    raise Exception("Anthropic API key not configured")
-                summary_text = self._generate_anthropic_summary(prompt, model)
-            else:
-                raise Exception(f"Unsupported model: {model}")
+            # Return a cached summary if this content was already summarized with the same settings
+            cache_key = summary_cache.make_key(content, length, tone, format_type, model,
+                                               self._target_word_count(length, custom_word_count))
+            cached = summary_cache.get(cache_key)
+            if cached:
+                return {
+                    'text': cached['text'],
+                    'word_count': cached['word_count'],
+                    'model': cached['model'] or model,
+                    'cached': True
+                }
+            
+            # Generate summary, failing over between the provider models the request routes to
+            summary_text, used_model = provider_router.generate(
+                self._route(model),
+                lambda candidate: self._generate_with_model(prompt, candidate)
+            )
             
             # Calculate word count
             word_count = len(summary_text.split())
             
+            summary_cache.set(cache_key, summary_text, word_count, used_model)
+            
             return {
                 'text': summary_text,
-                'word_count': word_count
+                'word_count': word_count,
+                'model': used_model
             }
+        
+        except Exception as e:
+            raise Exception(f"Summary generation failed: {str(e)}")
+    
+    def stream_summary(self, content, length='standard', tone='neutral',
+                       format_type='prose', model='gpt-3.5-turbo', custom_word_count=None):
+        """
+        Generate a summary like generate_summary, yielding the text as it arrives
+        
+        A cached summary is yielded in one piece; a streamed one is cached once
+        the provider has finished. The model that produced it is left in
+        self.stream_model.
+        """
+        try:
+            prompt = self._build_prompt(content, length, tone, format_type, custom_word_count)
+            
+            cache_key = summary_cache.make_key(content, length, tone, format_type, model,
+                                               self._target_word_count(length, custom_word_count))
+            cached = summary_cache.get(cache_key)
+            if cached:
+                self.stream_model = cached['model'] or model
+                yield cached['text']
+                return
+            
+            # A stream can't fail over midway, so only opening it fails over
+            deltas, self.stream_model = provider_router.open_stream(
+                self._route(model),
+                lambda candidate: self._open_stream(prompt, candidate)
+            )
+            
+            parts = []
+            for delta in deltas:
+                parts.append(delta)
+                yield delta
+            
+            summary_text = ''.join(parts).strip()
+            if not summary_text:
+                raise Exception("Empty response from provider")
+            summary_cache.set(cache_key, summary_text, len(summary_text.split()), self.stream_model)
             
         except Exception as e:
             raise Exception(f"Summary generation failed: {str(e)}")
     
-    def _build_prompt(self, content, length, tone, format_type, custom_word_count):
+    def _route(self, model):
         """
-        Build the prompt for summary generation
+        Provider models to try for a model or tier, limited to providers with a key
+        """
+        if not provider_router.is_tier(model):
+            return provider_router.route(model)
+        
+        providers = [provider for provider, client in (('openai', self.openai_client),
+                                                       ('anthropic', self.anthropic_client)) if client]
+        models = provider_router.route(model, providers)
+        if not models:
+            raise Exception(f"No API key configured for any model in {model}")
+        return models
+    
+    def _generate_with_model(self, prompt, model):
+        """
+        Generate summary text with one concrete provider model
+        """
+        if model.startswith('gpt'):
+            if not self.openai_client:
+                raise Exception("OpenAI API key not configured")
+            return self._generate_openai_summary(prompt, model)
+        elif model.startswith('claude'):
+            if not self.anthropic_client:
+                raise Exception("Anthropic API key not configured")
+            return self._generate_anthropic_summary(prompt, model)
+        raise Exception(f"Unsupported model: {model}")
+    
+    def _open_stream(self, prompt, model):
+        """
+        Open a summary stream on one concrete provider model
+        
+        The first delta is read here so connection errors surface while the
+        request can still fail over.
+        """
+        if model.startswith('gpt'):
+            if not self.openai_client:
+                raise Exception("OpenAI API key not configured")
+            deltas = self._stream_openai_summary(prompt, model)
+        elif model.startswith('claude'):
+            if not self.anthropic_client:
+                raise Exception("Anthropic API key not configured")
+            deltas = self._stream_anthropic_summary(prompt, model)
+        else:
+            raise Exception(f"Unsupported model: {model}")
+        
+        first = next(deltas, None)
+        if first is None:
+            return iter(())
+        return itertools.chain([first], deltas)
+    
+    def _target_word_count(self, length, custom_word_count):
+        """
+        Resolve the target summary length in words
         """
-        # Determine target word count
         word_count_map = {
             'brief': 100,
             'standard': 250,
             'in_depth': 500
         }
         
-        target_words = custom_word_count if custom_word_count else word_count_map.get(length, 250)
+        return custom_word_count if custom_word_count else word_count_map.get(length, 250)
+    
+    def _build_prompt(self, content, length, tone, format_type, custom_word_count):
+        """
+        Build the prompt for summary generation
+        """
+        # Determine target word count
+        target_words = self._target_word_count(length, custom_word_count)
         
         # Tone instructions
         tone_instructions = {
@@ -120,15 +241,21 @@ SUMMARY:"""
             if not self.openai_client:
                 raise Exception("OpenAI client not initialized. Please check your API key.")
             
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a professional article summarizer who creates accurate, paraphrased summaries without using direct quotes."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1000,
-                timeout=60.0
+            # Queued behind the key's request and token budgets; 429s wait out Retry-After
+            response = rate_limiter.call(
+                'openai', self.openai_client.api_key, model,
+                self._estimate_request_tokens(OPENAI_SYSTEM_PROMPT + prompt),
+                lambda: self.openai_client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    timeout=60.0
+                ),
+                usage=lambda response: response.usage.total_tokens if response.usage else None
             )
             
             if not response.choices or not response.choices[0].message.content:
@@ -140,6 +267,9 @@ SUMMARY:"""
             raise Exception("Invalid OpenAI API key. Please check your API key in Settings.")
         except openai.RateLimitError:
             raise Exception("OpenAI rate limit exceeded. Please try again later.")
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            # Timeouts, unreachable API and 5xx count against the provider's circuit
+            raise ProviderUnavailable(f"OpenAI API unavailable: {str(e)}")
         except openai.APIError as e:
             raise Exception(f"OpenAI API error: {str(e)}")
         except Exception as e:
@@ -153,23 +283,22 @@ SUMMARY:"""
             if not self.anthropic_client:
                 raise Exception("Anthropic client not initialized. Please check your API key.")
             
-            # Map model names to Anthropic format
-            model_map = {
-                'claude-3-sonnet': 'claude-3-5-sonnet-20241022',
-                'claude-3-haiku': 'claude-3-haiku-20240307',
-                'claude-3-opus': 'claude-3-opus-20240229'
-            }
-            
-            anthropic_model = model_map.get(model, 'claude-3-5-sonnet-20241022')
+            anthropic_model = ANTHROPIC_MODELS.get(model, 'claude-3-5-sonnet-20241022')
             
-            response = self.anthropic_client.messages.create(
-                model=anthropic_model,
-                max_tokens=1000,
-                temperature=0.3,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                timeout=60.0
+            response = rate_limiter.call(
+                'anthropic', self.anthropic_client.api_key, anthropic_model,
+                self._estimate_request_tokens(prompt),
+                lambda: self.anthropic_client.messages.create(
+                    model=anthropic_model,
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    temperature=0.3,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    timeout=60.0
+                ),
+                usage=lambda response: (response.usage.input_tokens + response.usage.output_tokens
+                                        if getattr(response, 'usage', None) else None)
             )
             
             if not response.content or not response.content[0].text:
@@ -181,40 +310,156 @@ SUMMARY:"""
             raise Exception("Invalid Anthropic API key. Please check your API key in Settings.")
         except anthropic.RateLimitError:
             raise Exception("Anthropic rate limit exceeded. Please try again later.")
+        except (anthropic.APIConnectionError, anthropic.InternalServerError) as e:
+            raise ProviderUnavailable(f"Anthropic API unavailable: {str(e)}")
         except anthropic.APIError as e:
             raise Exception(f"Anthropic API error: {str(e)}")
         except Exception as e:
             raise Exception(f"Anthropic request failed: {str(e)}")
     
+    def _estimate_request_tokens(self, prompt):
+        """
+        Tokens a request counts against a tokens/minute limit: the prompt plus the output cap
+        """
+        return estimate_tokens(prompt) + MAX_OUTPUT_TOKENS
+    
+    def _stream_openai_summary(self, prompt, model):
+        """
+        Stream summary text deltas from OpenAI
+        """
+        try:
+            # The output is charged at the estimate; the call stays in flight until the stream ends
+            stream = rate_limiter.call(
+                'openai', self.openai_client.api_key, model,
+                self._estimate_request_tokens(OPENAI_SYSTEM_PROMPT + prompt),
+                lambda: self.openai_client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    timeout=60.0,
+                    stream=True
+                ),
+                stream=True
+            )
+            
+            with stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        
+        except openai.AuthenticationError:
+            raise Exception("Invalid OpenAI API key. Please check your API key in Settings.")
+        except openai.RateLimitError:
+            raise Exception("OpenAI rate limit exceeded. Please try again later.")
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise ProviderUnavailable(f"OpenAI API unavailable: {str(e)}")
+        except openai.APIError as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+    
+    def _stream_anthropic_summary(self, prompt, model):
+        """
+        Stream summary text deltas from Anthropic Claude
+        """
+        try:
+            anthropic_model = ANTHROPIC_MODELS.get(model, 'claude-3-5-sonnet-20241022')
+            stream = rate_limiter.call(
+                'anthropic', self.anthropic_client.api_key, anthropic_model,
+                self._estimate_request_tokens(prompt),
+                lambda: self.anthropic_client.messages.create(
+                    model=anthropic_model,
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    temperature=0.3,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    timeout=60.0,
+                    stream=True
+                ),
+                stream=True
+            )
+            
+            with stream:
+                for event in stream:
+                    if event.type == 'content_block_delta' and getattr(event.delta, 'text', None):
+                        yield event.delta.text
+        
+        except anthropic.AuthenticationError:
+            raise Exception("Invalid Anthropic API key. Please check your API key in Settings.")
+        except anthropic.RateLimitError:
+            raise Exception("Anthropic rate limit exceeded. Please try again later.")
+        except (anthropic.APIConnectionError, anthropic.InternalServerError) as e:
+            raise ProviderUnavailable(f"Anthropic API unavailable: {str(e)}")
+        except anthropic.APIError as e:
+            raise Exception(f"Anthropic API error: {str(e)}")
+    
     def generate_summary_for_long_content(self, content, **kwargs):
         """
         Handle long content by chunking and summarizing
+        
+        Chunks are summarized concurrently (map), then the chunk summaries are
+        combined into the final summary (reduce). If the combined summaries
+        still exceed the context budget they are reduced hierarchically.
         """
         extractor = ArticleExtractor()
-        chunks = extractor.chunk_content(content)
+        chunks = extractor.chunk_content(content, max_tokens=self.context_budget_tokens)
         
-        if len(chunks) == 1:
+        if len(chunks) <= 1:
             # Content fits in one chunk
             return self.generate_summary(content, **kwargs)
         
-        # Multi-chunk processing
-        chunk_summaries = []
-        for i, chunk in enumerate(chunks):
-            chunk_summary = self.generate_summary(
-                chunk, 
-                length='brief',  # Use brief for chunk summaries
-                tone=kwargs.get('tone', 'neutral'),
-                format_type='prose',
-                model=kwargs.get('model', 'gpt-3.5-turbo')
-            )
-            chunk_summaries.append(chunk_summary['text'])
+        model = kwargs.get('model', 'gpt-3.5-turbo')
+        tone = kwargs.get('tone', 'neutral')
         
-        # Combine chunk summaries
+        # Map: summarize every chunk in parallel
+        chunk_summaries = self._summarize_chunks(chunks, model, tone)
         combined_content = '\n\n'.join(chunk_summaries)
         
+        # Reduce hierarchically until the combined summaries fit the budget
+        while True:
+            groups = extractor.chunk_content(combined_content, max_tokens=self.context_budget_tokens)
+            if len(groups) <= 1 or len(groups) >= len(chunk_summaries):
+                break
+            chunk_summaries = self._summarize_chunks(groups, model, tone)
+            combined_content = '\n\n'.join(chunk_summaries)
+        
         # Generate final summary
         return self.generate_summary(combined_content, **kwargs)
     
+    def _summarize_chunks(self, chunks, model, tone):
+        """
+        Summarize chunks concurrently, bounded by the provider's concurrency cap
+        """
+        provider = self._provider_for_model(model)
+        semaphore = _provider_semaphores.get(provider)
+        max_workers = max(1, min(len(chunks), MAP_CONCURRENCY.get(provider, 1)))
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def summarize_chunk(chunk):
+            with contextlib.ExitStack() as stack:
+                if app is not None:
+                    stack.enter_context(app.app_context())
+                if semaphore is not None:
+                    stack.enter_context(semaphore)
+                return self.generate_summary(
+                    chunk,
+                    length='brief',  # Use brief for chunk summaries
+                    tone=tone,
+                    format_type='prose',
+                    model=model
+                )['text']
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() preserves chunk order in the results
+            return list(executor.map(summarize_chunk, chunks))
+    
+    def _provider_for_model(self, model):
+        # A tier's chunks go to the provider of its first model
+        return provider_for_model(self._route(model)[0])
+    
     def get_available_models(self):
         """
         Get list of available models based on configured API keys
@@ -236,4 +481,10 @@ SUMMARY:"""
                 {'id': 'claude-3-opus', 'name': 'Claude 3 Opus', 'provider': 'Anthropic'}
             ])
         
+        # Tiers fail over between whichever of their providers have keys
+        if self.openai_client or self.anthropic_client:
+            for tier, name in TIER_NAMES.items():
+                if provider_router.is_tier(tier):
+                    models.append({'id': tier, 'name': name, 'provider': 'Auto'})
+        
         return models
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Pagination Service
+
+Keyset (cursor) pagination. Instead of OFFSET, each page continues from the
+sort key of the last row the client saw, so with a matching index every page
+costs the same as the first. Cursors are opaque URL-safe tokens, and exact
+totals are only counted when something asks for them.
+"""
+
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import operators
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token is malformed or belongs to another ordering"""
+
+def encode_cursor(direction: str, values: List) -> str:
+    """Pack a page direction and sort key values into an opaque token"""
+    payload = [direction, [{'dt': value.isoformat()} if isinstance(value, datetime) else value
+                           for value in values]]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token: str):
+    """Unpack a token made by encode_cursor into (direction, values)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(raw.decode('utf-8'))
+        values = [datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+                  for value in values]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid pagination cursor')
+    
+    if direction not in ('next', 'prev'):
+        raise InvalidCursor('Invalid pagination cursor')
+    return direction, values
+
+class KeysetPage:
+    """One page of results plus the cursors for its neighbours"""
+    
+    def __init__(self, query, items: List, per_page: int, next_cursor: Optional[str],
+                 prev_cursor: Optional[str]):
+        self._query = query
+        self._total = None
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+    
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+    
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+    
+    @property
+    def total(self) -> int:
+        """Exact number of matching rows, counted on first access"""
+        if self._total is None:
+            self._total = self._query.order_by(None).count()
+        return self._total
+    
+    def to_dict(self, include_total: bool = False) -> dict:
+        data = {
+            'per_page': self.per_page,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev
+        }
+        if include_total:
+            data['total'] = self.total
+        return data
+
+def keyset_paginate(query, order_by: List, cursor: Optional[str] = None, per_page: int = 20) -> KeysetPage:
+    """
+    Fetch one page of an ORM query in a fixed order
+    
+    Args:
+        query: Filtered, unordered query
+        order_by: ORDER BY clauses, e.g. [Model.created_at.desc(), Model.id.desc()];
+            the last one must make the order unique
+        cursor: Token from a previous page's next_cursor / prev_cursor
+        per_page: Rows per page
+    
+    Raises:
+        InvalidCursor: If the cursor cannot be decoded for this ordering
+    """
+    keys = [(clause.element, clause.modifier is operators.desc_op) for clause in order_by]
+    direction, values = decode_cursor(cursor) if cursor else ('next', None)
+    backward = direction == 'prev'
+    if values is not None and len(values) != len(keys):
+        raise InvalidCursor('Invalid pagination cursor')
+    
+    # Walking backwards reads the reversed order and flips the page afterwards
+    ordering = [element.desc() if descending != backward else element.asc() for element, descending in keys]
+    page_query = query.add_columns(*[element.label(f'_page_key_{i}') for i, (element, _) in enumerate(keys)])
+    if values is not None:
+        page_query = page_query.filter(_after(keys, values, backward))
+    
+    rows = page_query.order_by(*ordering).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+    
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = list(rows[0][1:]), list(rows[-1][1:])
+        if backward:
+            # A backward step always came from a later page
+            next_cursor = encode_cursor('next', last)
+            prev_cursor = encode_cursor('prev', first) if has_more else None
+        else:
+            next_cursor = encode_cursor('next', last) if has_more else None
+            prev_cursor = encode_cursor('prev', first) if values is not None else None
+    
+    return KeysetPage(query, [row[0] for row in rows], per_page, next_cursor, prev_cursor)
+
+def _after(keys, values, backward: bool):
+    """Rows that sort strictly after the key values in the (possibly reversed) order"""
+    clauses = []
+    for i, (element, descending) in enumerate(keys):
+        earlier_equal = [keys[j][0] == values[j] for j in range(i)]
+        if descending != backward:
+            clauses.append(and_(*earlier_equal, element < values[i]))
+        else:
+            clauses.append(and_(*earlier_equal, element > values[i]))
+    
+    # A plain range on the leading key lets the index seek straight to the page
+    element, descending = keys[0]
+    bound = element <= values[0] if descending != backward else element >= values[0]
+    return and_(bound, or_(*clauses))
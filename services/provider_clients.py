@@ -0,0 +1,127 @@
+"""
+Provider Client Registry
+
+Process-wide cache of OpenAI and Anthropic clients. Clients are keyed by
+user, provider and a fingerprint of the stored (still encrypted) key, so a
+cache hit needs neither a decrypt nor a new client. Every client shares one
+httpx connection pool, which keeps provider connections warm across
+requests. Entries expire after a TTL and are dropped when a user changes
+their keys.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+import openai
+import anthropic
+
+# Per provider: the User column holding the encrypted key and the getter that decrypts it
+PROVIDER_KEYS = {
+    'openai': ('openai_api_key', 'get_openai_key'),
+    'anthropic': ('anthropic_api_key', 'get_anthropic_key')
+}
+
+class ProviderClientRegistry:
+    """TTL cache of provider SDK clients over a shared connection pool"""
+    
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                 max_connections: Optional[int] = None):
+        self.ttl = ttl_seconds if ttl_seconds is not None else float(os.environ.get('PROVIDER_CLIENT_TTL', '900'))
+        self.max_entries = max_entries or int(os.environ.get('PROVIDER_CLIENT_CACHE_SIZE', '1000'))
+        self.max_connections = max_connections or int(os.environ.get('PROVIDER_MAX_CONNECTIONS', '100'))
+        
+        self._http_client = None
+        # (user id, provider, key fingerprint) -> (client, expires), oldest first
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    
+    def get_client(self, provider: str, user, provided_key: Optional[str] = None):
+        """
+        Return a client for the provider, or None if the user has no key for it
+        
+        Args:
+            provider: 'openai' or 'anthropic'
+            user: User whose stored key is used when no key is provided
+            provided_key: Plaintext key sent with the request; takes precedence
+        """
+        column, getter = PROVIDER_KEYS[provider]
+        if provided_key:
+            fingerprint = 'provided:' + hashlib.sha256(provided_key.encode('utf-8')).hexdigest()
+        else:
+            stored = getattr(user, column)
+            if not stored:
+                return None
+            # Fingerprint the ciphertext so a hit skips decryption entirely
+            fingerprint = 'stored:' + hashlib.sha256(stored.encode('utf-8')).hexdigest()
+        
+        cache_key = (user.id, provider, fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(cache_key)
+            if entry is not None and entry[1] > now:
+                self._clients.move_to_end(cache_key)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+        
+        api_key = provided_key or getattr(user, getter)()
+        client = self._build_client(provider, api_key)
+        if client is None:
+            return None
+        
+        with self._lock:
+            self._clients[cache_key] = (client, now + self.ttl)
+            self._clients.move_to_end(cache_key)
+            while len(self._clients) > self.max_entries:
+                self._clients.popitem(last=False)
+        return client
+    
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached client for a user, e.g. after their keys changed"""
+        with self._lock:
+            stale = [key for key in self._clients if key[0] == user_id]
+            for key in stale:
+                del self._clients[key]
+            self._stats['invalidations'] += len(stale)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['clients'] = len(self._clients)
+        return stats
+    
+    def _shared_http_client(self) -> httpx.Client:
+        with self._lock:
+            if self._http_client is None:
+                self._http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                    timeout=60.0,
+                    follow_redirects=True
+                )
+            return self._http_client
+    
+    def _build_client(self, provider: str, api_key: str):
+        http_client = self._shared_http_client()
+        try:
+            # No SDK retries: rate_limiter retries 429s against its buckets and
+            # provider_router fails over on connection errors and 5xx responses
+            if provider == 'openai':
+                return openai.OpenAI(api_key=api_key, timeout=60.0, max_retries=0, http_client=http_client)
+            return anthropic.Anthropic(api_key=api_key, timeout=60.0, max_retries=0, http_client=http_client)
+        except Exception as e:
+            print(f"Failed to initialize {provider} client: {e}")
+            return None
+
+# Create a global instance
+provider_clients = ProviderClientRegistry()
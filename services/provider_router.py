@@ -0,0 +1,293 @@
+"""
+Provider Router Service
+
+Routes summary requests across OpenAI and Anthropic. A logical model tier
+("auto-fast", "auto-balanced", "auto-best") maps to an ordered list of
+provider models; a request that fails on one moves on to the next. With
+hedging on, a request still running after its model's p95 latency gets a
+second one started alongside it, and whichever succeeds first wins. A
+per-provider circuit breaker stops traffic to a provider after repeated
+timeouts, connection errors or 5xx responses, and lets a single trial
+request through once it has cooled down.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import concurrent.futures
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ordered provider models for each tier; override with MODEL_TIERS (same JSON shape)
+DEFAULT_MODEL_TIERS = {
+    'auto-fast': ['gpt-3.5-turbo', 'claude-3-haiku'],
+    'auto-balanced': ['gpt-4o', 'claude-3-sonnet'],
+    'auto-best': ['gpt-4-turbo', 'claude-3-opus']
+}
+
+TIER_NAMES = {
+    'auto-fast': 'Auto (fast)',
+    'auto-balanced': 'Auto (balanced)',
+    'auto-best': 'Auto (best)'
+}
+
+class ProviderUnavailable(Exception):
+    """A provider timed out, could not be reached or answered with a 5xx"""
+
+def provider_for_model(model: str) -> Optional[str]:
+    if model.startswith('gpt'):
+        return 'openai'
+    if model.startswith('claude'):
+        return 'anthropic'
+    return None
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open trial after a cool-down"""
+    
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a request may be sent now; in half-open state only one trial at a time"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit opened after {self.failures} provider failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+class ProviderRouter:
+    """Failover, hedging and circuit breaking for provider calls"""
+    
+    def __init__(self, tiers: Optional[Dict[str, List[str]]] = None, hedge: Optional[bool] = None,
+                 hedge_delay: Optional[float] = None, failure_threshold: Optional[int] = None,
+                 reset_seconds: Optional[float] = None):
+        self.tiers = tiers or json.loads(os.environ.get('MODEL_TIERS', 'null')) or DEFAULT_MODEL_TIERS
+        self.hedge = hedge if hedge is not None else os.environ.get('LLM_HEDGE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+        # Used until a model has enough samples for a p95
+        self.hedge_delay = hedge_delay or float(os.environ.get('LLM_HEDGE_DELAY', '15'))
+        self.failure_threshold = failure_threshold or int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+        self.reset_seconds = reset_seconds or float(os.environ.get('CIRCUIT_RESET_SECONDS', '30'))
+        
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # model -> recent successful latencies in seconds
+        self._latencies: Dict[str, deque] = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'failovers': 0, 'hedges': 0, 'hedge_wins': 0, 'short_circuited': 0}
+    
+    def is_tier(self, model: str) -> bool:
+        return model in self.tiers
+    
+    def route(self, model: str, providers: Optional[List[str]] = None) -> List[str]:
+        """
+        Provider models to try for a requested model, in order
+        
+        Args:
+            model: A tier name or a concrete model
+            providers: Providers the caller has clients for; others are left out
+        """
+        models = self.tiers.get(model, [model])
+        if providers is not None:
+            models = [m for m in models if provider_for_model(m) in providers]
+        return models
+    
+    def generate(self, models: List[str], call: Callable[[str], str]) -> Tuple[str, str]:
+        """
+        Run call(model) on the first model that succeeds
+        
+        Returns:
+            (result, model that produced it)
+        
+        Raises:
+            Exception: If every model failed or was short-circuited; a single
+                failure is re-raised unchanged
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+        
+        if self.hedge:
+            return self._generate_hedged(models, call)
+        return self._generate_in_order(models, call)
+    
+    def open_stream(self, models: List[str], open_stream: Callable[[str], object]) -> Tuple[object, str]:
+        """
+        Run open_stream(model) on the first model whose stream opens
+        
+        Opening fails over and feeds the circuit breakers like generate, but is
+        never hedged: a stream can't be raced or resumed midway. Time to first
+        token isn't counted as the model's latency.
+        
+        Returns:
+            (stream, model that opened it)
+        """
+        with self._lock:
+            self._stats['requests'] += 1
+        return self._generate_in_order(models, open_stream, timed=False)
+    
+    def breaker(self, model: str) -> CircuitBreaker:
+        provider = provider_for_model(model) or model
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+            return breaker
+    
+    def hedge_after(self, model: str) -> float:
+        """Seconds to wait on a request to model before hedging: its p95 latency"""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < 20:
+            return self.hedge_delay
+        return samples[int(len(samples) * 0.95) - 1]
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['circuits'] = {provider: breaker.state for provider, breaker in self._breakers.items()}
+        return stats
+    
+    def _generate_in_order(self, models: List[str], call: Callable[[str], str], timed: bool = True) -> Tuple[str, str]:
+        errors = []
+        for model in models:
+            if not self.breaker(model).allow():
+                self._short_circuited(model, errors)
+                continue
+            if errors:
+                with self._lock:
+                    self._stats['failovers'] += 1
+            try:
+                return self._attempt(model, call, timed), model
+            except Exception as e:
+                errors.append((model, e))
+        raise self._all_failed(errors)
+    
+    def _generate_hedged(self, models: List[str], call: Callable[[str], str]) -> Tuple[str, str]:
+        queue = list(models)
+        pending = {}
+        errors = []
+        hedged = False
+        
+        def launch() -> bool:
+            while queue:
+                model = queue.pop(0)
+                if not self.breaker(model).allow():
+                    self._short_circuited(model, errors)
+                    continue
+                pending[self._get_executor().submit(self._attempt, model, call)] = model
+                return True
+            return False
+        
+        launch()
+        primary = next(iter(pending), None)
+        while pending:
+            timeout = None
+            if not hedged:
+                timeout = self.hedge_after(next(iter(pending.values())))
+            done, _ = concurrent.futures.wait(pending, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                # Slower than usual: race a second request, on the same model if there's no other
+                hedged = True
+                if not queue:
+                    queue.append(next(iter(pending.values())))
+                if launch():
+                    with self._lock:
+                        self._stats['hedges'] += 1
+                continue
+            
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append((model, e))
+                    continue
+                if future is not primary:
+                    with self._lock:
+                        self._stats['hedge_wins'] += 1
+                # The loser keeps running in the background; its outcome still feeds the stats
+                return result, model
+            
+            if not pending:
+                if queue:
+                    with self._lock:
+                        self._stats['failovers'] += 1
+                launch()
+                primary = next(iter(pending), None)
+        raise self._all_failed(errors)
+    
+    def _attempt(self, model: str, call: Callable[[str], str], timed: bool = True) -> str:
+        breaker = self.breaker(model)
+        started = time.monotonic()
+        try:
+            result = call(model)
+        except ProviderUnavailable:
+            breaker.record_failure()
+            raise
+        except Exception:
+            # The provider answered, even if it rejected this request
+            breaker.record_success()
+            raise
+        
+        breaker.record_success()
+        if not timed:
+            return result
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=200)).append(time.monotonic() - started)
+        return result
+    
+    def _short_circuited(self, model: str, errors: List) -> None:
+        with self._lock:
+            self._stats['short_circuited'] += 1
+        errors.append((model, ProviderUnavailable(f'{provider_for_model(model) or model} is unavailable (circuit open)')))
+    
+    def _all_failed(self, errors: List) -> Exception:
+        if len(errors) == 1:
+            return errors[0][1]
+        if not errors:
+            return Exception('No model available for this request')
+        return Exception('All providers failed: ' + '; '.join(f'{model}: {error}' for model, error in errors))
+    
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        # Created lazily so importing the module doesn't spawn threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('LLM_HEDGE_WORKERS', '32')),
+                    thread_name_prefix='llm-request'
+                )
+            return self._executor
+
+# Create a global instance
+provider_router = ProviderRouter()
@@ -0,0 +1,258 @@
+"""
+Rate Limiter Service
+
+Client-side limits for AI provider calls. Every (provider, API key, model)
+gets a requests/minute and a tokens/minute token bucket plus a cap on calls
+in flight. A call reserves its request and its estimated tokens up front and
+sleeps until both buckets cover it, so callers queue in arrival order instead
+of failing. A 429 from the provider pauses the bucket for its Retry-After and
+the call is queued again; the token estimate is corrected with the usage the
+provider reports.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import email.utils
+from typing import Callable, Dict, Optional
+
+import openai
+import anthropic
+
+RATE_LIMIT_ERRORS = (openai.RateLimitError, anthropic.RateLimitError)
+
+# Defaults per provider; set them to your account's tier
+DEFAULT_LIMITS = {
+    'openai': {
+        'rpm': int(os.environ.get('OPENAI_RPM', '500')),
+        'tpm': int(os.environ.get('OPENAI_TPM', '150000')),
+        'concurrency': int(os.environ.get('OPENAI_MAX_CONCURRENCY', '32'))
+    },
+    'anthropic': {
+        'rpm': int(os.environ.get('ANTHROPIC_RPM', '50')),
+        'tpm': int(os.environ.get('ANTHROPIC_TPM', '40000')),
+        'concurrency': int(os.environ.get('ANTHROPIC_MAX_CONCURRENCY', '8'))
+    }
+}
+
+class RateLimitQueueFull(Exception):
+    """Raised when a call would have to wait longer than the limiter's max wait"""
+
+class _Bucket:
+    """Continuously refilled bucket that may go into debt to queue reservations"""
+    
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def take(self, amount: float, now: float) -> float:
+        """Reserve amount and return how many seconds until it is covered"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+    
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+class _Limit:
+    def __init__(self, rpm: int, tpm: int, concurrency: int):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.in_flight = threading.BoundedSemaphore(concurrency)
+        self.paused_until = 0.0
+
+class _HeldStream:
+    """Streamed response that keeps its call's in-flight slot until it is exhausted or closed"""
+    
+    def __init__(self, response, release: Callable):
+        self._response = response
+        self._iterator = iter(response)
+        self._release = release
+        self._released = False
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        try:
+            close = getattr(self._response, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+    
+    def __del__(self):
+        # Last resort for a stream dropped without being read to the end
+        self.close()
+
+class ProviderRateLimiter:
+    """Token-bucket limiter and concurrency governor for provider API calls"""
+    
+    def __init__(self, limits: Optional[Dict] = None, max_wait: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        self.limits = {provider: dict(values) for provider, values in DEFAULT_LIMITS.items()}
+        # Per-model overrides, e.g. PROVIDER_RATE_LIMITS={"gpt-4": {"tpm": 40000}}
+        self.model_limits = json.loads(os.environ.get('PROVIDER_RATE_LIMITS', '{}'))
+        for provider, values in (limits or {}).items():
+            self.limits.setdefault(provider, {}).update(values)
+        self.max_wait = max_wait if max_wait is not None else float(os.environ.get('RATE_LIMIT_MAX_WAIT', '120'))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('RATE_LIMIT_MAX_RETRIES', '5'))
+        
+        # (provider, key fingerprint, model) -> _Limit
+        self._entries: Dict[tuple, _Limit] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'queued': 0, 'wait_seconds': 0.0, 'rate_limited': 0, 'rejected': 0}
+    
+    def call(self, provider: str, api_key: str, model: str, tokens: int, request: Callable,
+             usage: Optional[Callable] = None, stream: bool = False):
+        """
+        Run a provider request once the limits allow it
+        
+        Args:
+            provider: 'openai' or 'anthropic'
+            api_key: Key the request is sent with; limits are tracked per key
+            model: Model name; limits are tracked per model
+            tokens: Estimated tokens for the request (prompt plus max output)
+            request: Zero-argument function that sends the request
+            usage: Optional function returning the tokens a response actually used
+            stream: The response is a stream; it is returned wrapped so the call
+                counts as in flight until the stream is read to the end or closed
+        
+        Raises:
+            RateLimitQueueFull: If the call would wait longer than max_wait
+            openai.RateLimitError / anthropic.RateLimitError: After max_retries 429s
+        """
+        entry = self._entry(provider, api_key, model)
+        attempt = 0
+        while True:
+            reserved = self._wait_turn(entry, tokens)
+            try:
+                response = request()
+            except RATE_LIMIT_ERRORS as e:
+                entry.in_flight.release()
+                attempt += 1
+                with self._lock:
+                    self._stats['rate_limited'] += 1
+                if attempt > self.max_retries:
+                    raise
+                # The provider knows best when capacity is back; fall back to exponential backoff
+                delay = _retry_after(e) or min(2.0 ** attempt, 60.0)
+                with self._lock:
+                    # The rejected attempt used none of its reservation; the retry reserves again
+                    entry.requests.give_back(1)
+                    entry.tokens.give_back(reserved)
+                    entry.paused_until = max(entry.paused_until, time.monotonic() + delay)
+                continue
+            except BaseException:
+                entry.in_flight.release()
+                raise
+            
+            if stream:
+                return _HeldStream(response, entry.in_flight.release)
+            entry.in_flight.release()
+            
+            actual = usage(response) if usage is not None else None
+            if actual is not None:
+                with self._lock:
+                    # Settle the estimate against what the provider counted
+                    if actual < reserved:
+                        entry.tokens.give_back(reserved - actual)
+                    else:
+                        entry.tokens.take(actual - reserved, time.monotonic())
+            return response
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['buckets'] = len(self._entries)
+        return stats
+    
+    def _entry(self, provider: str, api_key: str, model: str) -> _Limit:
+        # Keys are only held as fingerprints
+        key = (provider, hashlib.sha256((api_key or '').encode('utf-8')).hexdigest(), model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                limits = dict(self.limits[provider])
+                limits.update(self.model_limits.get(model, {}))
+                entry = self._entries[key] = _Limit(limits['rpm'], limits['tpm'], limits['concurrency'])
+            return entry
+    
+    def _wait_turn(self, entry: _Limit, tokens: int) -> float:
+        """Reserve a request and tokens, sleep until they are covered and return the tokens reserved"""
+        started = time.monotonic()
+        with self._lock:
+            now = time.monotonic()
+            # A single request larger than the bucket would never fit; let it take the whole bucket
+            tokens = min(tokens, entry.tokens.capacity)
+            wait = max(entry.requests.take(1, now), entry.tokens.take(tokens, now), entry.paused_until - now)
+            if wait > self.max_wait:
+                entry.requests.give_back(1)
+                entry.tokens.give_back(tokens)
+                self._stats['rejected'] += 1
+                raise RateLimitQueueFull(f'Provider rate limit queue is full; next slot in {wait:.0f}s')
+            self._stats['calls'] += 1
+            if wait > 0:
+                self._stats['queued'] += 1
+        
+        if wait > 0:
+            time.sleep(wait)
+        
+        remaining = self.max_wait - (time.monotonic() - started)
+        if not entry.in_flight.acquire(timeout=max(remaining, 0.0)):
+            with self._lock:
+                # Nothing was sent, so hand the reservation back like an over-long wait
+                entry.requests.give_back(1)
+                entry.tokens.give_back(tokens)
+                self._stats['rejected'] += 1
+            raise RateLimitQueueFull('Too many provider requests in flight')
+        
+        with self._lock:
+            self._stats['wait_seconds'] += time.monotonic() - started
+        return tokens
+
+def _retry_after(error) -> Optional[float]:
+    """Seconds from a 429's retry-after-ms / retry-after headers, if present"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP-date form
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(retry_at.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+# Create a global instance
+rate_limiter = ProviderRateLimiter()
@@ -0,0 +1,120 @@
+"""
+Saved URL Import Service
+
+Set-based bulk import for saved URLs. The user's existing URL hashes are
+loaded once, duplicates are dropped in memory, and new rows are written with
+multi-row INSERT ... ON CONFLICT DO NOTHING statements in sized batches
+instead of one SELECT and one INSERT per row.
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, SavedUrl, hash_url, latest_summary_id_query
+
+# Hashes per IN list; older SQLite builds allow at most 999 bound parameters
+IN_CHUNK_SIZE = 500
+
+class SavedUrlImporter:
+    """Accumulates saved URLs for one user and writes them in batches"""
+    
+    def __init__(self, user_id: int, batch_size: Optional[int] = None):
+        self.user_id = user_id
+        self.batch_size = batch_size or int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+        self.imported = 0
+        self.skipped = 0
+        self._batch: List[Dict] = []
+        
+        # One query for the user's whole URL set; everything else is in memory
+        self._seen = {url_hash for (url_hash,) in db.session.query(SavedUrl.url_hash)
+                      .filter(SavedUrl.user_id == user_id)}
+    
+    def add(self, url: str, title: Optional[str] = None, description: Optional[str] = None,
+            is_analyzed: bool = False, created_at: Optional[datetime] = None) -> bool:
+        """
+        Queue a URL for import
+        
+        Returns:
+            False if the user already has the URL (or it was queued earlier)
+        """
+        url_hash = hash_url(url)
+        if url_hash in self._seen:
+            self.skipped += 1
+            return False
+        self._seen.add(url_hash)
+        
+        now = datetime.utcnow()
+        # Every row carries the same keys so the batch runs as one executemany
+        self._batch.append({
+            'user_id': self.user_id,
+            'url': url,
+            'url_hash': url_hash,
+            'title': title,
+            'description': description,
+            'is_analyzed': is_analyzed,
+            'created_at': created_at or now,
+            'updated_at': now
+        })
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+        return True
+    
+    def flush(self) -> None:
+        """Write and commit the queued batch"""
+        if not self._batch:
+            return
+        
+        batch, self._batch = self._batch, []
+        table = SavedUrl.__table__
+        hash_chunks = [[row['url_hash'] for row in batch[start:start + IN_CHUNK_SIZE]]
+                       for start in range(0, len(batch), IN_CHUNK_SIZE)]
+        
+        # Rows a concurrent import inserted first are skipped by ON CONFLICT and must not be
+        # counted. rowcount after an executemany isn't reliable (psycopg2 reports the last
+        # statement only), so count the rows RETURNING gives back, or compare counts
+        if db.engine.dialect.insert_executemany_returning:
+            inserted = len(db.session.execute(self._insert_statement().returning(table.c.id), batch).all())
+        else:
+            existing = self._count_existing(hash_chunks)
+            db.session.execute(self._insert_statement(), batch)
+            inserted = self._count_existing(hash_chunks) - existing
+        
+        # Link URLs that were summarized before they were saved, in one UPDATE per chunk
+        for hashes in hash_chunks:
+            db.session.execute(
+                table.update()
+                .where(table.c.user_id == self.user_id,
+                       table.c.url_hash.in_(hashes),
+                       table.c.latest_summary_id.is_(None))
+                .values(latest_summary_id=latest_summary_id_query(table.c.user_id, table.c.url))
+            )
+        db.session.commit()
+        
+        self.imported += inserted
+        self.skipped += len(batch) - inserted
+    
+    def finish(self) -> Dict[str, int]:
+        """Flush the last batch and return the import counts"""
+        self.flush()
+        return {'imported': self.imported, 'skipped': self.skipped}
+    
+    def _count_existing(self, hash_chunks: List[List[str]]) -> int:
+        table = SavedUrl.__table__
+        return sum(db.session.execute(
+            db.select(func.count()).select_from(table)
+            .where(table.c.user_id == self.user_id, table.c.url_hash.in_(hashes))
+        ).scalar() for hashes in hash_chunks)
+    
+    def _insert_statement(self):
+        table = SavedUrl.__table__
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            return sqlite.insert(table).on_conflict_do_nothing(index_elements=['user_id', 'url_hash'])
+        if dialect == 'postgresql':
+            return postgresql.insert(table).on_conflict_do_nothing(index_elements=['user_id', 'url_hash'])
+        # Other databases rely on the in-memory dedupe alone
+        return insert(table)
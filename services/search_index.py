@@ -0,0 +1,244 @@
+"""
+Search Index Service
+
+Full-text search over summaries and saved URLs. On SQLite each table gets
+an external-content FTS5 index kept in sync by triggers; on PostgreSQL a
+generated tsvector column with a GIN index does the same job. Queries are
+answered from the index and ranked by relevance, so search cost follows the
+number of matches rather than the size of a user's history.
+"""
+
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import Float, Integer, bindparam, func, literal_column, or_, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Summary, SavedUrl
+
+logger = logging.getLogger(__name__)
+
+# Indexed columns per table with their weight class (A ranks highest)
+INDEXED_COLUMNS = {
+    'summaries': (('title', 'A'), ('summary_text', 'B'), ('url', 'C')),
+    'saved_urls': (('url', 'C'), ('title', 'A'), ('description', 'B'))
+}
+
+# Column the snippet is cut from; None lets FTS5 pick the best-matching one
+SNIPPET_COLUMNS = {
+    'summaries': 'summary_text',
+    'saved_urls': None
+}
+
+BM25_WEIGHTS = {'A': 10.0, 'B': 2.0, 'C': 1.0}
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 16
+
+# Highlight markers that survive HTML escaping of the snippet text
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+class SearchIndex:
+    """Builds, queries and highlights the full-text indexes"""
+    
+    def __init__(self, snippet_words: int = 24):
+        self.snippet_words = snippet_words
+        # (database URL, table) -> whether an FTS5 index exists there
+        self._fts_tables: Dict[Tuple[str, str], bool] = {}
+    
+    def install(self) -> None:
+        """Create any missing indexes for the current app's database and backfill them"""
+        with db.engine.begin() as connection:
+            for table in INDEXED_COLUMNS:
+                self.install_table(connection, table)
+    
+    def install_table(self, connection, table: str) -> None:
+        """Create the index for one table on the given connection (idempotent)"""
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            self._install_fts5(connection, table)
+        elif dialect == 'postgresql':
+            self._install_tsvector(connection, table)
+    
+    def drop_table(self, connection, table: str) -> None:
+        """Remove a table's FTS5 index; its triggers go away with the table itself"""
+        if connection.dialect.name == 'sqlite':
+            connection.execute(text(f'DROP TABLE IF EXISTS {table}_fts'))
+            self._fts_tables.pop((str(connection.engine.url), table), None)
+    
+    def search(self, query, model, search_text: str) -> Tuple[object, List]:
+        """
+        Restrict an ORM query to rows matching the search text
+        
+        Args:
+            query: Query over Summary or SavedUrl
+            model: The queried model
+            search_text: Raw text typed by the user
+        
+        Returns:
+            (filtered query, ORDER BY clauses ranking the best matches first);
+            the clause list is empty when the database has no index to rank with
+        """
+        table = model.__tablename__
+        terms = self._terms(search_text)
+        dialect = db.engine.dialect.name
+        
+        if terms and dialect == 'sqlite' and self._has_fts(table):
+            weights = ', '.join(str(BM25_WEIGHTS[weight]) for _, weight in INDEXED_COLUMNS[table])
+            matches = text(
+                f'SELECT rowid AS id, bm25({table}_fts, {weights}) AS rank '
+                f'FROM {table}_fts WHERE {table}_fts MATCH :match'
+            ).bindparams(match=self._fts5_query(terms)).columns(id=Integer, rank=Float).subquery()
+            # bm25() scores better matches lower
+            return query.join(matches, matches.c.id == model.id), [matches.c.rank.asc()]
+        
+        if terms and dialect == 'postgresql':
+            vector = literal_column(f'{table}.search_vector')
+            tsquery = func.to_tsquery('english', self._tsquery(terms))
+            return query.filter(vector.op('@@')(tsquery)), [func.ts_rank(vector, tsquery).desc()]
+        
+        # No usable index (or nothing word-like to match): substring scan
+        columns = [getattr(model, name) for name, _ in INDEXED_COLUMNS[table]]
+        return query.filter(or_(*[column.contains(search_text) for column in columns])), []
+    
+    def snippets(self, model, ids: List[int], search_text: str) -> Dict[int, Markup]:
+        """
+        Highlighted excerpts for the given rows, for one page of results
+        
+        Returns:
+            Row id -> safe HTML with matches wrapped in <mark>; rows without an
+            excerpt (or databases without an index) are left out
+        """
+        table = model.__tablename__
+        terms = self._terms(search_text)
+        if not ids or not terms:
+            return {}
+        
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite' and self._has_fts(table):
+            column = SNIPPET_COLUMNS[table]
+            column_index = [name for name, _ in INDEXED_COLUMNS[table]].index(column) if column else -1
+            statement = text(
+                f"SELECT rowid, snippet({table}_fts, {column_index}, :start, :end, '…', {self.snippet_words}) "
+                f'FROM {table}_fts WHERE {table}_fts MATCH :match AND rowid IN :ids'
+            ).bindparams(bindparam('ids', expanding=True))
+            params = {'match': self._fts5_query(terms)}
+        elif dialect == 'postgresql':
+            column = SNIPPET_COLUMNS[table]
+            source = column or " || ' ' || ".join(
+                f"coalesce({name}, '')" for name, _ in INDEXED_COLUMNS[table]
+            )
+            statement = text(
+                f"SELECT id, ts_headline('english', {source}, to_tsquery('english', :match), "
+                f"'StartSel=' || :start || ', StopSel=' || :end || ', MaxWords={self.snippet_words}, MinWords=8') "
+                f'FROM {table} WHERE id IN :ids'
+            ).bindparams(bindparam('ids', expanding=True))
+            params = {'match': self._tsquery(terms)}
+        else:
+            return {}
+        
+        params.update({'ids': list(ids), 'start': MARK_START, 'end': MARK_END})
+        rows = db.session.execute(statement, params)
+        return {row_id: self._highlight(snippet) for row_id, snippet in rows if snippet}
+    
+    def _has_fts(self, table: str) -> bool:
+        key = (str(db.engine.url), table)
+        if key not in self._fts_tables:
+            found = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': f'{table}_fts'}
+            ).first()
+            self._fts_tables[key] = found is not None
+        return self._fts_tables[key]
+    
+    def _install_fts5(self, connection, table: str) -> None:
+        fts = f'{table}_fts'
+        columns = [name for name, _ in INDEXED_COLUMNS[table]]
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{name}' for name in columns)
+        old_values = ', '.join(f'old.{name}' for name in columns)
+        key = (str(connection.engine.url), table)
+        
+        existed = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts}
+        ).first() is not None
+        try:
+            # Prefix indexes keep as-you-type (term*) queries cheap
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, "
+                f"content='{table}', content_rowid='id', prefix='2 3', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            ))
+        except OperationalError as e:
+            # SQLite built without FTS5: search falls back to substring matching
+            logger.warning('Full-text index for %s unavailable: %s', table, e)
+            self._fts_tables[key] = False
+            return
+        
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+        ))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        ))
+        connection.execute(text(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f'INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values}); END'
+        ))
+        if not existed:
+            # Index rows written before the index existed
+            connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+        self._fts_tables[key] = True
+    
+    def _install_tsvector(self, connection, table: str) -> None:
+        parts = []
+        for name, weight in INDEXED_COLUMNS[table]:
+            if name == 'url':
+                # Split URLs into words so hosts and path segments are searchable
+                source = f"to_tsvector('simple', regexp_replace(coalesce({name}, ''), '[^[:alnum:]]+', ' ', 'g'))"
+            else:
+                source = f"to_tsvector('english', coalesce({name}, ''))"
+            parts.append(f"setweight({source}, '{weight}')")
+        
+        # A generated column is kept current by PostgreSQL on every insert and update
+        connection.execute(text(
+            f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            f"GENERATED ALWAYS AS ({' || '.join(parts)}) STORED"
+        ))
+        connection.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)'
+        ))
+    
+    def _terms(self, search_text: Optional[str]) -> List[str]:
+        return TERM_PATTERN.findall(search_text or '')[:MAX_TERMS]
+    
+    def _fts5_query(self, terms: List[str]) -> str:
+        # Quoted prefix terms, all required; quoting neutralises FTS5 operators
+        return ' '.join(f'"{term}"*' for term in terms)
+    
+    def _tsquery(self, terms: List[str]) -> str:
+        return ' & '.join(f'{term}:*' for term in terms)
+    
+    def _highlight(self, snippet: str) -> Markup:
+        html = str(escape(snippet)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+        return Markup(html)
+
+# Create a global instance
+search_index = SearchIndex()
+
+def _create_search_index(target, connection, **kw):
+    search_index.install_table(connection, target.name)
+
+def _drop_search_index(target, connection, **kw):
+    search_index.drop_table(connection, target.name)
+
+# Build the indexes whenever db.create_all() creates the underlying tables
+for _table in (Summary.__table__, SavedUrl.__table__):
+    db.event.listen(_table, 'after_create', _create_search_index)
+    db.event.listen(_table, 'before_drop', _drop_search_index)
@@ -0,0 +1,27 @@
+"""
+Server-Sent Events Helpers
+
+Formatting and response helpers for streaming JSON events to the browser or
+an API client as text/event-stream.
+"""
+
+import json
+from typing import Dict, Iterable
+
+from flask import Response, stream_with_context
+
+def format_event(event: str, data: Dict) -> str:
+    """Encode one SSE event with a JSON payload"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def event_stream(events: Iterable[str]) -> Response:
+    """Stream already formatted events, keeping the request context alive"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Stop nginx and similar proxies from buffering the stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
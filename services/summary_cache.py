@@ -0,0 +1,182 @@
+"""
+Summary Cache Service
+
+Content-addressed cache for generated summaries. Lookups hit an in-process
+LRU first and fall back to the persistent summary_cache table, so repeat
+summaries of the same article with the same settings never reach the
+provider again.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from flask import has_app_context
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import db, CachedSummary
+
+logger = logging.getLogger(__name__)
+
+class SummaryCache:
+    """Two-level (memory + database) cache for LLM summaries"""
+    
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[int] = None,
+                 max_rows: Optional[int] = None, enabled: Optional[bool] = None):
+        self.max_entries = max_entries or int(os.environ.get('SUMMARY_CACHE_SIZE', '1024'))
+        self.ttl = timedelta(seconds=ttl_seconds or int(os.environ.get('SUMMARY_CACHE_TTL', str(30 * 24 * 3600))))
+        self.max_rows = max_rows or int(os.environ.get('SUMMARY_CACHE_MAX_ROWS', '10000'))
+        if enabled is None:
+            enabled = os.environ.get('SUMMARY_CACHE_ENABLED', 'true').lower() == 'true'
+        self.enabled = enabled
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+    
+    @staticmethod
+    def make_key(content: str, length: str, tone: str, format_type: str, model: str,
+                 target_words: Optional[int]) -> str:
+        """Build the cache key from the content hash and the prompt settings"""
+        content_hash = hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+        payload = json.dumps([content_hash, length, tone, format_type, model, target_words])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached summary for a key, or None on a miss"""
+        if not self.enabled:
+            return None
+        
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['expires_at'] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return {'text': entry['text'], 'word_count': entry['word_count'], 'model': entry['model']}
+                del self._entries[key]
+        
+        row = self._load(key, now)
+        if row is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        
+        self._remember(key, row['text'], row['word_count'], row['model'], row['created_at'] + self.ttl)
+        with self._lock:
+            self._stats['db_hits'] += 1
+        return {'text': row['text'], 'word_count': row['word_count'], 'model': row['model']}
+    
+    def set(self, key: str, text: str, word_count: int, model: Optional[str] = None) -> None:
+        """Store a freshly generated summary in both cache levels"""
+        if not self.enabled:
+            return
+        
+        now = datetime.utcnow()
+        self._remember(key, text, word_count, model, now + self.ttl)
+        with self._lock:
+            self._stats['stores'] += 1
+        
+        if not has_app_context():
+            return
+        
+        try:
+            # Cache writes use their own transaction so they never commit
+            # (or get rolled back with) the caller's session
+            with db.engine.begin() as conn:
+                conn.execute(delete(CachedSummary).where(CachedSummary.cache_key == key))
+                conn.execute(CachedSummary.__table__.insert().values(
+                    cache_key=key,
+                    model_used=model,
+                    summary_text=text,
+                    word_count=word_count,
+                    hit_count=0,
+                    created_at=now,
+                    last_accessed_at=now
+                ))
+            self._prune()
+        except IntegrityError:
+            pass  # Another worker stored the same summary concurrently
+        except SQLAlchemyError as e:
+            logger.warning(f"Failed to persist cached summary: {str(e)}")
+    
+    def clear(self) -> None:
+        """Drop every in-memory entry (persistent rows expire on their own)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict:
+        """Return hit/miss counters and the current memory footprint"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['db_hits']) / lookups if lookups else 0.0
+        return stats
+    
+    def _remember(self, key: str, text: str, word_count: int, model: Optional[str], expires_at: datetime) -> None:
+        with self._lock:
+            self._entries[key] = {'text': text, 'word_count': word_count, 'model': model, 'expires_at': expires_at}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+    
+    def _load(self, key: str, now: datetime) -> Optional[Dict]:
+        if not has_app_context():
+            return None
+        
+        try:
+            with db.engine.begin() as conn:
+                row = conn.execute(
+                    select(CachedSummary.summary_text, CachedSummary.word_count, CachedSummary.model_used,
+                           CachedSummary.created_at)
+                    .where(CachedSummary.cache_key == key)
+                ).first()
+                if row is None:
+                    return None
+                if row.created_at + self.ttl <= now:
+                    conn.execute(delete(CachedSummary).where(CachedSummary.cache_key == key))
+                    return None
+                conn.execute(
+                    update(CachedSummary)
+                    .where(CachedSummary.cache_key == key)
+                    .values(hit_count=CachedSummary.hit_count + 1, last_accessed_at=now)
+                )
+            return {'text': row.summary_text, 'word_count': row.word_count, 'model': row.model_used,
+                    'created_at': row.created_at}
+        except SQLAlchemyError as e:
+            logger.warning(f"Failed to read cached summary: {str(e)}")
+            return None
+    
+    def _prune(self) -> None:
+        """Delete expired rows and trim the table to max_rows by least recent access"""
+        with db.engine.begin() as conn:
+            conn.execute(delete(CachedSummary).where(CachedSummary.created_at <= datetime.utcnow() - self.ttl))
+            
+            total = conn.execute(select(func.count(CachedSummary.id))).scalar()
+            overflow = total - self.max_rows
+            if overflow > 0:
+                stale_ids = select(CachedSummary.id)\
+                    .order_by(CachedSummary.last_accessed_at.asc())\
+                    .limit(overflow)\
+                    .scalar_subquery()
+                conn.execute(delete(CachedSummary).where(CachedSummary.id.in_(stale_ids)))
+                with self._lock:
+                    self._stats['evictions'] += overflow
+
+# Create a global instance
+summary_cache = SummaryCache()
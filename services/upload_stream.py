@@ -0,0 +1,60 @@
+"""
+Upload Stream Service
+
+Helpers for reading uploaded files as a stream. Bytes are pulled from the
+upload in fixed-size chunks and decoded incrementally, so parsers can yield
+records as they go and memory stays flat no matter how large the file is.
+"""
+
+import codecs
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+def iter_text(stream: BinaryIO, encoding: str = 'utf-8-sig', fallback: Optional[str] = 'latin-1',
+              chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Decode a binary stream chunk by chunk
+    
+    Multi-byte characters split across chunks are handled by an incremental
+    decoder. If the data turns out not to be valid in the given encoding,
+    decoding switches to the fallback from the chunk holding the bad bytes
+    onward. Text already yielded stays decoded in the first encoding, so a
+    file only decodes entirely as the fallback (as the old read-everything
+    code did) when its first invalid byte falls in the first chunk.
+    
+    Args:
+        stream: Binary file object, e.g. an uploaded file's stream
+        encoding: Encoding to try first (the default strips a UTF-8 BOM)
+        fallback: Encoding to switch to on a decode error, or None to raise
+        chunk_size: Bytes read per chunk
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = stream.read(chunk_size)
+        final = not data
+        # Bytes the decoder is still holding from the previous chunk
+        pending = decoder.getstate()[0]
+        try:
+            text = decoder.decode(data, final=final)
+        except UnicodeDecodeError:
+            if fallback is None:
+                raise
+            decoder = codecs.getincrementaldecoder(fallback)()
+            fallback = None
+            text = decoder.decode(pending + data, final=final)
+        if text:
+            yield text
+        if final:
+            return
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Regroup text chunks into lines, keeping their line endings for csv"""
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
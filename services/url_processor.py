@@ -1,16 +1,17 @@
-import requests
 import feedparser
 from urllib.parse import urlparse, urljoin
 import csv
 import io
 import re
+from .fetch_cache import fetch_cache
+from .http_client import http_client
+from .async_fetcher import async_fetcher
+from .upload_stream import iter_text, iter_lines
 
 class URLProcessor:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        # Process-wide pooled client, so connections are reused across instances
+        self.session = http_client
     
     def process_url_list(self, url_text):
         """
@@ -30,38 +31,45 @@ class URLProcessor:
         """
         Process URLs from uploaded file (CSV or TXT)
         """
-        urls = []
-        
         try:
-            content = file_content.decode('utf-8')
-            
-            if file_type.lower() == 'csv':
-                # Process CSV file
-                csv_reader = csv.reader(io.StringIO(content))
-                for row in csv_reader:
-                    for cell in row:
-                        cell = cell.strip()
-                        if cell and self._is_valid_url(cell):
-                            urls.append(cell)
-            else:
-                # Process TXT file
-                lines = content.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if line and self._is_valid_url(line):
-                        urls.append(line)
-        
+            return list(self.iter_file_upload(file_content, file_type))
         except Exception as e:
             raise Exception(f"Failed to process file: {str(e)}")
+    
+    def iter_file_upload(self, file_content, file_type):
+        """
+        Yield URLs from an uploaded CSV or TXT file as they are read
         
-        return urls
+        file_content may be bytes or a binary stream; streams are decoded
+        chunk by chunk so the file is never held in memory as a whole.
+        """
+        if isinstance(file_content, bytes):
+            file_content = io.BytesIO(file_content)
+        lines = iter_lines(iter_text(file_content))
+        
+        if file_type.lower() == 'csv':
+            # Process CSV file
+            for row in csv.reader(lines):
+                for cell in row:
+                    cell = cell.strip()
+                    if cell and self._is_valid_url(cell):
+                        yield cell
+        else:
+            # Process TXT file
+            for line in lines:
+                line = line.strip()
+                if line and self._is_valid_url(line):
+                    yield line
     
     def process_rss_feed(self, rss_url):
         """
         Process URLs from RSS feed
         """
         try:
-            feed = feedparser.parse(rss_url)
+            # Fetch through the pooled client; feedparser only parses the body
+            response = self.session.get(rss_url, timeout=15)
+            response.raise_for_status()
+            feed = feedparser.parse(response.content)
             
             if feed.bozo:
                 raise Exception("Invalid RSS feed")
@@ -84,6 +92,18 @@ class URLProcessor:
             if not self._is_valid_url(url):
                 return None
             
+            # A page fetched recently was reachable; skip the network. An older
+            # entry says nothing about the URL now, so it is checked again
+            cached = fetch_cache.lookup(url, max_age=fetch_cache.fresh_seconds)
+            if cached is not None:
+                head = cached.content[:2048].decode(cached.encoding or 'utf-8', errors='ignore')
+                return {
+                    'url': url,
+                    'title': self._extract_title_from_content(head) or self._extract_title_from_url(url),
+                    'status': 'valid',
+                    'accessible': True
+                }
+            
             # Try to fetch basic metadata with more lenient approach
             try:
                 response = self.session.head(url, timeout=15, allow_redirects=True)
@@ -177,35 +197,47 @@ class URLProcessor:
         
         return None
     
-    def batch_process_urls(self, urls, max_workers=5):
+    def batch_process_urls(self, urls, max_workers=None, time_budget=None):
         """
-        Process multiple URLs concurrently
+        Process multiple URLs concurrently on the async fetch engine
+        
+        Each page is read only until its <title> has arrived. Results come
+        back in input order; invalid URLs are dropped as in process_url.
+        URLs not checked within time_budget seconds are returned with
+        status 'pending' rather than holding up the response.
         """
-        import concurrent.futures
-        import threading
+        valid_urls = [url for url in urls if self._is_valid_url(url)]
+        probes = async_fetcher.probe_many(valid_urls, max_in_flight=max_workers, time_budget=time_budget)
         
         results = []
-        
-        def process_single_url(url):
-            return self.process_url(url)
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_url = {executor.submit(process_single_url, url): url for url in urls}
+        for probe in probes:
+            url = probe['url']
+            if probe['pending']:
+                results.append({
+                    'url': url,
+                    'title': self._extract_title_from_url(url),
+                    'status': 'pending',
+                    'accessible': True  # Unchecked, so let the article extractor decide
+                })
+                continue
             
-            for future in concurrent.futures.as_completed(future_to_url):
-                try:
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                except Exception as e:
-                    url = future_to_url[future]
-                    results.append({
-                        'url': url,
-                        'title': self._extract_title_from_url(url),
-                        'status': 'error',
-                        'error': str(e),
-                        'accessible': False
-                    })
+            if probe['error']:
+                # Same leniency as process_url: let the article extractor decide
+                results.append({
+                    'url': url,
+                    'title': self._extract_title_from_url(url),
+                    'status': 'warning',
+                    'accessible': True,
+                    'warning': f'Could not verify URL accessibility ({probe["error"]}), but will attempt extraction'
+                })
+                continue
+            
+            results.append({
+                'url': url,
+                'title': self._extract_title_from_content(probe['head']) or self._extract_title_from_url(url),
+                'status': 'valid',
+                'accessible': probe['status_code'] in [200, 301, 302, 403, 404]
+            })
         
         return results
     
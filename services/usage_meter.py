@@ -0,0 +1,106 @@
+"""
+Usage Meter Service
+
+Metering for external API calls. Each charge is a single atomic
+UPDATE ... SET api_calls_made = api_calls_made + n in its own short
+transaction, so concurrent requests neither lose counts nor hold the user
+row locked while a summary is generated. Counts are kept per calendar month
+and start over automatically when a new month begins.
+"""
+
+from typing import Dict, Optional
+
+from sqlalchemy import case, func, select
+
+from models import db, User, current_usage_period
+from .api_key_auth import api_key_auth
+
+class UsageMeter:
+    """Atomic per-user, per-month API call counter"""
+    
+    def charge(self, user_id: int, calls: int = 1, limit: Optional[int] = None) -> Optional[int]:
+        """
+        Add calls to the user's usage for the current month
+        
+        Args:
+            user_id: User to charge
+            calls: Number of calls to add
+            limit: If given, only charge when the new total stays within it
+        
+        Returns:
+            The user's new call count for the month, or None if the charge
+            would have gone over the limit (nothing is charged then)
+        """
+        period = current_usage_period()
+        table = User.__table__
+        new_count = case(
+            (table.c.api_usage_period == period, func.coalesce(table.c.api_calls_made, 0) + calls),
+            else_=calls
+        )
+        statement = table.update()\
+            .where(table.c.id == user_id)\
+            .values(api_calls_made=new_count, api_usage_period=period)
+        if limit is not None:
+            # The check and the increment are one statement, so racing calls can't overshoot
+            statement = statement.where(new_count <= limit)
+        
+        return self._execute(statement, user_id, period)
+    
+    def refund(self, user_id: int, calls: int) -> Optional[int]:
+        """
+        Give back calls charged for work that didn't happen, e.g. the failed
+        items of a batch charged up front
+        
+        Returns:
+            The user's new call count for the month, or None if nothing was
+            refunded (a new month has started since the charge)
+        """
+        if calls <= 0:
+            return None
+        
+        period = current_usage_period()
+        table = User.__table__
+        statement = table.update()\
+            .where(table.c.id == user_id, table.c.api_usage_period == period)\
+            .values(api_calls_made=case(
+                (table.c.api_calls_made > calls, table.c.api_calls_made - calls),
+                else_=0
+            ))
+        return self._execute(statement, user_id, period)
+    
+    def _execute(self, statement, user_id: int, period: str) -> Optional[int]:
+        table = User.__table__
+        with db.engine.begin() as connection:
+            if connection.dialect.update_returning:
+                row = connection.execute(statement.returning(table.c.api_calls_made)).first()
+                calls_made = row[0] if row is not None else None
+            else:
+                result = connection.execute(statement)
+                calls_made = None
+                if result.rowcount:
+                    calls_made = connection.execute(
+                        select(table.c.api_calls_made).where(table.c.id == user_id)
+                    ).scalar()
+        
+        if calls_made is not None:
+            # Keep the auth cache's quota snapshot current for the next check
+            api_key_auth.update_usage(user_id, calls_made, period)
+        return calls_made
+    
+    def get_usage(self, user_id: int) -> Dict:
+        """Current month's usage for a user"""
+        period = current_usage_period()
+        calls_made, calls_limit, usage_period = db.session.query(
+            User.api_calls_made, User.api_calls_limit, User.api_usage_period
+        ).filter(User.id == user_id).one()
+        
+        calls_made = (calls_made or 0) if usage_period == period else 0
+        return {
+            'period': period,
+            'calls_made': calls_made,
+            'calls_limit': calls_limit,
+            'calls_remaining': max(calls_limit - calls_made, 0)
+        }
+
+# Create a global instance
+usage_meter = UsageMeter()
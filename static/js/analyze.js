@@ -176,7 +176,11 @@ class AnalyzeManager {
             this.displayProcessedUrls(response.urls);
             this.showStep(2);
             
-            AppUtils.showNotification(`Processed ${response.total} URLs`, 'success');
+            let message = `Processed ${response.total} URLs`;
+            if (response.pending_count) {
+                message += ` (${response.pending_count} not checked in time)`;
+            }
+            AppUtils.showNotification(message, 'success');
             
         } catch (error) {
             AppUtils.showNotification('Failed to process URLs: ' + error.message, 'error');
@@ -227,7 +231,7 @@ class AnalyzeManager {
                     <div class="url-title">${urlData.title}</div>
                     <a href="${urlData.url}" target="_blank" class="url-link">${urlData.url}</a>
                 </div>
-                <div class="url-status ${urlData.status}">${urlData.accessible ? 'Accessible' : 'Error'}</div>
+                <div class="url-status ${urlData.status}">${urlData.status === 'pending' ? 'Not checked' : (urlData.accessible ? 'Accessible' : 'Error')}</div>
             `;
             
             urlList.appendChild(urlItem);
@@ -430,52 +434,51 @@ class AnalyzeManager {
         this.summarySettings.model = document.getElementById('model-select').value;
         
         try {
+            // A single article streams straight into the page instead of polling a job
+            if (this.selectedUrls.length === 1) {
+                await this.generateStreamingSummary(this.selectedUrls[0]);
+                return;
+            }
+            
             AppUtils.showLoading('Extracting articles and generating summaries...');
             
-            const summaries = [];
+            // Start a server-side batch job; extraction and summarization run
+            // concurrently on the server, so we only need to poll for progress
+            const jobResponse = await AppUtils.apiRequest('/api/batch-summaries', {
+                method: 'POST',
+                body: JSON.stringify({
+                    urls: this.selectedUrls.map(urlData => ({ url: urlData.url, title: urlData.title })),
+                    length: this.summarySettings.length,
+                    tone: this.summarySettings.tone,
+                    format: this.summarySettings.format,
+                    model: this.summarySettings.model,
+                    custom_word_count: this.summarySettings.length === 'custom' ? this.summarySettings.customWordCount : null
+                })
+            });
             
-            for (let i = 0; i < this.selectedUrls.length; i++) {
-                const urlData = this.selectedUrls[i];
-                
-                AppUtils.showLoading(`Processing article ${i + 1} of ${this.selectedUrls.length}...`);
-                
-                // Extract article content
-                const extractResponse = await AppUtils.apiRequest('/api/extract-article', {
-                    method: 'POST',
-                    body: JSON.stringify({ url: urlData.url })
-                });
-                
-                if (extractResponse.error || !extractResponse.content) {
-                    summaries.push({
-                        url: urlData.url,
-                        title: urlData.title,
-                        error: extractResponse.error || 'Failed to extract content',
-                        is_paywalled: extractResponse.is_paywalled,
-                        allow_manual_input: extractResponse.is_paywalled
-                    });
-                    continue;
+            const job = await this.pollBatchJob(jobResponse.job.id);
+            
+            const summaries = job.items.map(item => {
+                if (item.status === 'completed' && item.summary) {
+                    return item.summary;
                 }
-                
-                // Generate summary
-                const summaryResponse = await AppUtils.apiRequest('/api/generate-summary', {
-                    method: 'POST',
-                    body: JSON.stringify({
-                        content: extractResponse.content,
-                        url: urlData.url,
-                        title: extractResponse.title,
-                        author: extractResponse.author,
-                        publication_date: extractResponse.publication_date,
-                        ...this.summarySettings
-                    })
-                });
-                
-                summaries.push(summaryResponse.summary);
-            }
+                return {
+                    url: item.url,
+                    title: item.title || item.url,
+                    error: item.error || 'Failed to generate summary',
+                    is_paywalled: item.is_paywalled,
+                    allow_manual_input: item.allow_manual_input
+                };
+            });
             
             this.displaySummaries(summaries);
             this.showStep(4);
             
-            AppUtils.showNotification('Summaries generated successfully!', 'success');
+            if (job.failed > 0) {
+                AppUtils.showNotification(`Generated ${job.completed} summaries, ${job.failed} failed`, 'warning');
+            } else {
+                AppUtils.showNotification('Summaries generated successfully!', 'success');
+            }
             
         } catch (error) {
             AppUtils.showNotification('Failed to generate summaries: ' + error.message, 'error');
@@ -484,6 +487,143 @@ class AnalyzeManager {
         }
     }
     
+    async generateStreamingSummary(urlData) {
+        AppUtils.showLoading('Extracting article...');
+        
+        let article;
+        try {
+            article = await AppUtils.apiRequest('/api/extract-article', {
+                method: 'POST',
+                body: JSON.stringify({ url: urlData.url })
+            });
+        } catch (error) {
+            this.displaySummaries([{
+                url: urlData.url,
+                title: urlData.title || urlData.url,
+                error: error.message,
+                allow_manual_input: true
+            }]);
+            this.showStep(4);
+            return;
+        }
+        
+        // Paywalled or unreadable pages come back as 200 with an error; offer manual input like the batch path
+        if (article.error || !article.content) {
+            this.displaySummaries([{
+                url: urlData.url,
+                title: urlData.title || urlData.url,
+                error: article.error || 'Failed to extract content',
+                is_paywalled: article.is_paywalled,
+                allow_manual_input: article.is_paywalled
+            }]);
+            this.showStep(4);
+            return;
+        }
+        
+        AppUtils.hideLoading();
+        
+        const container = document.getElementById('summaries-container');
+        container.innerHTML = '';
+        const resultElement = document.createElement('div');
+        resultElement.className = 'summary-result';
+        container.appendChild(resultElement);
+        this.showStep(4);
+        
+        const summary = await this.streamSummary(article, resultElement);
+        resultElement.innerHTML = this.summaryResultHtml(summary);
+        AppUtils.showNotification('Summary generated successfully!', 'success');
+    }
+    
+    // Render summary text into resultElement as it streams in; resolves to the saved summary
+    async streamSummary(article, resultElement) {
+        resultElement.innerHTML = `
+            <div class="summary-result-header">
+                <div class="summary-result-meta">
+                    <div class="summary-result-title">${article.title || article.url}</div>
+                    <a href="${article.url}" target="_blank" class="summary-result-url">${article.url}</a>
+                </div>
+            </div>
+            <div class="summary-result-text streaming"></div>
+        `;
+        const textElement = resultElement.querySelector('.summary-result-text');
+        
+        let summary = null;
+        await AppUtils.streamRequest('/api/generate-summary', {
+            content: article.content,
+            url: article.url,
+            title: article.title,
+            author: article.author,
+            publication_date: article.publication_date,
+            length: this.summarySettings.length,
+            tone: this.summarySettings.tone,
+            format: this.summarySettings.format,
+            model: this.summarySettings.model,
+            custom_word_count: this.summarySettings.length === 'custom' ? this.summarySettings.customWordCount : null,
+            stream: true
+        }, (event, data) => {
+            if (event === 'delta') {
+                textElement.textContent += data.text;
+            } else if (event === 'done') {
+                summary = data.summary;
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
+        
+        if (!summary) {
+            throw new Error('The summary stream ended early');
+        }
+        return summary;
+    }
+    
+    summaryResultHtml(summary) {
+        return `
+            <div class="summary-result-header">
+                <div class="summary-result-meta">
+                    <div class="summary-result-title">${summary.metadata.title}</div>
+                    <a href="${summary.metadata.url}" target="_blank" class="summary-result-url">${summary.metadata.url}</a>
+                    ${summary.metadata.author ? `<div class="summary-result-author">by ${summary.metadata.author}</div>` : ''}
+                </div>
+                <div class="summary-result-settings">
+                    <span class="setting-tag">${summary.settings.length}</span>
+                    <span class="setting-tag">${summary.settings.tone}</span>
+                    <span class="setting-tag">${summary.settings.format}</span>
+                    <span class="setting-tag">${summary.word_count} words</span>
+                </div>
+            </div>
+            <div class="summary-result-text">${summary.text.replace(/\n/g, '<br>')}</div>
+            <div class="summary-result-actions">
+                <button class="btn btn-secondary" onclick="navigator.clipboard.writeText('${summary.text.replace(/'/g, "\\'")}')">Copy</button>
+                <a href="/summary/${summary.id}" class="btn btn-primary">View Details</a>
+            </div>
+        `;
+    }
+    
+    async pollBatchJob(jobId, interval = 1500, stallTimeout = 5 * 60 * 1000) {
+        let processed = -1;
+        let lastProgressAt = Date.now();
+        while (true) {
+            const response = await AppUtils.apiRequest(`/api/batch-summaries/${jobId}`);
+            const job = response.job;
+            
+            AppUtils.showLoading(`Processed ${job.completed + job.failed} of ${job.total} articles...`);
+            
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+            
+            // Give up on a job that stops moving instead of polling forever
+            if (job.completed + job.failed !== processed) {
+                processed = job.completed + job.failed;
+                lastProgressAt = Date.now();
+            } else if (Date.now() - lastProgressAt > stallTimeout) {
+                throw new Error('the batch stopped making progress, please try again');
+            }
+            
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
+    
     displaySummaries(summaries) {
         const container = document.getElementById('summaries-container');
         container.innerHTML = '';
@@ -514,26 +654,7 @@ class AnalyzeManager {
                     </div>
                 `;
             } else {
-                summaryElement.innerHTML = `
-                    <div class="summary-result-header">
-                        <div class="summary-result-meta">
-                            <div class="summary-result-title">${summary.metadata.title}</div>
-                            <a href="${summary.metadata.url}" target="_blank" class="summary-result-url">${summary.metadata.url}</a>
-                            ${summary.metadata.author ? `<div class="summary-result-author">by ${summary.metadata.author}</div>` : ''}
-                        </div>
-                        <div class="summary-result-settings">
-                            <span class="setting-tag">${summary.settings.length}</span>
-                            <span class="setting-tag">${summary.settings.tone}</span>
-                            <span class="setting-tag">${summary.settings.format}</span>
-                            <span class="setting-tag">${summary.word_count} words</span>
-                        </div>
-                    </div>
-                    <div class="summary-result-text">${summary.text.replace(/\n/g, '<br>')}</div>
-                    <div class="summary-result-actions">
-                        <button class="btn btn-secondary" onclick="navigator.clipboard.writeText('${summary.text.replace(/'/g, "\\'")}')">Copy</button>
-                        <a href="/summary/${summary.id}" class="btn btn-primary">View Details</a>
-                    </div>
-                `;
+                summaryElement.innerHTML = this.summaryResultHtml(summary);
             }
             
             container.appendChild(summaryElement);
@@ -647,6 +768,9 @@ class AnalyzeManager {
             
             // Show summary of bookmark parsing
             let message = `Found ${result.total_bookmarks} bookmarks, processed ${result.processed_count} URLs`;
+            if (result.pending_count) {
+                message += ` (${result.pending_count} not checked in time)`;
+            }
             if (result.folders_found && result.folders_found.length > 0) {
                 message += `\nFolders found: ${result.folders_found.slice(0, 3).join(', ')}`;
                 if (result.folders_found.length > 3) {
@@ -681,44 +805,14 @@ async function retryWithManualInput(url, title, buttonElement) {
     }
     
     try {
-        AppUtils.showLoading('Generating summary from manual input...');
-        
-        // Generate summary with manual content
-        const summaryResponse = await AppUtils.apiRequest('/api/generate-summary', {
-            method: 'POST',
-            body: JSON.stringify({
-                content: manualText,
-                url: url,
-                title: title,
-                length: analyzeManager.summarySettings.length,
-                tone: analyzeManager.summarySettings.tone,
-                format: analyzeManager.summarySettings.format,
-                model: analyzeManager.summarySettings.model,
-                custom_word_count: analyzeManager.summarySettings.customWordCount
-            })
-        });
-        
-        // Replace the error with the successful summary
+        // Stream the summary in place of the error
         const resultElement = buttonElement.closest('.summary-result');
-        resultElement.innerHTML = `
-            <div class="summary-result-header">
-                <div class="summary-result-meta">
-                    <div class="summary-result-title">${summaryResponse.summary.metadata.title}</div>
-                    <a href="${summaryResponse.summary.metadata.url}" target="_blank" class="summary-result-url">${summaryResponse.summary.metadata.url}</a>
-                </div>
-                <div class="summary-result-settings">
-                    <span class="setting-tag">${summaryResponse.summary.settings.length}</span>
-                    <span class="setting-tag">${summaryResponse.summary.settings.tone}</span>
-                    <span class="setting-tag">${summaryResponse.summary.settings.format}</span>
-                    <span class="setting-tag">${summaryResponse.summary.word_count} words</span>
-                </div>
-            </div>
-            <div class="summary-result-text">${summaryResponse.summary.text.replace(/\n/g, '<br>')}</div>
-            <div class="summary-result-actions">
-                <button class="btn btn-secondary" onclick="navigator.clipboard.writeText('${summaryResponse.summary.text.replace(/'/g, "\\'")}')">Copy</button>
-                <a href="/summary/${summaryResponse.summary.id}" class="btn btn-primary">View Details</a>
-            </div>
-        `;
+        const summary = await analyzeManager.streamSummary({
+            content: manualText,
+            url: url,
+            title: title
+        }, resultElement);
+        resultElement.innerHTML = analyzeManager.summaryResultHtml(summary);
         
         AppUtils.showNotification('Summary generated successfully!', 'success');
         
@@ -58,6 +58,51 @@ async function apiRequest(url, options = {}) {
     }
 }
 
+// POST a JSON body and dispatch each Server-Sent Event in the response as it arrives
+async function streamRequest(url, body, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify(body)
+    });
+    
+    if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || 'Request failed');
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        events.forEach(raw => {
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        });
+    }
+}
+
 // Form validation helpers
 function validateEmail(email) {
     const emailRegex = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
@@ -200,6 +245,7 @@ window.AppUtils = {
     showLoading,
     hideLoading,
     apiRequest,
+    streamRequest,
     validateEmail,
     validateUrl,
     showNotification
@@ -113,4 +113,661 @@ def test_api_endpoints_require_login(client):
     
     for route in api_routes:
         rv = client.post(route)
-        assert rv.status_code == 302  # Redirect to login
\ No newline at end of file
+        assert rv.status_code == 302  # Redirect to login
+def login(client, email='test@example.com', password='testpassword123'):
+    """Create a user and log them in"""
+    user = User(email=email)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    client.post('/auth/login', data={'email': email, 'password': password})
+    return user
+
+def test_batch_summaries_job(client, monkeypatch):
+    """Test that a batch job summarizes every URL on the worker pool"""
+    from services import batch_jobs
+    
+    def fake_extract(self, url):
+        if 'broken' in url:
+            return {'url': url, 'error': 'Failed to fetch article', 'is_paywalled': False}
+        return {'url': url, 'title': 'Title for ' + url, 'content': 'Some article text', 'word_count': 3}
+    
+    def fake_summary(self, content, **kwargs):
+        return {'text': 'A short summary', 'word_count': 3}
+    
+    monkeypatch.setattr(batch_jobs.ArticleExtractor, 'extract', fake_extract)
+    monkeypatch.setattr(batch_jobs.LLMService, 'generate_summary', fake_summary)
+    runner = batch_jobs.BatchJobRunner(max_workers=2)
+    monkeypatch.setattr('routes.api.batch_job_runner', runner)
+    
+    login(client)
+    rv = client.post('/api/batch-summaries', json={
+        'urls': ['https://example.com/a', 'https://example.com/b', 'https://broken.example.com/c']
+    })
+    assert rv.status_code == 202
+    job_id = rv.get_json()['job']['id']
+    
+    runner.executor.shutdown(wait=True)
+    
+    job = client.get(f'/api/batch-summaries/{job_id}').get_json()['job']
+    assert job['status'] == 'completed'
+    assert job['completed'] == 2
+    assert job['failed'] == 1
+    assert [item['url'] for item in job['items']] == [
+        'https://example.com/a', 'https://example.com/b', 'https://broken.example.com/c'
+    ]
+    assert job['items'][0]['summary']['text'] == 'A short summary'
+    assert job['items'][2]['error'] == 'Failed to fetch article'
+
+def test_batch_jobs_resume_after_restart(client, monkeypatch):
+    """Test that items a previous run left in flight are picked up again at startup"""
+    from flask import current_app
+    from services import batch_jobs
+    from models import BatchJob, BatchJobItem
+    
+    monkeypatch.setattr(batch_jobs.ArticleExtractor, 'extract',
+                        lambda self, url: {'url': url, 'title': 'Title', 'content': 'Some article text'})
+    monkeypatch.setattr(batch_jobs.LLMService, 'generate_summary',
+                        lambda self, content, **kwargs: {'text': 'A short summary', 'word_count': 3})
+    
+    user = login(client)
+    runner = batch_jobs.BatchJobRunner(max_workers=2)
+    job = runner.create_job(user, [{'url': 'https://example.com/a'}, {'url': 'https://example.com/b'},
+                                   {'url': 'https://example.com/c'}], 'medium', 'neutral', 'paragraph', 'claude-3-haiku')
+    job_id = job.id
+    # The previous process died while two items were being worked on
+    items = BatchJobItem.query.filter_by(job_id=job_id).order_by(BatchJobItem.position).all()
+    items[0].status, items[1].status = 'extracting', 'summarizing'
+    job.status = 'running'
+    db.session.commit()
+    
+    runner.resume(current_app._get_current_object())
+    runner.executor.shutdown(wait=True)
+    db.session.expire_all()
+    
+    job = client.get(f'/api/batch-summaries/{job_id}').get_json()['job']
+    assert job['status'] == 'completed'
+    assert job['completed'] == 3
+    assert [item['status'] for item in job['items']] == ['completed'] * 3
+
+def test_process_urls_returns_pending_after_time_budget(client, monkeypatch):
+    """Test that URL validation keeps input order and reports slow URLs as pending"""
+    import time
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/slow':
+                time.sleep(3)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.end_headers()
+            self.wfile.write(f'<html><head><title>Page {self.path}</title></head></html>'.encode('utf-8'))
+        
+        def log_message(self, *args):
+            pass
+    
+    class QuietServer(ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass
+    
+    server = QuietServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr('routes.api.URL_CHECK_TIME_BUDGET', 1)
+    try:
+        base = f'http://127.0.0.1:{server.server_port}'
+        urls = [f'{base}/first', f'{base}/slow', f'{base}/last']
+        
+        login(client)
+        started = time.monotonic()
+        rv = client.post('/api/process-urls', json={'urls': urls})
+        assert time.monotonic() - started < 2.5
+        
+        data = rv.get_json()
+        assert [url['url'] for url in data['urls']] == urls
+        assert [url['status'] for url in data['urls']] == ['valid', 'pending', 'valid']
+        assert data['urls'][2]['title'] == 'Page /last'
+        assert data['pending_count'] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_saved_urls_load_latest_summaries_without_n_plus_one(client):
+    """Test that saved URLs link their latest summary and list in a fixed number of queries"""
+    from sqlalchemy import event
+    from models import SavedUrl, Summary
+    
+    user = login(client)
+    for i in range(10):
+        db.session.add(SavedUrl(user_id=user.id, url=f'https://example.com/{i}', is_analyzed=True))
+    db.session.commit()
+    
+    for i in range(10):
+        for version in ('old', 'new'):
+            db.session.add(Summary(user_id=user.id, url=f'https://example.com/{i}', summary_text=f'{version} {i}'))
+            db.session.commit()
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        data = client.get('/api/saved-urls?per_page=100').get_json()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    
+    texts = {url['url']: url['summary']['text'] for url in data['saved_urls']}
+    assert texts == {f'https://example.com/{i}': f'new {i}' for i in range(10)}
+    summary_queries = [s for s in statements if 'FROM summaries' in s]
+    assert len(summary_queries) == 1
+    
+    # Deleting the latest summary falls back to the previous one
+    latest = db.session.get(Summary, SavedUrl.query.filter_by(url='https://example.com/3').one().latest_summary_id)
+    client.post('/api/delete-summary', json={'summary_id': latest.id})
+    saved = SavedUrl.query.filter_by(url='https://example.com/3').one()
+    db.session.refresh(saved)
+    assert saved.latest_summary.summary_text == 'old 3'
+    
+    # URLs summarized before they were saved are linked on insert, one by one or imported in bulk
+    from services.saved_url_importer import SavedUrlImporter
+    for name in ('single', 'imported'):
+        db.session.add(Summary(user_id=user.id, url=f'https://example.com/{name}', summary_text=f'{name} summary'))
+    db.session.commit()
+    db.session.add(SavedUrl(user_id=user.id, url='https://example.com/single'))
+    db.session.commit()
+    importer = SavedUrlImporter(user.id)
+    importer.add('https://example.com/imported')
+    importer.add('https://example.com/never-summarized')
+    importer.finish()
+    linked = {saved.url: saved.latest_summary.summary_text if saved.latest_summary else None
+              for saved in SavedUrl.query.filter(SavedUrl.url.in_([
+                  'https://example.com/single', 'https://example.com/imported', 'https://example.com/never-summarized'
+              ]))}
+    assert linked == {'https://example.com/single': 'single summary',
+                      'https://example.com/imported': 'imported summary',
+                      'https://example.com/never-summarized': None}
+
+def test_export_saved_urls_streams_csv_and_bookmarks(client):
+    """Test that exports stream every saved URL, gzip-compressed when accepted"""
+    import csv
+    import gzip
+    import io
+    from models import SavedUrl, Summary
+    
+    user = login(client)
+    for i in range(1200):
+        db.session.add(SavedUrl(user_id=user.id, url=f'https://example.com/{i}', title=f'Title {i}', is_analyzed=(i == 7)))
+    db.session.commit()
+    db.session.add(Summary(user_id=user.id, url='https://example.com/7', summary_text='Seven'))
+    db.session.commit()
+    
+    rv = client.get('/api/export-saved-urls?format=csv', headers={'Accept-Encoding': 'gzip'})
+    assert rv.status_code == 200
+    assert rv.is_streamed
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(rv.data).decode('utf-8'))))
+    assert len(rows) == 1200
+    assert {row['url'] for row in rows} == {f'https://example.com/{i}' for i in range(1200)}
+    assert next(row for row in rows if row['url'] == 'https://example.com/7')['summary_text'] == 'Seven'
+    
+    rv = client.get('/api/export-saved-urls?format=bookmarks')
+    assert 'Content-Encoding' not in rv.headers
+    html = rv.data.decode('utf-8')
+    assert html.count('<DT><A HREF=') == 1200
+    assert html.rstrip().endswith('</DL><p>')
+
+def test_search_uses_full_text_index(client):
+    """Test that history and saved URL search rank indexed matches and stay in sync"""
+    from models import SavedUrl, Summary
+    
+    user = login(client)
+    db.session.add(Summary(user_id=user.id, url='https://example.com/a', title='Kettle descaling',
+                           summary_text='How to remove limescale <b>safely</b> from a kettle.'))
+    db.session.add(Summary(user_id=user.id, url='https://example.com/b', title='Gardening',
+                           summary_text='Notes on soil, with one aside about a kettle.'))
+    db.session.add(SavedUrl(user_id=user.id, url='https://news.example.org/kettles', title='Kettles compared'))
+    db.session.add(SavedUrl(user_id=user.id, url='https://example.com/tea', title='Tea', description='Brewing guide'))
+    db.session.commit()
+    
+    rv = client.get('/history?search=kettle')
+    html = rv.data.decode('utf-8')
+    # The title match outranks the passing mention, and snippets are escaped and highlighted
+    assert html.index('Kettle descaling') < html.index('Gardening')
+    assert '<mark>kettle</mark>' in html
+    assert '&lt;b&gt;safely&lt;/b&gt;' in html
+    
+    data = client.get('/api/saved-urls?search=kett').get_json()
+    assert [url['title'] for url in data['saved_urls']] == ['Kettles compared']
+    assert '<mark>' in data['saved_urls'][0]['snippet']
+    
+    # Updates and deletes reach the index
+    tea = SavedUrl.query.filter_by(title='Tea').one()
+    tea.description = 'Which kettle to buy'
+    db.session.delete(SavedUrl.query.filter_by(title='Kettles compared').one())
+    db.session.commit()
+    data = client.get('/api/saved-urls?search=kettle').get_json()
+    assert [url['title'] for url in data['saved_urls']] == ['Tea']
+    
+    # Operator characters are treated as plain text
+    assert client.get('/api/saved-urls?search="kettle OR (').status_code == 200
+
+def test_cursor_pagination_walks_every_row_once(client):
+    """Test that saved URLs and API summaries page by cursor, with totals only on request"""
+    from datetime import datetime
+    from models import SavedUrl, Summary
+    
+    user = login(client)
+    api_key = user.generate_api_key()
+    db.session.commit()
+    # Shared timestamps make the id tiebreaker matter
+    stamps = [datetime(2024, 1, 1 + i // 10) for i in range(45)]
+    for i, stamp in enumerate(stamps):
+        db.session.add(SavedUrl(user_id=user.id, url=f'https://example.com/{i}', created_at=stamp))
+        db.session.add(Summary(user_id=user.id, url=f'https://example.com/{i}', summary_text=f'Text {i}', created_at=stamp))
+    db.session.commit()
+    
+    pages = [client.get('/api/saved-urls?per_page=20&include_total=1').get_json()]
+    assert pages[0]['pagination']['total'] == 45
+    while pages[-1]['pagination']['has_next']:
+        cursor = pages[-1]['pagination']['next_cursor']
+        pages.append(client.get(f'/api/saved-urls?per_page=20&cursor={cursor}').get_json())
+    assert [len(page['saved_urls']) for page in pages] == [20, 20, 5]
+    assert 'total' not in pages[1]['pagination']
+    
+    ids = [url['id'] for page in pages for url in page['saved_urls']]
+    expected = [url.id for url in SavedUrl.query.order_by(SavedUrl.created_at.desc(), SavedUrl.id.desc())]
+    assert ids == expected
+    
+    # Stepping back from the last page returns the middle page unchanged
+    cursor = pages[-1]['pagination']['prev_cursor']
+    back = client.get(f'/api/saved-urls?per_page=20&cursor={cursor}').get_json()
+    assert [url['id'] for url in back['saved_urls']] == [url['id'] for url in pages[1]['saved_urls']]
+    assert back['pagination']['has_prev'] and back['pagination']['has_next']
+    
+    assert client.get('/api/saved-urls?cursor=not-a-cursor').status_code == 400
+    
+    headers = {'Authorization': f'Bearer {api_key}'}
+    first = client.get('/api/summaries?limit=40', headers=headers).get_json()
+    cursor = first['pagination']['next_cursor']
+    second = client.get(f'/api/summaries?limit=40&cursor={cursor}', headers=headers).get_json()
+    texts = [summary['text'] for summary in first['summaries'] + second['summaries']]
+    assert len(texts) == len(set(texts)) == 45
+    assert not second['pagination']['has_next']
+    
+    rv = client.get(f'/history?cursor={first["pagination"]["next_cursor"]}')
+    assert rv.status_code == 200
+
+def test_api_keys_are_hashed_and_auth_is_cached(client):
+    """Test that API keys are stored hashed and resolved from the auth cache until revoked"""
+    from sqlalchemy import event
+    from services.api_key_auth import api_key_auth
+    
+    user = login(client)
+    rv = client.post('/generate-api-key')
+    api_key = rv.data.decode('utf-8').split('id="api-key-field"')[0].rsplit('value="', 1)[1].split('"')[0]
+    assert api_key.startswith('ng_')
+    assert rv.headers['Cache-Control'] == 'no-store'
+    # The key is shown once and never stored in the session cookie
+    with client.session_transaction() as session:
+        assert api_key not in repr(dict(session))
+    db.session.refresh(user)
+    assert user.nutgraf_api_key is None
+    assert user.api_key_hash and api_key not in user.api_key_hash
+    assert api_key not in client.get('/settings').data.decode('utf-8')
+    
+    headers = {'X-API-Key': api_key}
+    assert client.get('/api/summaries', headers=headers).status_code == 200
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        assert client.get('/api/summaries', headers=headers).status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert not [s for s in statements if 'FROM users' in s]
+    
+    client.post('/revoke-api-key')
+    assert client.get('/api/summaries', headers=headers).status_code == 401
+    assert api_key_auth.get_stats()['invalidations'] >= 1
+
+def test_generate_summary_streams_sse_and_saves(client, monkeypatch):
+    """Test that a streamed summary relays deltas as SSE and is saved when complete"""
+    import json
+    from models import Summary
+    from services.llm_service import LLMService
+    
+    user = login(client)
+    user.set_openai_key('sk-test')
+    db.session.commit()
+    
+    def fake_stream(self, prompt, model):
+        yield 'Streamed '
+        yield 'summary '
+        yield 'text.'
+    monkeypatch.setattr(LLMService, '_stream_openai_summary', fake_stream)
+    
+    rv = client.post('/api/generate-summary', json={
+        'content': 'Body of an article that is only ever streamed in this test.',
+        'url': 'https://example.com/streamed',
+        'title': 'Streamed',
+        'stream': True
+    })
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/event-stream'
+    
+    events = []
+    for block in rv.get_data(as_text=True).strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    
+    assert [data['text'] for event, data in events if event == 'delta'] == ['Streamed ', 'summary ', 'text.']
+    event, data = events[-1]
+    assert event == 'done'
+    assert data['summary']['text'] == 'Streamed summary text.'
+    assert data['summary']['word_count'] == 3
+    
+    summary = db.session.get(Summary, data['summary']['id'])
+    assert summary.summary_text == 'Streamed summary text.'
+    assert summary.url == 'https://example.com/streamed'
+
+def test_api_jobs_run_from_queue_with_retry_and_webhook(client, monkeypatch):
+    """Test that /v1/jobs queues work, retries a failed attempt and notifies the callback"""
+    import socket
+    from services import job_queue as job_queue_module
+    from services.job_queue import JobQueue
+    from services.llm_service import LLMService
+    
+    user = login(client)
+    api_key = user.generate_api_key()
+    db.session.commit()
+    headers = {'X-API-Key': api_key}
+    
+    # No worker threads: the test drives the queue itself
+    queue = JobQueue(max_workers=0, retry_backoff=0)
+    monkeypatch.setattr('routes.external_api.job_queue', queue)
+    
+    calls = []
+    def flaky_summary(self, content, **kwargs):
+        calls.append(content)
+        if len(calls) == 1:
+            raise Exception('Summary generation failed: provider timeout')
+        return {'text': 'Queued summary.', 'word_count': 2}
+    monkeypatch.setattr(LLMService, 'generate_summary', flaky_summary)
+    
+    delivered = []
+    class FakeResponse:
+        status_code = 204
+    def fake_request(method, url, **kwargs):
+        delivered.append((method, url, kwargs['json']))
+        return FakeResponse()
+    monkeypatch.setattr(job_queue_module.http_client, 'request', fake_request)
+    
+    # Callback hosts are resolved; only public addresses are accepted
+    real_getaddrinfo = socket.getaddrinfo
+    resolves_to = {'example.com': '93.184.216.34', 'internal.example': '10.0.0.8', 'rebind.example': '93.184.216.35'}
+    def fake_getaddrinfo(host, port, *args, **kwargs):
+        if host in resolves_to:
+            return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (resolves_to[host], port))]
+        return real_getaddrinfo(host, port, *args, **kwargs)
+    monkeypatch.setattr(socket, 'getaddrinfo', fake_getaddrinfo)
+    for callback_url in ('http://127.0.0.1:8080/hook', 'http://169.254.169.254/latest/meta-data',
+                         'http://[::ffff:10.0.0.1]/hook', 'https://internal.example/hook', 'ftp://example.com/hook'):
+        rv = client.post('/api/jobs', headers=headers, json={'text': 'Text', 'model': 'claude-3-haiku',
+                                                             'anthropic_api_key': 'sk-ant-test',
+                                                             'callback_url': callback_url})
+        assert rv.status_code == 400, callback_url
+    
+    rv = client.post('/api/jobs', headers=headers, json={
+        'text': 'Article text for a queued job.',
+        'model': 'claude-3-haiku-20240307',
+        'anthropic_api_key': 'sk-ant-test',
+        'save_summary': True,
+        'callback_url': 'https://example.com/hook'
+    })
+    assert rv.status_code == 202
+    job_id = rv.get_json()['job']['id']
+    assert rv.headers['Location'].endswith(job_id)
+    assert rv.get_json()['job']['status'] == 'queued'
+    
+    # First attempt fails and is requeued; the second succeeds
+    assert queue.work_once()
+    job = client.get(f'/api/jobs/{job_id}', headers=headers).get_json()['job']
+    assert job['status'] == 'queued' and job['attempts'] == 1
+    assert queue.work_once()
+    
+    job = client.get(f'/api/jobs/{job_id}', headers=headers).get_json()['job']
+    assert job['status'] == 'completed' and job['attempts'] == 2
+    assert job['result']['summary']['text'] == 'Queued summary.'
+    assert job['result']['summary']['id'] is not None
+    assert job['result']['usage']['calls_made'] == 1
+    
+    # Webhook goes out once, then the queue is idle
+    assert queue.work_once()
+    assert not queue.work_once()
+    assert len(delivered) == 1
+    method, url, payload = delivered[0]
+    assert (method, url) == ('POST', 'https://example.com/hook')
+    assert payload['job']['id'] == job_id and payload['job']['status'] == 'completed'
+    assert client.get(f'/api/jobs/{job_id}', headers=headers).get_json()['job']['callback']['status'] == 'delivered'
+    
+    # The call is reserved at submission, so queued jobs can't go over the limit
+    user.api_calls_limit = 2
+    db.session.commit()
+    def failing_summary(self, content, **kwargs):
+        raise Exception('Summary generation failed: provider down')
+    monkeypatch.setattr(LLMService, 'generate_summary', failing_summary)
+    rv = client.post('/api/jobs', headers=headers, json={'text': 'Doomed job.', 'model': 'claude-3-haiku',
+                                                         'anthropic_api_key': 'sk-ant-test'})
+    assert rv.status_code == 202
+    failing_id = rv.get_json()['job']['id']
+    rv = client.post('/api/jobs', headers=headers, json={'text': 'One too many.', 'model': 'claude-3-haiku',
+                                                         'anthropic_api_key': 'sk-ant-test'})
+    assert rv.status_code == 429
+    
+    # A job that ends up failing hands its call back
+    while queue.work_once():
+        pass
+    assert client.get(f'/api/jobs/{failing_id}', headers=headers).get_json()['job']['status'] == 'failed'
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 1
+    
+    # A host that resolves to a private address by delivery time is not called
+    rv = client.post('/api/jobs', headers=headers, json={'text': 'Rebound job.', 'model': 'claude-3-haiku',
+                                                         'anthropic_api_key': 'sk-ant-test',
+                                                         'callback_url': 'https://rebind.example/hook'})
+    assert rv.status_code == 202
+    rebound_id = rv.get_json()['job']['id']
+    resolves_to['rebind.example'] = '127.0.0.1'
+    while queue.work_once():
+        pass
+    assert len(delivered) == 1
+    assert client.get(f'/api/jobs/{rebound_id}', headers=headers).get_json()['job']['callback']['status'] == 'failed'
+    
+    # Jobs are private to their owner
+    other = User(email='other@example.com')
+    other.set_password('testpassword123')
+    other_key = other.generate_api_key()
+    db.session.add(other)
+    db.session.commit()
+    assert client.get(f'/api/jobs/{job_id}', headers={'X-API-Key': other_key}).status_code == 404
+
+def test_api_jobs_retry_fetch_errors_and_drop_stale_results(client, monkeypatch):
+    """Test that only transient fetch errors are retried and a worker that lost its lease can't settle the job"""
+    from services.article_extractor import ArticleExtractor
+    from services.job_queue import JobQueue
+    from models import ApiJob
+    
+    user = login(client)
+    api_key = user.generate_api_key()
+    db.session.commit()
+    headers = {'X-API-Key': api_key}
+    
+    queue = JobQueue(max_workers=0, retry_backoff=0)
+    monkeypatch.setattr('routes.external_api.job_queue', queue)
+    
+    pages = {
+        'https://example.com/flaky': {'error': 'Failed to fetch article: Read timed out.', 'is_paywalled': False},
+        'https://example.com/gone': {'error': 'Failed to fetch article: 404 Client Error: Not Found', 'is_paywalled': False},
+        'https://example.com/paywall': {'content': None, 'is_paywalled': True,
+                                        'error': 'Article appears to be behind a paywall'}
+    }
+    monkeypatch.setattr(ArticleExtractor, 'extract', lambda self, url: dict(pages[url], url=url))
+    
+    job_ids = {}
+    for url in pages:
+        rv = client.post('/api/jobs', headers=headers, json={'url': url, 'model': 'claude-3-haiku',
+                                                             'anthropic_api_key': 'sk-ant-test'})
+        assert rv.status_code == 202
+        job_ids[url] = rv.get_json()['job']['id']
+    while queue.work_once():
+        pass
+    
+    jobs = {url: client.get(f'/api/jobs/{job_id}', headers=headers).get_json()['job'] for url, job_id in job_ids.items()}
+    assert jobs['https://example.com/flaky']['status'] == 'failed'
+    assert jobs['https://example.com/flaky']['attempts'] == 3
+    assert jobs['https://example.com/gone']['attempts'] == 1
+    assert jobs['https://example.com/paywall']['attempts'] == 1
+    assert jobs['https://example.com/paywall']['error'] == 'Article appears to be behind a paywall'
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 0
+    
+    # A worker whose claim was superseded leaves the new owner's job alone
+    job = ApiJob.query.filter_by(public_id=job_ids['https://example.com/gone']).first()
+    job.status, job.attempts = 'running', 5
+    db.session.commit()
+    queue._finish(job, 4, result={'stale': True})
+    db.session.expire_all()
+    assert job.status == 'running' and job.result is None
+
+def test_summarize_batch_charges_quota_once_and_refunds_failures(client, monkeypatch):
+    """Test that a batch shares one quota reservation and reports failures per item"""
+    from services.article_extractor import ArticleExtractor
+    from services.llm_service import LLMService
+    from models import Summary
+    
+    user = login(client)
+    api_key = user.generate_api_key()
+    user.api_calls_limit = 10
+    db.session.commit()
+    headers = {'X-API-Key': api_key}
+    
+    extracted = []
+    def fake_extract_many(self, urls):
+        extracted.append(list(urls))
+        return [{'url': url, 'title': 'Extracted', 'content': f'Content of {url}'} if 'good' in url
+                else {'url': url, 'error': 'Failed to fetch article: 404'} for url in urls]
+    monkeypatch.setattr(ArticleExtractor, 'extract_many', fake_extract_many)
+    
+    def fake_summary(self, content, **kwargs):
+        if 'broken' in content:
+            raise Exception('Summary generation failed: provider error')
+        return {'text': f'Summary of {content}', 'word_count': 4}
+    monkeypatch.setattr(LLMService, 'generate_summary', fake_summary)
+    
+    rv = client.post('/api/summarize/batch', headers=headers, json={
+        'items': [
+            {'url': 'https://example.com/good'},
+            {'url': 'https://example.com/missing'},
+            {'text': 'Plain text', 'title': 'Text item'},
+            {'text': 'broken text'},
+            {}
+        ],
+        'model': 'claude-3-haiku',
+        'anthropic_api_key': 'sk-ant-test',
+        'save_summary': True
+    })
+    assert rv.status_code == 200
+    data = rv.get_json()
+    
+    # URLs are extracted together in one call
+    assert extracted == [['https://example.com/good', 'https://example.com/missing']]
+    assert [result['status'] for result in data['results']] == ['completed', 'failed', 'completed', 'failed', 'failed']
+    assert data['results'][0]['metadata']['title'] == 'Extracted'
+    assert data['results'][1]['error'] == 'Extraction failed'
+    assert data['results'][2]['summary']['text'] == 'Summary of Plain text'
+    
+    # Four items were reserved, the two that failed after the charge were refunded
+    assert data['usage'] == {'calls_made': 2, 'calls_remaining': 8}
+    assert Summary.query.filter_by(user_id=user.id).count() == 2
+    
+    # A batch that doesn't fit in the remaining quota is refused outright
+    rv = client.post('/api/summarize/batch', headers=headers, json={
+        'items': [{'text': f'Item {i}'} for i in range(9)],
+        'model': 'claude-3-haiku',
+        'anthropic_api_key': 'sk-ant-test'
+    })
+    assert rv.status_code == 429
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 2
+    
+    # An unexpected error after the charge still hands the whole reservation back
+    def broken_extract_many(self, urls):
+        raise RuntimeError('extraction pool crashed')
+    monkeypatch.setattr(ArticleExtractor, 'extract_many', broken_extract_many)
+    rv = client.post('/api/summarize/batch', headers=headers, json={
+        'items': [{'url': 'https://example.com/good'}, {'text': 'Plain text'}],
+        'model': 'claude-3-haiku',
+        'anthropic_api_key': 'sk-ant-test'
+    })
+    assert rv.status_code == 500
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 2
+
+def test_summarize_reserves_quota_and_refunds_failures(client, monkeypatch):
+    """Test that /summarize reserves its call against the limit and gives it back when generation fails"""
+    from services.llm_service import LLMService
+    
+    user = login(client)
+    api_key = user.generate_api_key()
+    user.api_calls_limit = 2
+    db.session.commit()
+    headers = {'X-API-Key': api_key}
+    
+    def fake_summary(self, content, **kwargs):
+        if 'broken' in content:
+            raise Exception('Summary generation failed: provider error')
+        return {'text': 'A summary', 'word_count': 2, 'model': 'gpt-4o'}
+    def fake_stream(self, content, **kwargs):
+        yield 'Partial '
+        raise Exception('Summary generation failed: stream dropped')
+    monkeypatch.setattr(LLMService, 'generate_summary', fake_summary)
+    monkeypatch.setattr(LLMService, 'stream_summary', fake_stream)
+    body = {'model': 'gpt-4o', 'openai_api_key': 'sk-test'}
+    
+    rv = client.post('/api/summarize', headers=headers, json=dict(body, text='Article body'))
+    assert rv.status_code == 200
+    assert rv.get_json()['usage'] == {'calls_made': 1, 'calls_remaining': 1}
+    
+    rv = client.post('/api/summarize', headers=headers, json=dict(body, text='broken article'))
+    assert rv.status_code == 500
+    rv = client.post('/api/summarize', headers=headers, json=dict(body, text='Article body', stream=True))
+    assert 'event: error' in rv.get_data(as_text=True)
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 1
+    
+    # A client that hangs up mid-stream gets its call back too
+    def endless_stream(self, content, **kwargs):
+        while True:
+            yield 'more '
+    monkeypatch.setattr(LLMService, 'stream_summary', endless_stream)
+    rv = client.post('/api/summarize', headers=headers, json=dict(body, text='Article body', stream=True),
+                     buffered=False)
+    assert next(iter(rv.response)).startswith(b'event: delta')
+    rv.close()
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 1
+    
+    assert client.post('/api/summarize', headers=headers, json=dict(body, text='Article body')).status_code == 200
+    assert client.post('/api/summarize', headers=headers, json=dict(body, text='Article body')).status_code == 429
+    assert client.get('/api/usage', headers=headers).get_json()['usage']['calls_made'] == 2
+
+def test_fetch_stats_hides_hosts_unless_enabled(client, monkeypatch):
+    """Test that fetch stats only report pool totals unless per-host pools are turned on"""
+    import json
+    from services.http_client import http_client
+    
+    login(client)
+    http_client.session.get_adapter('http://private.example/').poolmanager.connection_from_url('http://private.example/')
+    
+    stats = client.get('/api/fetch-stats').get_json()['http_client']
+    assert 'pools' not in stats and stats['pool_totals']['pools'] >= 1
+    assert 'private.example' not in json.dumps(stats)
+    
+    monkeypatch.setattr('routes.api.FETCH_STATS_PER_HOST', True)
+    stats = client.get('/api/fetch-stats').get_json()['http_client']
+    assert 'http://private.example:80' in [pool['host'] for pool in stats['pools']]
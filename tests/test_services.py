@@ -0,0 +1,842 @@
+import pytest
+import tempfile
+import os
+from app import app
+from models import db, User, CachedSummary
+from services.llm_service import LLMService
+from services.summary_cache import SummaryCache
+
+@pytest.fixture
+def app_context():
+    # Create a temporary database
+    db_fd, temp_db_path = tempfile.mkstemp()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + temp_db_path
+    app.config['TESTING'] = True
+    
+    with app.app_context():
+        db.create_all()
+        yield
+        db.session.remove()
+        db.drop_all()
+    
+    os.close(db_fd)
+    os.unlink(temp_db_path)
+
+def test_summary_cache_skips_provider_on_repeat(app_context, monkeypatch):
+    """Test that repeat summaries with identical settings are served from the cache"""
+    cache = SummaryCache(max_entries=10, ttl_seconds=3600, max_rows=10, enabled=True)
+    monkeypatch.setattr('services.llm_service.summary_cache', cache)
+    
+    calls = []
+    def fake_openai(self, prompt, model):
+        calls.append(model)
+        return 'Cached summary text'
+    monkeypatch.setattr(LLMService, '_generate_openai_summary', fake_openai)
+    
+    llm_service = LLMService(User(email='cache@example.com'))
+    llm_service.openai_client = object()
+    
+    first = llm_service.generate_summary('Article body', model='gpt-4o')
+    second = llm_service.generate_summary('Article body', model='gpt-4o')
+    assert calls == ['gpt-4o']
+    assert second['text'] == first['text']
+    assert second['cached'] is True
+    
+    # Different settings miss the cache
+    llm_service.generate_summary('Article body', tone='professional', model='gpt-4o')
+    assert len(calls) == 2
+    
+    # A cold memory layer falls back to the persistent table
+    cache.clear()
+    from_db = llm_service.generate_summary('Article body', model='gpt-4o')
+    assert len(calls) == 2
+    assert second['model'] == from_db['model'] == 'gpt-4o'
+    
+    stats = cache.get_stats()
+    assert stats['memory_hits'] == 1
+    assert stats['db_hits'] == 1
+    assert stats['misses'] == 2
+    assert CachedSummary.query.count() == 2
+
+def test_long_content_maps_chunks_concurrently(monkeypatch):
+    """Test that chunk summaries run in parallel and keep their order"""
+    import threading
+    import time
+    
+    active = {'now': 0, 'peak': 0}
+    lock = threading.Lock()
+    prompts = []
+    
+    def fake_openai(self, prompt, model):
+        with lock:
+            active['now'] += 1
+            active['peak'] = max(active['peak'], active['now'])
+        time.sleep(0.05)
+        with lock:
+            active['now'] -= 1
+        body = prompt.split('ARTICLE CONTENT:\n', 1)[1].split('\n\nSUMMARY:', 1)[0]
+        prompts.append(body)
+        return 'summary of ' + body.split()[0]
+    
+    monkeypatch.setattr(LLMService, '_generate_openai_summary', fake_openai)
+    monkeypatch.setattr('services.llm_service.summary_cache', SummaryCache(enabled=False))
+    monkeypatch.setattr(LLMService, 'context_budget_tokens', 50)
+    
+    llm_service = LLMService(User(email='long@example.com'))
+    llm_service.openai_client = object()
+    
+    paragraphs = [f'para{i} ' + 'word ' * 30 for i in range(6)]
+    result = llm_service.generate_summary_for_long_content('\n\n'.join(paragraphs), model='gpt-4o')
+    
+    assert active['peak'] > 1
+    # The final reduce sees every chunk summary in document order
+    assert result['text'].startswith('summary of summary')
+    final_prompt = prompts[-1]
+    positions = [final_prompt.index(f'summary of para{i}') for i in range(6)]
+    assert positions == sorted(positions)
+
+def test_extractor_keeps_paragraph_boundaries_for_chunking():
+    """Test that extracted text keeps blocks and chunk_content splits on them"""
+    import lxml.html
+    from services.article_extractor import ArticleExtractor, estimate_tokens
+    
+    extractor = ArticleExtractor()
+    paragraphs = ''.join(f'<p>Paragraph {i} says something. ' + 'More words here. ' * 20 + '</p>' for i in range(8))
+    root = lxml.html.fromstring(f'<div><h2>Section title</h2>{paragraphs}<script>ignored()</script></div>')
+    
+    blocks = extractor._extract_blocks(root)
+    content = extractor._blocks_to_text(blocks)
+    assert blocks[0]['type'] == 'heading' and blocks[0]['level'] == 2
+    assert all(content[b['start']:b['end']] == b['text'] for b in blocks)
+    assert 'ignored' not in content
+    assert content.count('\n\n') == 8
+    
+    chunks = extractor.chunk_content(content, max_tokens=200, blocks=blocks)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    assert chunks[0].startswith('Section title\n\nParagraph 0')
+    
+    # A single run-on paragraph falls back to sentence splitting
+    run_on = ' '.join(f'Sentence number {i} is here.' for i in range(200))
+    pieces = extractor.chunk_content(run_on, max_tokens=100)
+    assert len(pieces) > 1
+    assert all(estimate_tokens(piece) <= 100 for piece in pieces)
+    assert ' '.join(pieces) == run_on
+
+def test_extract_from_html_shares_one_parse():
+    """Test metadata, paywall detection and content extraction from a single page"""
+    from services.article_extractor import ArticleExtractor
+    
+    body = ''.join(f'<p>Paragraph {i} of the story. ' + 'Plenty of detail follows here. ' * 10 + '</p>' for i in range(5))
+    html = f"""<html><head><title>Fallback title</title>
+        <meta property="og:title" content="Story title">
+        <meta name="author" content="Jane Writer">
+        <meta property="article:published_time" content="2024-03-01">
+        </head><body><nav>Menu</nav><article><h1>Story title</h1>{body}</article>
+        <div class="paywall-message">Subscribe</div></body></html>"""
+    
+    result = ArticleExtractor().extract_from_html(html, 'https://example.com/story')
+    assert result['title'] == 'Story title'
+    assert result['author'] == 'Jane Writer'
+    assert result['publication_date'] == '2024-03-01T00:00:00'
+    assert result['is_paywalled'] is True
+    assert result['content'].startswith('Story title\n\nParagraph 0')
+    assert 'Menu' not in result['content']
+    assert result['word_count'] > 100
+
+def test_extraction_pool_matches_inline_extraction():
+    """Test that process-pool extraction returns the same result as inline extraction"""
+    from services.article_extractor import ArticleExtractor
+    from services.extraction_pool import ExtractionPool
+    
+    body = ''.join(f'<p>Paragraph {i} of the story. ' + 'Plenty of detail follows here. ' * 10 + '</p>' for i in range(5))
+    html = f'<html><head><title>Pool title</title></head><body><article>{body}</article></body></html>'
+    
+    pool = ExtractionPool(mode='process', max_workers=1, timeout=60)
+    try:
+        pool.warm()
+        result = pool.extract(html.encode('utf-8'), 'utf-8', 'https://example.com/pool')
+    finally:
+        pool.shutdown()
+    
+    assert result == ArticleExtractor().extract_from_html(html, 'https://example.com/pool')
+    assert result['title'] == 'Pool title'
+
+def test_fetch_cache_revalidates_and_evicts(tmp_path):
+    """Test fresh hits, 304 revalidation and LRU eviction in the fetch cache"""
+    import requests
+    from services.fetch_cache import FetchCache
+    
+    class FakeSession:
+        def __init__(self):
+            self.calls = []
+        
+        def get(self, url, timeout=None, headers=None, **kwargs):
+            self.calls.append(headers or {})
+            response = requests.Response()
+            response.url = url
+            if headers and headers.get('If-None-Match') == '"v1"':
+                response.status_code = 304
+                return response
+            response.status_code = 200
+            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+            response.headers['ETag'] = '"v1"'
+            response._content = f'<html><title>{url}</title>{"x" * 200}</html>'.encode('utf-8')
+            return response
+    
+    session = FakeSession()
+    cache = FetchCache(cache_dir=str(tmp_path), max_bytes=600, fresh_seconds=300, enabled=True)
+    
+    first = cache.fetch(session, 'HTTPS://Example.com/a?b=2&a=1#top')
+    assert first.status_code == 200
+    
+    # Fresh entry: served from disk without touching the network
+    second = cache.fetch(session, 'https://example.com/a?a=1&b=2')
+    assert second.from_cache and second.text == first.text
+    assert len(session.calls) == 1
+    
+    # Stale entry: revalidated with the stored ETag
+    cache.fresh_seconds = 0
+    third = cache.fetch(session, 'https://example.com/a?a=1&b=2')
+    assert session.calls[-1]['If-None-Match'] == '"v1"'
+    assert third.status_code == 200 and third.from_cache and third.text == first.text
+    
+    # Storing more than max_bytes evicts the least recently used pages
+    cache.fetch(session, 'https://example.com/b')
+    cache.fetch(session, 'https://example.com/c')
+    assert cache.lookup('https://example.com/a?a=1&b=2') is None
+    assert cache.lookup('https://example.com/c') is not None
+    assert cache.get_stats()['bytes'] <= 600
+
+def test_http_client_reuses_pooled_connections():
+    """Test that the shared client keeps one pool per host and reuses its connections"""
+    import threading
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from services.http_client import HTTPClient
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def do_GET(self):
+            body = b'<html><title>ok</title></html>'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = HTTPClient(max_concurrency=2, retries=0)
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/page'
+        for _ in range(5):
+            assert client.get(url, timeout=5).status_code == 200
+        
+        stats = client.get_stats()
+        assert stats['requests'] == 5
+        assert stats['in_flight'] == 0
+        assert len(stats['pools']) == 1
+        assert stats['pools'][0]['connections_opened'] == 1
+        assert stats['pools'][0]['requests'] == 5
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+def test_http_client_keeps_no_cookies_and_caps_retry_after():
+    """Test that the shared client drops Set-Cookie and doesn't honour a long Retry-After in full"""
+    import time
+    import threading
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from services.http_client import HTTPClient
+    
+    seen_cookies = []
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        hits = 0
+        
+        def do_GET(self):
+            Handler.hits += 1
+            seen_cookies.append(self.headers.get('Cookie'))
+            if Handler.hits == 1:
+                self.send_response(429)
+                self.send_header('Retry-After', '3600')
+            else:
+                self.send_response(200)
+                self.send_header('Set-Cookie', 'session=someone-else; Path=/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        
+        def log_message(self, *args):
+            pass
+    
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = HTTPClient(max_concurrency=1, retries=1, backoff_factor=0, retry_after_max=0.1)
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/page'
+        started = time.monotonic()
+        assert client.get(url, timeout=5).status_code == 200
+        assert time.monotonic() - started < 5
+        assert client.get(url, timeout=5).status_code == 200
+        assert len(client.session.cookies) == 0
+        assert seen_cookies == [None, None, None]
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+def test_process_url_only_trusts_fresh_fetch_cache_entries(tmp_path, monkeypatch):
+    """Test that a fresh cached page skips the network and a stale one is checked again"""
+    import requests
+    from services.fetch_cache import FetchCache
+    from services.url_processor import URLProcessor
+    
+    cache = FetchCache(cache_dir=str(tmp_path), fresh_seconds=300, enabled=True)
+    monkeypatch.setattr('services.url_processor.fetch_cache', cache)
+    cached = requests.Response()
+    cached.status_code = 200
+    cached.headers['Content-Type'] = 'text/html; charset=utf-8'
+    cached._content = b'<html><title>Cached page</title></html>'
+    cache.store('https://example.com/gone', cached)
+    
+    class GoneSession:
+        calls = 0
+        def head(self, url, **kwargs):
+            self.calls += 1
+            raise requests.ConnectionError('Name or service not known')
+    processor = URLProcessor()
+    processor.session = GoneSession()
+    
+    assert processor.process_url('https://example.com/gone')['title'] == 'Cached page'
+    assert processor.session.calls == 0
+    
+    cache.fresh_seconds = 0
+    result = processor.process_url('https://example.com/gone')
+    assert processor.session.calls == 1
+    assert result['status'] == 'warning'
+
+def test_async_fetcher_probes_titles_and_downloads_pages(tmp_path, monkeypatch):
+    """Test concurrent probing with early abort after </title> and ordered downloads"""
+    import time
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    import services.async_fetcher as async_fetcher_module
+    from services.async_fetcher import AsyncFetcher
+    from services.article_extractor import ArticleExtractor
+    from services.fetch_cache import FetchCache
+    from services.url_processor import URLProcessor
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(404 if self.path == '/missing' else 200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(f'<html><head><title>Page {self.path}</title></head>'.encode('utf-8'))
+            self.wfile.flush()
+            if self.path == '/slow':
+                time.sleep(3)  # A probe must not wait for the rest of this page
+            body = ''.join(f'<p>Sentence {i} about {self.path} with enough words to count.</p>' for i in range(40))
+            self.wfile.write(f'<body><article>{body}</article></body></html>'.encode('utf-8'))
+        
+        def log_message(self, *args):
+            pass
+    
+    class QuietServer(ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass
+    
+    server = QuietServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    monkeypatch.setattr('services.url_processor.async_fetcher', AsyncFetcher(max_in_flight=20, per_host=10, timeout=5))
+    try:
+        urls = [f'{base}/page-{i}' for i in range(30)] + [f'{base}/slow', f'{base}/missing', 'not a url']
+        
+        started = time.monotonic()
+        results = URLProcessor().batch_process_urls(urls)
+        assert time.monotonic() - started < 2.5
+        
+        assert [r['url'] for r in results] == urls[:-1]
+        assert results[0]['title'] == 'Page /page-0'
+        assert results[30]['title'] == 'Page /slow'
+        assert results[31]['accessible'] is True  # 404 pages are still handed to the extractor
+        
+        monkeypatch.setattr(async_fetcher_module, 'fetch_cache', FetchCache(cache_dir=str(tmp_path), enabled=True))
+        monkeypatch.setattr('services.article_extractor.async_fetcher', AsyncFetcher(timeout=5))
+        articles = ArticleExtractor().extract_many([f'{base}/a', 'http://127.0.0.1:1/refused', f'{base}/b'])
+        assert articles[0]['title'] == 'Page /a'
+        assert 'Sentence 39 about /a' in articles[0]['content']
+        assert articles[1]['error'].startswith('Failed to fetch article')
+        assert articles[2]['title'] == 'Page /b'
+        assert async_fetcher_module.fetch_cache.lookup(f'{base}/b') is not None
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_bookmark_parser_tracks_nested_folders_in_one_pass():
+    """Test folder paths, dedupe and chunked parsing of a Netscape bookmark export"""
+    from services.bookmark_parser import bookmark_parser
+    
+    content = """<!DOCTYPE NETSCAPE-Bookmark-file-1>
+<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">
+<TITLE>Bookmarks</TITLE>
+<H1>Bookmarks</H1>
+<DL><p>
+    <DT><H3 ADD_DATE="1600000000">Reading</H3>
+    <DL><p>
+        <DT><A HREF="https://example.com/a?x=1&amp;y=2" ADD_DATE="1600000100">Tom &amp; Jerry</A>
+        <DT><H3>Python</H3>
+        <DL><p>
+            <DT><A HREF="https://example.com/b"><span>Nested</span> title</A>
+            <DT><A HREF="https://example.com/a?x=1&amp;y=2">Duplicate</A>
+            <DT><A HREF="javascript:void(0)">Bookmarklet</A>
+        </DL><p>
+        <DT><A HREF='https://example.com/c'>Back in Reading</A>
+    </DL><p>
+    <DT><A HREF="https://example.com/d"></A>
+</DL><p>
+"""
+    result = bookmark_parser.parse_bookmark_file(content)
+    bookmarks = result['bookmarks']
+    
+    assert [b['url'] for b in bookmarks] == [
+        'https://example.com/a?x=1&y=2', 'https://example.com/b', 'https://example.com/c', 'https://example.com/d'
+    ]
+    assert bookmarks[0]['title'] == 'Tom & Jerry'
+    assert bookmarks[0]['add_date'].year == 2020
+    assert bookmarks[1]['title'] == 'Nested title'
+    assert bookmarks[1]['folder'] == 'Reading / Python'
+    assert bookmarks[2]['folder_path'] == ['Reading']
+    assert bookmarks[3]['folder'] is None
+    assert bookmarks[3]['title'] == 'Untitled'
+    assert result['folders'] == ['Reading', 'Python']
+    
+    # Tiny chunks split tags, entities and titles but must give the same result
+    chunks = (content[i:i + 7] for i in range(0, len(content), 7))
+    assert list(bookmark_parser.iter_bookmarks(chunks)) == bookmarks
+
+def test_upload_stream_decodes_incrementally():
+    """Test chunked decoding of uploads, including split characters and the latin-1 fallback"""
+    import io
+    from services.upload_stream import iter_text
+    from services.url_processor import URLProcessor
+    from services.bookmark_parser import bookmark_parser
+    
+    utf8 = '\ufeffurl,title\nhttps://example.com/café,"Café\nnotes"\nhttps://example.com/b,B\n'.encode('utf-8')
+    # Three-byte chunks split the two-byte characters in half
+    assert ''.join(iter_text(io.BytesIO(utf8), chunk_size=3)) == utf8.decode('utf-8-sig')
+    
+    latin1 = ('<!DOCTYPE NETSCAPE-Bookmark-file-1>\n<TITLE>Bookmarks</TITLE>\n<DL><p>\n'
+              + '<DT><A HREF="https://example.com/plain">Plain</A>\n' * 50
+              + '<DT><A HREF="https://example.com/x">Résumé</A>\n</DL><p>\n').encode('latin-1')
+    stream = io.BytesIO(latin1)
+    assert bookmark_parser.validate_bookmark_file(stream)['is_valid']
+    assert stream.tell() == 0
+    
+    titles = [bookmark['title'] for bookmark in bookmark_parser.iter_bookmarks(stream)]
+    assert titles == ['Plain', 'Résumé']
+    
+    urls = URLProcessor().process_file_upload(io.BytesIO(utf8), 'csv')
+    assert urls == ['https://example.com/café', 'https://example.com/b']
+
+def test_saved_url_importer_dedupes_and_writes_in_batches(app_context, monkeypatch):
+    """Test that bulk import skips existing and repeated URLs and writes every batch"""
+    from models import SavedUrl
+    from services.saved_url_importer import SavedUrlImporter
+    
+    user = User(email='import@example.com')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    
+    db.session.add(SavedUrl(user_id=user.id, url='https://example.com/existing'))
+    db.session.commit()
+    
+    importer = SavedUrlImporter(user.id, batch_size=3)
+    urls = [f'https://example.com/{i}' for i in range(7)]
+    for url in urls + ['https://example.com/existing', 'https://example.com/2']:
+        importer.add(url, title='Title', description='Imported')
+    assert importer.finish() == {'imported': 7, 'skipped': 2}
+    
+    saved = SavedUrl.query.filter_by(user_id=user.id).order_by(SavedUrl.id).all()
+    assert [row.url for row in saved] == ['https://example.com/existing'] + urls
+    assert all(len(row.url_hash) == 64 for row in saved)
+    
+    # A concurrent importer that missed those rows is stopped by the unique index
+    late = SavedUrlImporter(user.id)
+    late._seen.clear()
+    late.add('https://example.com/0')
+    late.add('https://example.com/new')
+    assert late.finish() == {'imported': 1, 'skipped': 1}
+    
+    # Without RETURNING the rows are counted before and after, with the IN lists chunked
+    monkeypatch.setattr('services.saved_url_importer.IN_CHUNK_SIZE', 2)
+    monkeypatch.setattr(db.engine.dialect, 'insert_executemany_returning', False)
+    late = SavedUrlImporter(user.id)
+    late._seen.clear()
+    for url in ['https://example.com/1', 'https://example.com/new', 'https://example.com/a',
+                'https://example.com/b', 'https://example.com/c']:
+        late.add(url)
+    assert late.finish() == {'imported': 3, 'skipped': 2}
+
+def test_usage_meter_counts_atomically_and_rolls_over(app_context):
+    """Test that concurrent charges are all counted, limits hold and a new month starts at zero"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app import app
+    from services.usage_meter import usage_meter
+    
+    user = User(email='meter@example.com', api_calls_limit=30)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    
+    def charge(_):
+        with app.app_context():
+            return usage_meter.charge(user.id)
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        counts = list(executor.map(charge, range(25)))
+    assert sorted(counts) == list(range(1, 26))
+    assert usage_meter.get_usage(user.id)['calls_made'] == 25
+    
+    # A limited charge that would overshoot is refused without counting
+    assert usage_meter.charge(user.id, calls=10, limit=30) is None
+    assert usage_meter.charge(user.id, calls=5, limit=30) == 30
+    
+    # Usage recorded in an earlier month reads as zero and restarts on the next charge
+    user.api_usage_period = '2000-01'
+    db.session.commit()
+    assert user.api_calls_this_period() == 0
+    assert usage_meter.charge(user.id) == 1
+
+def test_provider_clients_are_reused_until_keys_change(app_context, monkeypatch):
+    """Test that LLMService reuses cached provider clients and only decrypts a key once"""
+    import models
+    from services.provider_clients import ProviderClientRegistry
+    
+    registry = ProviderClientRegistry(ttl_seconds=60)
+    monkeypatch.setattr('services.llm_service.provider_clients', registry)
+    
+    user = User(email='clients@example.com')
+    user.set_password('password')
+    user.set_openai_key('sk-first')
+    db.session.add(user)
+    db.session.commit()
+    
+    decrypts = []
+    real_decrypt = models.decrypt_api_key
+    monkeypatch.setattr(models, 'decrypt_api_key', lambda value: decrypts.append(value) or real_decrypt(value))
+    
+    first = LLMService(user)
+    second = LLMService(user)
+    assert first.openai_client is second.openai_client
+    assert first.openai_client.api_key == 'sk-first'
+    assert first.anthropic_client is None
+    assert len(decrypts) == 1
+    
+    # A key sent with the request gets its own client on the same connection pool
+    provided = LLMService(user, provided_openai_key='sk-request')
+    assert provided.openai_client.api_key == 'sk-request'
+    assert provided.openai_client._client is first.openai_client._client
+    
+    # Changing the stored key yields a new client
+    user.set_openai_key('sk-second')
+    db.session.commit()
+    registry.invalidate_user(user.id)
+    assert LLMService(user).openai_client.api_key == 'sk-second'
+
+def test_rate_limiter_queues_calls_and_honors_retry_after(monkeypatch):
+    """Test that calls over the limits wait their turn and a 429 pauses the bucket"""
+    import httpx
+    import openai
+    from services import rate_limiter as rate_limiter_module
+    from services.rate_limiter import ProviderRateLimiter, RateLimitQueueFull
+    
+    class FakeTime:
+        now = 1000.0
+        sleeps = []
+        def monotonic(self):
+            return self.now
+        def time(self):
+            return self.now
+        def sleep(self, seconds):
+            self.sleeps.append(round(seconds, 3))
+            self.now += seconds
+    clock = FakeTime()
+    monkeypatch.setattr(rate_limiter_module, 'time', clock)
+    
+    limiter = ProviderRateLimiter(limits={'openai': {'rpm': 2, 'tpm': 6000, 'concurrency': 4}},
+                                  max_wait=100, max_retries=2)
+    
+    # Two requests fit the per-minute budget; the third waits for one request to refill
+    for _ in range(3):
+        limiter.call('openai', 'sk-a', 'gpt-4', 100, lambda: 'ok')
+    assert clock.sleeps == [30.0]
+    
+    # Other keys and models have their own buckets
+    clock.sleeps.clear()
+    limiter.call('openai', 'sk-b', 'gpt-4', 100, lambda: 'ok')
+    limiter.call('openai', 'sk-a', 'gpt-4o', 100, lambda: 'ok')
+    assert clock.sleeps == []
+    
+    # Reported usage replaces the estimate, so the token budget is spent on what was used
+    clock.now += 60
+    limiter.call('openai', 'sk-c', 'gpt-4', 5000, lambda: 'ok', usage=lambda response: 1000)
+    limiter.call('openai', 'sk-c', 'gpt-4', 5000, lambda: 'ok')
+    assert clock.sleeps == []
+    
+    # A 429 is retried after the provider's Retry-After instead of failing
+    clock.now += 60
+    attempts = []
+    def throttled():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            response = httpx.Response(429, headers={'retry-after': '7'},
+                                      request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+            raise openai.RateLimitError('Rate limit reached', response=response, body=None)
+        return 'ok'
+    assert limiter.call('openai', 'sk-d', 'gpt-4', 100, throttled) == 'ok'
+    assert attempts[1] - attempts[0] == 7
+    assert limiter.get_stats()['rate_limited'] == 1
+    
+    # The rejected attempt's reservation was given back, so it doesn't delay the next call
+    clock.sleeps.clear()
+    limiter.call('openai', 'sk-d', 'gpt-4', 100, lambda: 'ok')
+    assert clock.sleeps == []
+    
+    # SDK retries are off so 429s aren't retried behind the limiter's back
+    from services.provider_clients import ProviderClientRegistry
+    assert ProviderClientRegistry()._build_client('openai', 'sk-test').max_retries == 0
+    
+    # Waits longer than max_wait are refused rather than queued forever
+    limiter.max_wait = 50
+    limiter.call('openai', 'sk-e', 'gpt-4', 6000, lambda: 'ok')
+    with pytest.raises(RateLimitQueueFull):
+        limiter.call('openai', 'sk-e', 'gpt-4', 6000, lambda: 'ok')
+
+def test_rate_limiter_holds_slot_for_streams_and_refunds_rejected_calls():
+    """Test that a stream counts as in flight until it ends and a call refused a slot keeps no reservation"""
+    from services.rate_limiter import ProviderRateLimiter, RateLimitQueueFull
+    
+    limiter = ProviderRateLimiter(limits={'openai': {'rpm': 10, 'tpm': 6000, 'concurrency': 1}}, max_wait=0)
+    stream = limiter.call('openai', 'sk-a', 'gpt-4', 100, lambda: iter(['a', 'b']), stream=True)
+    entry = limiter._entry('openai', 'sk-a', 'gpt-4')
+    requests_left, tokens_left = entry.requests.level, entry.tokens.level
+    
+    # The open stream still holds the only slot
+    with pytest.raises(RateLimitQueueFull):
+        limiter.call('openai', 'sk-a', 'gpt-4', 100, lambda: 'ok')
+    assert entry.requests.level == pytest.approx(requests_left, abs=0.1)
+    assert entry.tokens.level == pytest.approx(tokens_left, abs=10)
+    
+    assert list(stream) == ['a', 'b']
+    assert limiter.call('openai', 'sk-a', 'gpt-4', 100, lambda: 'ok') == 'ok'
+    
+    # Closing a stream early frees the slot too
+    stream = limiter.call('openai', 'sk-a', 'gpt-4', 100, lambda: iter(['a', 'b']), stream=True)
+    assert next(stream) == 'a'
+    stream.close()
+    assert limiter.call('openai', 'sk-a', 'gpt-4', 100, lambda: 'ok') == 'ok'
+
+def test_provider_router_fails_over_breaks_circuit_and_hedges(app_context, monkeypatch):
+    """Test that tiers fail over, a failing provider is short-circuited and slow requests are hedged"""
+    import threading
+    from services.provider_router import ProviderRouter, ProviderUnavailable
+    
+    router = ProviderRouter(hedge=False, failure_threshold=2, reset_seconds=60)
+    monkeypatch.setattr('services.llm_service.provider_router', router)
+    monkeypatch.setattr('services.llm_service.summary_cache', SummaryCache(enabled=False))
+    
+    calls = []
+    def openai_down(self, prompt, model):
+        calls.append(model)
+        raise ProviderUnavailable('OpenAI API unavailable: 503')
+    def anthropic_up(self, prompt, model):
+        calls.append(model)
+        return 'Summary from Claude'
+    monkeypatch.setattr(LLMService, '_generate_openai_summary', openai_down)
+    monkeypatch.setattr(LLMService, '_generate_anthropic_summary', anthropic_up)
+    
+    llm_service = LLMService(User(email='router@example.com'))
+    llm_service.openai_client = object()
+    llm_service.anthropic_client = object()
+    
+    # The tier fails over from OpenAI to Anthropic
+    result = llm_service.generate_summary('Article body', model='auto-fast')
+    assert result['text'] == 'Summary from Claude' and result['model'] == 'claude-3-haiku'
+    assert calls == ['gpt-3.5-turbo', 'claude-3-haiku']
+    
+    # A second failure opens OpenAI's circuit, after which it isn't called at all
+    llm_service.generate_summary('Another article', model='auto-fast')
+    calls.clear()
+    llm_service.generate_summary('Third article', model='auto-fast')
+    assert calls == ['claude-3-haiku']
+    with pytest.raises(Exception, match='circuit open'):
+        llm_service.generate_summary('Fourth article', model='gpt-4o')
+    assert router.get_stats()['circuits'] == {'openai': 'open', 'anthropic': 'closed'}
+    
+    # A stream fails over while it is being opened, and reports the model it came from
+    streaming = ProviderRouter(hedge=False, failure_threshold=5, reset_seconds=60)
+    monkeypatch.setattr('services.llm_service.provider_router', streaming)
+    def openai_stream_down(self, prompt, model):
+        raise ProviderUnavailable('OpenAI API unavailable: 502')
+        yield
+    def anthropic_stream(self, prompt, model):
+        yield 'Streamed '
+        yield 'summary'
+    monkeypatch.setattr(LLMService, '_stream_openai_summary', openai_stream_down)
+    monkeypatch.setattr(LLMService, '_stream_anthropic_summary', anthropic_stream)
+    assert ''.join(llm_service.stream_summary('Streamed article', model='auto-fast')) == 'Streamed summary'
+    assert llm_service.stream_model == 'claude-3-haiku'
+    assert streaming.breaker('gpt-3.5-turbo').failures == 1
+    assert streaming.get_stats()['failovers'] == 1
+    
+    # Only keyed providers are routed to
+    llm_service.openai_client = None
+    assert llm_service._route('auto-balanced') == ['claude-3-sonnet']
+    
+    # A request slower than the hedge delay races a second one; the faster one wins
+    hedging = ProviderRouter(tiers={'auto': ['gpt-4o', 'claude-3-sonnet']}, hedge=True, hedge_delay=0.05)
+    release = threading.Event()
+    def slow_primary(model):
+        if model == 'gpt-4o':
+            release.wait(5)
+            return 'slow'
+        return 'fast'
+    try:
+        assert hedging.generate(hedging.route('auto'), slow_primary) == ('fast', 'claude-3-sonnet')
+    finally:
+        release.set()
+    stats = hedging.get_stats()
+    assert stats['hedges'] == 1 and stats['hedge_wins'] == 1
+
+def test_backfill_url_hashes_merges_duplicates_before_indexing(app_context):
+    """Test that saved URLs from before url_hash are hashed, deduped and then uniquely indexed"""
+    from models import SavedUrl, hash_url, backfill_url_hashes
+    
+    user = User(email='legacy@example.com')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    
+    # The table as it was with url_hash added by hand: nullable and not yet indexed
+    db.session.execute(db.text('DROP TABLE saved_urls'))
+    db.session.execute(db.text(
+        'CREATE TABLE saved_urls (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, url TEXT NOT NULL, '
+        'url_hash VARCHAR(64), title TEXT, description TEXT, is_analyzed BOOLEAN, latest_summary_id INTEGER, '
+        'created_at DATETIME, updated_at DATETIME)'
+    ))
+    for url, title, is_analyzed in [('https://example.com/a', None, 0), ('https://example.com/b', 'B', 0),
+                                    ('https://example.com/a', 'A', 1), ('https://example.com/a', 'Later', 0)]:
+        db.session.execute(db.text(
+            'INSERT INTO saved_urls (user_id, url, title, is_analyzed) VALUES (:user_id, :url, :title, :is_analyzed)'
+        ), {'user_id': user.id, 'url': url, 'title': title, 'is_analyzed': is_analyzed})
+    db.session.commit()
+    
+    backfill_url_hashes()
+    backfill_url_hashes()
+    
+    saved = SavedUrl.query.order_by(SavedUrl.id).all()
+    assert [(row.id, row.url, row.title, row.is_analyzed) for row in saved] == [
+        (1, 'https://example.com/a', 'A', True), (2, 'https://example.com/b', 'B', False)
+    ]
+    assert [row.url_hash for row in saved] == [hash_url(row.url) for row in saved]
+    
+    indexes = {index['name']: index for index in db.inspect(db.engine).get_indexes('saved_urls')}
+    assert indexes['ix_saved_urls_user_url_hash']['unique']
+    
+    db.session.add(SavedUrl(user_id=user.id, url='https://example.com/b'))
+    with pytest.raises(Exception):
+        db.session.commit()
+    db.session.rollback()
+
+def test_upgrade_schema_adds_missing_columns_and_indexes(app_context):
+    """Test that tables created before newer columns get them, and their indexes, added in place"""
+    from models import SavedUrl, upgrade_schema, backfill_url_hashes, backfill_api_key_hashes, hash_api_key
+    
+    # users and saved_urls as they were before API key hashing, usage periods, url_hash and latest_summary_id
+    db.session.execute(db.text('DROP TABLE saved_urls'))
+    db.session.execute(db.text('DROP TABLE users'))
+    db.session.execute(db.text(
+        'CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL UNIQUE, '
+        'password_hash VARCHAR(255) NOT NULL, created_at DATETIME, is_active BOOLEAN, openai_api_key TEXT, '
+        'anthropic_api_key TEXT, nutgraf_api_key VARCHAR(64) UNIQUE, api_calls_made INTEGER, '
+        'api_calls_limit INTEGER, default_length VARCHAR(20), default_tone VARCHAR(20), '
+        'default_format VARCHAR(20), default_model VARCHAR(50))'
+    ))
+    db.session.execute(db.text(
+        'CREATE TABLE saved_urls (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, url TEXT NOT NULL, '
+        'title TEXT, description TEXT, is_analyzed BOOLEAN, created_at DATETIME, updated_at DATETIME)'
+    ))
+    db.session.execute(db.text(
+        "INSERT INTO users (email, password_hash, nutgraf_api_key) VALUES ('old@example.com', 'x', 'ng_legacykey123')"
+    ))
+    db.session.execute(db.text(
+        "INSERT INTO saved_urls (user_id, url) VALUES (1, 'https://example.com/a'), (1, 'https://example.com/a')"
+    ))
+    db.session.commit()
+    
+    for _ in range(2):
+        upgrade_schema()
+        backfill_url_hashes()
+        backfill_api_key_hashes()
+    
+    inspector = db.inspect(db.engine)
+    user_columns = {column['name'] for column in inspector.get_columns('users')}
+    assert {'api_key_prefix', 'api_key_hash', 'api_usage_period'} <= user_columns
+    saved_columns = {column['name'] for column in inspector.get_columns('saved_urls')}
+    assert {'url_hash', 'latest_summary_id'} <= saved_columns
+    
+    user_indexes = {index['name']: index['unique'] for index in inspector.get_indexes('users')}
+    assert user_indexes['uq_users_api_key_hash'] and 'ix_users_api_key_prefix' in user_indexes
+    saved_indexes = {index['name']: index['unique'] for index in inspector.get_indexes('saved_urls')}
+    assert saved_indexes['ix_saved_urls_user_url_hash'] and 'ix_saved_urls_user_created_id' in saved_indexes
+    
+    user = User.query.one()
+    assert user.api_key_hash == hash_api_key('ng_legacykey123') and user.nutgraf_api_key is None
+    assert SavedUrl.query.count() == 1
+
+def test_encryption_key_is_never_derived_from_the_default_secret(monkeypatch):
+    """Test that only a debug or test app may derive the encryption key from the default SECRET_KEY"""
+    from models import get_encryption_key
+    
+    monkeypatch.delenv('ENCRYPTION_KEY', raising=False)
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    with pytest.raises(RuntimeError, match='ENCRYPTION_KEY is not set'):
+        get_encryption_key()
+    
+    app.config['TESTING'] = True
+    with app.app_context():
+        development_key = get_encryption_key()
+    
+    # A real SECRET_KEY is fine anywhere
+    monkeypatch.setenv('SECRET_KEY', 'a-real-secret')
+    assert get_encryption_key() not in (None, development_key)
+    
+    monkeypatch.setenv('ENCRYPTION_KEY', 'explicit-key')
+    assert get_encryption_key() == b'explicit-key'
+
+def test_api_key_hash_is_never_keyed_with_the_default_secret(monkeypatch):
+    """Test that only a debug or test app may hash API keys with the default SECRET_KEY"""
+    from models import hash_api_key
+    
+    monkeypatch.delenv('API_KEY_HASH_SECRET', raising=False)
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    with pytest.raises(RuntimeError, match='API_KEY_HASH_SECRET is not set'):
+        hash_api_key('ng_key')
+    
+    app.config['TESTING'] = True
+    with app.app_context():
+        development_digest = hash_api_key('ng_key')
+    
+    monkeypatch.setenv('SECRET_KEY', 'a-real-secret')
+    assert hash_api_key('ng_key') != development_digest
+    
+    monkeypatch.setenv('API_KEY_HASH_SECRET', 'dedicated-secret')
+    assert hash_api_key('ng_key') not in (development_digest, None)